@@ -1,29 +1,81 @@
 """Package for manipulating Equation of State (EoS) and Opacity data.
 """
+import sys
 
 __version__ = '1.0.0'
 
-# eos_ prefix
-from .eos_plotter   import *
+# Constants.
+from .constants     import *
 
-# opg_ prefix
-from .opg_hdf5      import *
-from .opg_ionmix    import *
-from .opg_multi     import *
-# The Propaceos module is not distributed. More details can be found in
-# opg_propaceos-note.py.
-#from .opg_propaceos import *
-from .opg_qeos      import *
-from .opg_sesame    import *
-from .opg_tabop     import *
-from .opg_tops      import *
+# The other submodules pull in matplotlib, PyTables, periodictable, ...
+# so they are only imported when one of their names is first accessed.
+_lazy_attrs = {
+    # eos_ prefix
+    'plot_2D_map': 'eos_plotter',
+    'plot_Zbar': 'eos_plotter',
+    'plot_diff_mg_opac': 'eos_plotter',
+    'plot_eos_field': 'eos_plotter',
+    'plot_eos_grid': 'eos_plotter',
+    'plot_zbar': 'eos_plotter',
+    # opg_ prefix
+    'OpgHdf5': 'opg_hdf5',
+    'OpacIonmix': 'opg_ionmix',
+    'IonmixWriter': 'opg_ionmix',
+    'writeIonmixFile': 'opg_ionmix',
+    'OpgMulti': 'opg_multi',
+    'get_related_multi_tables': 'opg_multi',
+    'FMT': 'opg_multi',
+    'PFMT': 'opg_multi',
+    'MULTI_EXT_FMT': 'opg_multi',
+    'SMALL_FLOAT_LOG': 'opg_multi',
+    # The Propaceos module is not distributed. More details can be found in
+    # opg_propaceos-note.py.
+    'OpgQeos': 'opg_qeos',
+    'OpgSesame': 'opg_sesame',
+    'OpacTabop': 'opg_tabop',
+    'OpgTOPS': 'opg_tops',
+    'tops_html2text': 'opg_tops',
+    'OplGrid': 'opl_grid',
+    # plotting
+    'OpacPlotter': 'opac_plotter',
+    'histdata': 'histogram',
+}
 
-# plotting
-from .opac_plotter  import *
-from .histogram     import *
+_submodules = ['benchmarks', 'constants', 'convert_opl', 'eos_plotter',
+               'histogram', 'opac_plotter', 'opg_hdf5', 'opg_ionmix',
+               'opg_multi', 'opg_qeos', 'opg_sesame', 'opg_tabop', 'opg_tops',
+               'opl_grid', 'opl_list', 'opl_tempgrid', 'profiling', 'regrid',
+               'scripts', 'tests', 'utils']
 
-# Constants.
-from .constants     import *
+__all__ = sorted([name for name in dir(constants)
+                  if not name.startswith('_') and name not in ['np', 'math']]
+                 + list(_lazy_attrs) + ['utils'])
+
+if sys.version_info >= (3, 7):
+    def __getattr__(name):
+        import importlib
+        if name in _lazy_attrs:
+            module = importlib.import_module('.' + _lazy_attrs[name], __name__)
+            value = getattr(module, name)
+            globals()[name] = value
+            return value
+        if name in _submodules:
+            return importlib.import_module('.' + name, __name__)
+        raise AttributeError("module {0!r} has no attribute "
+                             "{1!r}".format(__name__, name))
 
-# Utilities.
-from . import utils
+    def __dir__():
+        return sorted(set(globals()) | set(_lazy_attrs) | set(_submodules))
+else:
+    # No module __getattr__ (PEP 562), import everything.
+    from .eos_plotter   import *
+    from .opg_hdf5      import *
+    from .opg_ionmix    import *
+    from .opg_multi     import *
+    from .opg_qeos      import *
+    from .opg_sesame    import *
+    from .opg_tabop     import *
+    from .opg_tops      import *
+    from .opac_plotter  import *
+    from .histogram     import *
+    from . import utils
@@ -0,0 +1,12 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Synthetic tables and benchmarks of the readers, writers, interpolators
+and converters.
+
+Run with::
+
+    python -m opacplot2.benchmarks --help
+"""
+from .synthetic import *
+from .suite import SIZES, run_benchmarks, compare_baseline, format_results
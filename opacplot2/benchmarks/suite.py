@@ -0,0 +1,457 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Benchmarks of the readers, writers, interpolators and converters on
+synthetic tables.
+
+Run with::
+
+    python -m opacplot2.benchmarks --size medium --json bench.json
+    python -m opacplot2.benchmarks --size medium --baseline bench.json
+
+Each case is timed on ``repeat`` runs (the best time is kept), each run
+calling it enough times to last at least ``MIN_RUN_TIME`` as ``timeit``
+does, and run once more under ``tracemalloc`` for its peak memory. The
+throughput is given in table values per second and in MB per second of the
+files read or written (of the arrays for the interpolations).
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import fnmatch
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import opacplot2 as opp
+from .synthetic import SYNTHETIC_FORMATS, write_synthetic
+
+__all__ = ['SIZES', 'MIN_RUN_TIME', 'TIME_FLOOR', 'PEAK_FLOOR_MB',
+           'benchmark_cases', 'run_benchmarks', 'compare_baseline',
+           'format_results', 'main']
+
+# (ndens, ntemp, ngroups) of the --size presets.
+SIZES = {'small': (20, 20, 10),
+         'medium': (100, 100, 50),
+         'large': (300, 200, 100)}
+
+# Minimum duration (s) of a timed run, short cases being called several
+# times per run.
+MIN_RUN_TIME = 0.2
+
+# Differences to the baseline below which a case does not regress, whatever
+# the ratio: the timings of the fastest cases are dominated by noise.
+TIME_FLOOR = 1e-3
+PEAK_FLOOR_MB = 1.0
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+
+class _Quiet(object):
+    # Some readers print their progress.
+    def __enter__(self):
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+
+    def __exit__(self, *exc):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+
+
+def _nvalues(fmt, ndens, ntemp, ngroups):
+    """Number of table values of a synthetic file."""
+    ndt = ndens*ntemp
+    return {'ionmix': ndt*(5 + 3*ngroups),
+            'hdf5': ndt*(5 + 3*ngroups),
+            'multi': ndt*(1 + 3*ngroups),
+            'sesame': ndt*10,
+            'tops': ndt*(4 + 2*ngroups),
+            'qeos': ndt*3}[fmt]
+
+
+def _file_size(path):
+    if os.path.exists(path):
+        return os.path.getsize(path)
+    # MULTI tables.
+    return sum(os.path.getsize(path + ext) for ext in
+               ['.opp.gz', '.opr.gz', '.eps.gz', '.opz.gz']
+               if os.path.exists(path + ext))
+
+
+def _check_convert(results):
+    if results[0]['status'] != 'converted':
+        raise RuntimeError(results[0]['error'])
+
+
+def benchmark_cases(workdir, ndens, ntemp, ngroups, seed=0):
+    """
+    Writes the synthetic tables and returns the benchmark cases.
+
+    Parameters
+    ----------
+    workdir : str
+        Directory of the synthetic tables and of the outputs.
+    ndens, ntemp, ngroups : int
+        Size of the tables.
+    seed : int
+        Seed of the synthetic opacities.
+
+    Returns
+    -------
+    list
+        ``(name, func, nvalues, nbytes)`` tuples: ``func()`` runs the case
+        and ``nbytes()`` gives the number of bytes read or written.
+    """
+    from ..scripts import opac_convert
+    from .. import regrid
+
+    size = (ndens, ntemp, ngroups)
+    inputs = dict((fmt, write_synthetic(fmt, os.path.join(workdir, 'in'),
+                                        ndens, ntemp, ngroups, seed=seed))
+                  for fmt in SYNTHETIC_FORMATS)
+    eos_dict = opp.utils.synthetic_eos_dict(ndens, ntemp, ngroups, seed=seed)
+    out = os.path.join(workdir, 'out')
+    abar = eos_dict['Abar']
+
+    def reader(fmt):
+        fn = inputs[fmt]
+        func = {'ionmix': lambda: opp.OpacIonmix(fn, abar/opp.NA, twot=True,
+                                                 man=True),
+                'hdf5': lambda: opp.OpgHdf5.open_file(
+                                    fn, explicit_load=True).f.close(),
+                'multi': lambda: opp.OpgMulti.open_file(
+                                     workdir, os.path.basename(fn),
+                                     verbose=False),
+                'sesame': lambda: opp.OpgSesame(fn, opp.OpgSesame.SINGLE),
+                'tops': lambda: opp.OpgTOPS(fn),
+                'qeos': lambda: opp.OpgQeos(fn, 'eos')}[fmt]
+        return ('parse/' + fmt, func, _nvalues(fmt, *size),
+                lambda: _file_size(fn))
+
+    def write_ionmix():
+        opp.writeIonmixFile(out + '.cn4', eos_dict['Znum'], eos_dict['Xnum'],
+                            eos_dict['idens'], eos_dict['temp'],
+                            zbar=eos_dict['Zf_DT'], pion=eos_dict['Pi_DT'],
+                            pele=eos_dict['Pec_DT'], eion=eos_dict['Ui_DT'],
+                            eele=eos_dict['Uec_DT'], ngroups=ngroups,
+                            opac_bounds=eos_dict['groups'],
+                            rosseland=eos_dict['opr_mg'],
+                            planck_absorb=eos_dict['opp_mg'],
+                            planck_emiss=eos_dict['emp_mg'])
+
+    def write_multi():
+        op = opp.OpgMulti()
+        for key in ['dens', 'temp', 'groups', 'opp_mg', 'opr_mg', 'emp_mg']:
+            # The writer modifies the tables.
+            op[key] = eos_dict[key].copy()
+        op['zbar'] = eos_dict['Zf_DT']
+        op.set_id(0)
+        op.write(out)
+
+    # Interpolation onto a grid twice as fine, and rebinning onto half
+    # the groups.
+    fine_dens = np.logspace(np.log10(eos_dict['dens'][0]),
+                            np.log10(eos_dict['dens'][-1]), 2*ndens)
+    fine_temp = np.logspace(np.log10(eos_dict['temp'][0]),
+                            np.log10(eos_dict['temp'][-1]), 2*ntemp)
+    rng = np.random.RandomState(seed)
+    pts_dens = rng.uniform(eos_dict['dens'][0], eos_dict['dens'][-1],
+                           ndens*ntemp)
+    pts_temp = rng.uniform(eos_dict['temp'][0], eos_dict['temp'][-1],
+                           ndens*ntemp)
+    opac = eos_dict['opp_mg']
+
+    def convert(fmt, out_fmt):
+        fn = inputs[fmt] + ('.opp.gz' if fmt == 'multi' else '')
+        argv = ['--Znum', '13', '-o', out_fmt, '--outname', out + '_' + fmt,
+                fn]
+        ext = {'ionmix': '.cn4', 'hdf5': '.h5', 'multi': ''}[out_fmt]
+        return ('convert/{0}-{1}'.format(fmt, out_fmt),
+                lambda: _check_convert(opac_convert.convert_tables(argv)),
+                _nvalues(fmt, *size),
+                lambda: _file_size(inputs[fmt]) + _file_size(
+                                    out + '_' + fmt + ext))
+
+    cases = [reader(fmt) for fmt in SYNTHETIC_FORMATS]
+    cases += [
+        ('write/ionmix', write_ionmix, _nvalues('ionmix', *size),
+         lambda: _file_size(out + '.cn4')),
+        ('write/hdf5',
+         lambda: opp.OpgHdf5.from_eos_dict(eos_dict).write2file(out + '.h5'),
+         _nvalues('hdf5', *size), lambda: _file_size(out + '.h5')),
+        ('write/multi', write_multi, _nvalues('multi', *size),
+         lambda: _file_size(out)),
+        ('interp/RectRegrid',
+         lambda: regrid.RectRegrid(eos_dict['dens'], eos_dict['temp'],
+                                   fine_dens, fine_temp, logd=True,
+                                   logt=True)(opac),
+         4*opac.size, lambda: 5*opac.nbytes),
+        ('interp/GroupRebin',
+         lambda: regrid.GroupRebin(eos_dict['groups'],
+                                   eos_dict['groups'][::2])(opac),
+         opac.size, lambda: 3*opac.nbytes//2),
+        ('interp/interpDT',
+         lambda: opp.utils.interpDT(eos_dict['Pec_DT'], eos_dict['dens'],
+                                    eos_dict['temp'])(pts_dens, pts_temp),
+         pts_dens.size, lambda: 3*pts_dens.nbytes),
+        ('convert/sesame-toEosDict',
+         lambda: opp.OpgSesame(inputs['sesame'], opp.OpgSesame.SINGLE)
+                    .toEosDict(Znum=13),
+         _nvalues('sesame', *size), lambda: _file_size(inputs['sesame'])),
+        convert('sesame', 'ionmix'),
+        convert('sesame', 'hdf5'),
+        convert('hdf5', 'ionmix'),
+        convert('tops', 'ionmix'),
+        convert('multi', 'hdf5'),
+        ]
+    return cases
+
+
+def _time_case(func, repeat, min_run_time):
+    """
+    Best time of a call of ``func`` over ``repeat`` runs, and the number of
+    calls per run.
+    """
+    def run(number):
+        t0 = _timer()
+        for i in range(number):
+            func()
+        return _timer() - t0
+
+    # Calibration as timeit.Timer.autorange (1, 2, 5, 10, 20, ... calls),
+    # the last calibration run being the first timed run.
+    i = 0
+    while True:
+        number = (1, 2, 5)[i % 3]*10**(i//3)
+        elapsed = run(number)
+        if elapsed >= min_run_time:
+            break
+        i += 1
+    times = [elapsed] + [run(number) for i in range(repeat - 1)]
+    return min(times)/number, number
+
+
+def _peak_memory(func):
+    try:
+        import tracemalloc
+    except ImportError:
+        return None
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run_benchmarks(size='medium', select=None, repeat=3, seed=0,
+                   workdir=None, verbose=False, min_run_time=MIN_RUN_TIME):
+    """
+    Runs the benchmarks on synthetic tables.
+
+    Parameters
+    ----------
+    size : str or tuple
+        One of ``SIZES``, or ``(ndens, ntemp, ngroups)``.
+    select : list of str
+        Patterns of the cases to run (e.g. ``['parse/*', 'write/ionmix']``),
+        all cases being run by default.
+    repeat : int
+        Number of timed runs of each case, the best time being kept.
+    seed : int
+        Seed of the synthetic opacities.
+    workdir : str
+        Directory of the synthetic tables, a temporary directory (removed
+        afterwards) by default.
+    verbose : bool
+        Print the results as they come.
+    min_run_time : float
+        Minimum duration (s) of a timed run, the cases being called
+        ``number`` times per run.
+
+    Returns
+    -------
+    dict
+        ``{'meta': {...}, 'results': {name: {...}}}``, where each result
+        has the ``time`` (s, of one call), ``number`` of calls per run,
+        ``values_per_s``, ``mb_per_s``, ``peak_mb``, ``nvalues`` and
+        ``nbytes``. This is the format of the baselines.
+    """
+    if not isinstance(size, (tuple, list)):
+        size = SIZES[size]
+    ndens, ntemp, ngroups = size
+    tmpdir = workdir is None
+    if tmpdir:
+        workdir = tempfile.mkdtemp(prefix='opacplot2_bench_')
+    report = {'meta': {'size': list(size), 'repeat': repeat, 'seed': seed,
+                       'opacplot2': opp.__version__,
+                       'numpy': np.__version__,
+                       'python': platform.python_version(),
+                       'machine': platform.machine()},
+              'results': {}}
+    try:
+        cases = benchmark_cases(workdir, ndens, ntemp, ngroups, seed)
+        for name, func, nvalues, nbytes in cases:
+            if select and not any(fnmatch.fnmatch(name, pattern)
+                                  for pattern in select):
+                continue
+            with _Quiet():
+                best, number = _time_case(func, repeat, min_run_time)
+                peak = _peak_memory(func)
+            best = max(best, 1e-9)
+            res = {'time': best, 'number': number, 'nvalues': nvalues,
+                   'nbytes': nbytes(),
+                   'values_per_s': nvalues/best,
+                   'peak_mb': None if peak is None else peak/2.**20}
+            res['mb_per_s'] = res['nbytes']/2.**20/best
+            report['results'][name] = res
+            if verbose:
+                print(format_results({name: res}, header=False))
+    finally:
+        if tmpdir:
+            shutil.rmtree(workdir)
+    return report
+
+
+def compare_baseline(report, baseline, threshold=1.5, time_floor=TIME_FLOOR,
+                     peak_floor_mb=PEAK_FLOOR_MB):
+    """
+    Compares benchmark results to a baseline.
+
+    A case regresses when its time or its peak memory is more than
+    ``threshold`` times that of the baseline, and more than ``time_floor``
+    or ``peak_floor_mb`` above it. Cases missing from either report are
+    ignored.
+
+    Parameters
+    ----------
+    report, baseline : dict
+        Outputs of ``run_benchmarks``, the baseline being usually read
+        from a JSON file.
+    threshold : float
+        Maximum ratio to the baseline.
+    time_floor : float
+        Time differences (s) that are never regressions.
+    peak_floor_mb : float
+        Peak memory differences (MB) that are never regressions.
+
+    Returns
+    -------
+    list
+        ``(name, metric, value, reference)`` of the regressions.
+    """
+    if list(report['meta']['size']) != list(baseline['meta']['size']):
+        raise ValueError('The baseline was run on tables of size {0}, not '
+                         '{1}!'.format(baseline['meta']['size'],
+                                       report['meta']['size']))
+    regressions = []
+    for name in sorted(report['results']):
+        if name not in baseline['results']:
+            continue
+        res, ref = report['results'][name], baseline['results'][name]
+        for metric, floor in [('time', time_floor),
+                              ('peak_mb', peak_floor_mb)]:
+            if res.get(metric) is None or not ref.get(metric):
+                continue
+            if res[metric] > threshold*ref[metric] and \
+               res[metric] - ref[metric] > floor:
+                regressions.append((name, metric, res[metric], ref[metric]))
+    return regressions
+
+
+def format_results(results, header=True):
+    """
+    Table of the benchmark results, one line per case.
+    """
+    lines = []
+    if header:
+        lines.append('{0:28s}{1:>10s}{2:>12s}{3:>10s}{4:>11s}'.format(
+            'case', 'time [s]', 'values/s', 'MB/s', 'peak [MB]'))
+    for name in sorted(results):
+        res = results[name]
+        peak = '-' if res['peak_mb'] is None else \
+               '{0:.1f}'.format(res['peak_mb'])
+        lines.append('{0:28s}{1:10.4f}{2:12.3g}{3:10.2f}{4:>11s}'.format(
+            name, res['time'], res['values_per_s'], res['mb_per_s'], peak))
+    return '\n'.join(lines)
+
+
+def get_input_data(argv=None):
+    parser = argparse.ArgumentParser(
+                description='Benchmarks of the opacplot2 readers, writers, '
+                            'interpolators and converters on synthetic '
+                            'tables.')
+    parser.add_argument('--size', choices=sorted(SIZES), default='medium',
+                        help='Size of the tables: {0}.'.format(', '.join(
+                            '{0} {1}'.format(key, 'x'.join(map(str, val)))
+                            for key, val in sorted(SIZES.items()))))
+    parser.add_argument('--shape', type=int, nargs=3,
+                        metavar=('NDENS', 'NTEMP', 'NGROUPS'),
+                        help='Size of the tables, instead of --size.')
+    parser.add_argument('-k', '--select', action='append',
+                        help='Pattern of the cases to run (e.g. "parse/*"), '
+                             'can be repeated.')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='Number of timed runs of each case.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed of the synthetic opacities.')
+    parser.add_argument('--workdir',
+                        help='Directory of the synthetic tables, which is '
+                             'kept (temporary directory by default).')
+    parser.add_argument('--json',
+                        help='Write the results to this JSON file, which can '
+                             'be used as a baseline.')
+    parser.add_argument('--baseline',
+                        help='JSON file of a previous run to compare to.')
+    parser.add_argument('--threshold', type=float, default=1.5,
+                        help='Maximum ratio of the times and peak memory to '
+                             'the baseline.')
+    parser.add_argument('--time_floor', type=float, default=TIME_FLOOR,
+                        help='Time differences (s) to the baseline that are '
+                             'never regressions.')
+    parser.add_argument('--min_run_time', type=float, default=MIN_RUN_TIME,
+                        help='Minimum duration (s) of a timed run.')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = get_input_data(argv)
+    size = args.shape or SIZES[args.size]
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if list(baseline['meta']['size']) != list(size):
+            sys.exit('The baseline was run on tables of size {0}, use '
+                     '--shape.'.format(baseline['meta']['size']))
+
+    print(format_results({}))
+    report = run_benchmarks(size, select=args.select, repeat=args.repeat,
+                            seed=args.seed, workdir=args.workdir,
+                            verbose=True, min_run_time=args.min_run_time)
+    if args.json is not None:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    if baseline is not None:
+        regressions = compare_baseline(report, baseline, args.threshold,
+                                       args.time_floor)
+        for name, metric, value, ref in regressions:
+            print('Regression: {0} {1} {2:.4g} (baseline {3:.4g}, '
+                  'x{4:.2f})'.format(name, metric, value, ref, value/ref))
+        if regressions:
+            sys.exit(1)
+        print('No regression above x{0} of the baseline.'.format(
+            args.threshold))
+    return report
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,260 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Synthetic tables in every format read by opacplot2.
+
+The tables are generated by :func:`opacplot2.utils.synthetic_eos_dict`
+(smooth EoS and power law opacities) and written in the layout expected by
+the readers, so that the readers, writers and converters can be exercised
+on tables of production size.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import numpy as np
+
+from ..constants import GPA_TO_ERGCC, KELVIN_TO_EV, MJKG_TO_ERGCC
+from .. import utils
+
+__all__ = ['SYNTHETIC_FORMATS', 'write_synthetic', 'write_sesame',
+           'write_tops', 'write_qeos']
+
+# Formats for which synthetic tables can be written. PROPACEOS files are
+# not included since the reader is not distributed.
+SYNTHETIC_FORMATS = ['ionmix', 'hdf5', 'multi', 'sesame', 'tops', 'qeos']
+
+# Number of lines formatted at once.
+_CHUNK_LINES = 4096
+
+
+def _write_words(f, words, fmt, per_line):
+    """
+    Writes numbers with ``per_line`` fields of format ``fmt`` per line,
+    the last line being completed by a newline.
+    """
+    words = np.asarray(words, dtype=float).ravel()
+    nfull = len(words)//per_line
+    line = fmt*per_line + '\n'
+    for i in range(0, nfull, _CHUNK_LINES):
+        nl = min(_CHUNK_LINES, nfull - i)
+        f.write((line*nl) % tuple(words[i*per_line:(i + nl)*per_line]))
+    rest = words[nfull*per_line:]
+    if len(rest):
+        f.write((fmt*len(rest) + '\n') % tuple(rest))
+
+
+def write_sesame(filename, eos_dict, matid=9999):
+    """
+    Writes a SESAME file (single precision) with the 201 record and the
+    301, 303, 304, 305 and 306 EoS records.
+
+    The electron tables are written in the 304 record, the ion tables in
+    the 303 and 305 records, the cold curve (306) being zero.
+
+    Parameters
+    ----------
+    filename : str
+        Name of output file.
+    eos_dict : dict
+        Common EoS dictionary.
+    matid : int
+        Material ID.
+    """
+    dens, temp = eos_dict['dens'], eos_dict['temp']
+    zeros = np.zeros((len(dens), len(temp)))
+    tables = {301: (eos_dict['Pec_DT'] + eos_dict['Pi_DT'],
+                    eos_dict['Uec_DT'] + eos_dict['Ui_DT']),
+              303: (eos_dict['Pi_DT'], eos_dict['Ui_DT']),
+              304: (eos_dict['Pec_DT'], eos_dict['Uec_DT']),
+              305: (eos_dict['Pi_DT'], eos_dict['Ui_DT']),
+              306: (zeros, zeros)}
+    header = (" 1  {0:5d}   {1:3d}  {2:4d}   r    22481   102082   4"
+              "                                 1\n")
+
+    with open(filename, 'w') as f:
+        words = [eos_dict['Zmax'], eos_dict['Abar'], dens[-1],
+                 eos_dict.get('BulkMod', 0.0), 0.0]
+        f.write(header.format(matid, 201, len(words)))
+        _write_words(f, words, '%15.8E', 5)
+        for recid in sorted(tables):
+            pres, eint = tables[recid]
+            # Tables are stored with the density varying fastest.
+            words = np.concatenate([[len(dens), len(temp)], dens,
+                                    temp/KELVIN_TO_EV,
+                                    (pres/GPA_TO_ERGCC).T.ravel(),
+                                    (eint/MJKG_TO_ERGCC).T.ravel()])
+            f.write(header.format(matid, recid, len(words)))
+            _write_words(f, words, '%15.8E', 5)
+        f.write(" 2" + " "*77 + "2\n")
+
+
+def _tops_grid(f, values, fmt='%.6e', per_line=6):
+    strs = [fmt % v for v in values]
+    for i in range(0, len(strs), per_line):
+        f.write('  '.join(strs[i:i+per_line]) + '\n')
+    return strs
+
+
+def write_tops(filename, eos_dict):
+    """
+    Writes a multigroup TOPS text file, as read by ``OpgTOPS``.
+
+    The gray opacities are the averages of the group opacities over the
+    groups, and the temperatures and photon energies are written in keV.
+
+    Parameters
+    ----------
+    filename : str
+        Name of output file.
+    eos_dict : dict
+        Common EoS dictionary, with multigroup opacities.
+    """
+    import periodictable
+
+    dens, temp = eos_dict['dens'], eos_dict['temp']
+    zbar = eos_dict['Zf_DT']
+    opr, opp = eos_dict['opr_mg'], eos_dict['opp_mg']
+    nd, nt, ng = opp.shape
+    znum = np.atleast_1d(eos_dict['Znum'])
+    xnum = np.atleast_1d(eos_dict['Xnum'])
+    anum = np.array([periodictable.elements[z].mass for z in znum])
+    mfrac = xnum*anum/np.sum(xnum*anum)
+
+    with open(filename, 'w') as f:
+        f.write(' TOPS opacities for {0} temperatures, {1} densities and {2} '
+                'elements\n'.format(nt, nd, len(znum)))
+        f.write(' No. Fraction  Mass Fraction  At. No.  Chem. Sym.  '
+                'Mat ID.\n')
+        for i, z in enumerate(znum):
+            f.write(' {0:.6e}  {1:.6e}  {2:d}  {3}  {4:d}\n'.format(
+                xnum[i], mfrac[i], z, periodictable.elements[z].symbol,
+                1000*z))
+        f.write(' Temperature grid used the following {0} temperatures '
+                '(keV)\n'.format(nt))
+        tstrs = _tops_grid(f, temp*1e-3)
+        f.write(' Density grid used the following {0} densities '
+                '(g/cc)\n'.format(nd))
+        dstrs = _tops_grid(f, dens)
+        f.write(' Photon energy group lower bounds: {0} groups '
+                '(keV)\n'.format(ng))
+        gstrs = _tops_grid(f, eos_dict['groups'][:-1]*1e-3)
+
+        ross = 1.0/np.mean(1.0/opr, axis=-1)
+        plnk = np.mean(opp, axis=-1)
+        row = '{0}  %.6e  %.6e  %.6e  %.6e\n'
+        for t in range(nt):
+            f.write(' Rosseland and Planck opacities and free electrons\n')
+            f.write(' Density  Ross opa  Planck opa  No. Free  Av Sq Free  '
+                    'T= {0}\n'.format(tstrs[t]))
+            f.write(''.join((row.format(dstrs[d]) %
+                             (ross[d, t], plnk[d, t], zbar[d, t],
+                              zbar[d, t]**2)) for d in range(nd)))
+
+        f.write(' Multigroup opacities\n')
+        block = ''.join('{0}  %.6e  %.6e\n'.format(s) for s in gstrs)
+        for t in range(nt):
+            for d in range(nd):
+                f.write(' Energy  Ross mg  Planck mg  for T, density = '
+                        '{0} {1}\n'.format(tstrs[t], dstrs[d]))
+                vals = np.empty((ng, 2))
+                vals[:, 0] = opr[d, t]
+                vals[:, 1] = opp[d, t]
+                f.write(block % tuple(vals.ravel()))
+
+
+def write_qeos(filename, eos_dict, tabid=1):
+    """
+    Writes a QEOS ``eos`` file (legacy LULI format), as read by
+    ``OpgQeos(filename, 'eos')``.
+
+    Parameters
+    ----------
+    filename : str
+        Name of output file.
+    eos_dict : dict
+        Common EoS dictionary.
+    tabid : int
+        Table ID.
+    """
+    dens, temp = eos_dict['dens'], eos_dict['temp']
+    pres = eos_dict['Pec_DT'] + eos_dict['Pi_DT']
+    eint = eos_dict['Uec_DT'] + eos_dict['Ui_DT']
+    with open(filename, 'w') as f:
+        f.write('%15d%15d%15d%15d\n' % (tabid, 6, len(dens), len(temp)))
+        # Blocks are stored with the density varying fastest.
+        _write_words(f, np.concatenate([dens, temp/KELVIN_TO_EV,
+                                        (pres/GPA_TO_ERGCC).T.ravel(),
+                                        (eint/MJKG_TO_ERGCC).T.ravel(),
+                                        np.zeros(pres.size)]),
+                     '%15.6E', 4)
+
+
+def write_synthetic(fmt, path, ndens, ntemp, ngroups=0, seed=None):
+    """
+    Writes a synthetic table in a given format.
+
+    Parameters
+    ----------
+    fmt : str
+        One of ``SYNTHETIC_FORMATS``.
+    path : str
+        Name of output file, without extension. The extension of the
+        format is appended (``.cn4``, ``.h5``, ``.ses``, ``.tops``,
+        ``.qeos``), MULTI tables being written to ``path.opp.gz``, ...
+    ndens, ntemp, ngroups : int
+        Size of the tables. TOPS tables need at least 3 groups, SESAME and
+        QEOS tables hold no opacities.
+    seed : int or numpy.random.RandomState
+        Seed of the noise on the opacities.
+
+    Returns
+    -------
+    str
+        Name of the file(s) written: the file name, or the prefix of the
+        MULTI files.
+
+    Examples
+    --------
+    ::
+
+       >>> from opacplot2.benchmarks import write_synthetic
+       >>> fn = write_synthetic('sesame', 'Al', 200, 150)
+       >>> op = opp.OpgSesame(fn, opp.OpgSesame.SINGLE)
+    """
+    if fmt not in SYNTHETIC_FORMATS:
+        raise ValueError('Unknown format {0}, must be one of '
+                         '{1}!'.format(fmt, ', '.join(SYNTHETIC_FORMATS)))
+    if fmt == 'ionmix':
+        fn = path + '.cn4'
+        utils.synthetic_ionmix(fn, ndens, ntemp, ngroups, seed=seed)
+        return fn
+    if fmt in ['multi', 'tops'] and ngroups < (3 if fmt == 'tops' else 1):
+        raise ValueError('{0} tables need opacity groups!'.format(fmt))
+
+    eos_dict = utils.synthetic_eos_dict(
+                    ndens, ntemp, ngroups if fmt in ['hdf5', 'multi', 'tops']
+                    else 0, seed=seed)
+    if fmt == 'hdf5':
+        from ..opg_hdf5 import OpgHdf5
+        fn = path + '.h5'
+        OpgHdf5.from_eos_dict(eos_dict).write2file(fn)
+    elif fmt == 'multi':
+        from ..opg_multi import OpgMulti
+        fn = path
+        op = OpgMulti()
+        for key in ['dens', 'temp', 'groups', 'opp_mg', 'opr_mg', 'emp_mg']:
+            op[key] = eos_dict[key]
+        op['zbar'] = eos_dict['Zf_DT']
+        op.set_id(0)
+        op.write(fn)
+    elif fmt == 'sesame':
+        fn = path + '.ses'
+        write_sesame(fn, eos_dict)
+    elif fmt == 'tops':
+        fn = path + '.tops'
+        write_tops(fn, eos_dict)
+    else:
+        fn = path + '.qeos'
+        write_qeos(fn, eos_dict)
+    return fn
@@ -2,7 +2,7 @@ import numpy as np
 from .opl_grid import OplGrid
 from .opl_list import OplList
 from .opl_tempgrid import OplTempGrid
-from .utils import avgopac
+from .utils import avgopac, group_average
 
 def listToGrid(opllist, ndens, ntemps):
 
@@ -25,19 +25,100 @@ def listToGrid(opllist, ndens, ntemps):
                    lambda jd, jt: opllist.findExact(rho[jd],tele[jt])[1])
 
 
-def avgOplList(opllist, ebds, weight="constant", bound="error"):
+def _avgopac_batch(args):
+    # Worker for avgOplList, must be picklable for multiprocessing.
+    energies, opacs, trads, ebds, weight, bound = args
+    return group_average(energies, opacs, ebds, trad=trads,
+                         weight=weight, bound=bound)
+
+def _avgopac_all(opllist, ebds, weight, bound, nproc):
+    # Batch together consecutive points sharing the same energy grid, and
+    # average each batch over the groups in a single call.
+    batches = []
+    for n in range(opllist.nopacs):
+        energies = np.asarray(opllist.getEnergies(n))
+        trad = opllist.getDensTemp(n)[1]
+        if batches and np.array_equal(batches[-1][1], energies):
+            batches[-1][0].append(n)
+            batches[-1][2].append(opllist.getOpac(n))
+            batches[-1][3].append(trad)
+        else:
+            batches.append(([n], energies, [opllist.getOpac(n)], [trad]))
+
+    # Split the batches so that every worker gets some work.
+    nchunks = max(nproc, 1)*4
+    chunk = max(1, -(-opllist.nopacs // nchunks))
+    tasks, indexes = [], []
+    for ns, energies, opacs, trads in batches:
+        for i in range(0, len(ns), chunk):
+            tasks.append((energies, np.array(opacs[i:i+chunk]),
+                          np.array(trads[i:i+chunk]), ebds, weight, bound))
+            indexes.append(ns[i:i+chunk])
+
+    if nproc > 1:
+        import multiprocessing
+        pool = multiprocessing.Pool(nproc)
+        try:
+            results = pool.map(_avgopac_batch, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_avgopac_batch(task) for task in tasks]
+
+    cache = {}
+    for ns, res in zip(indexes, results):
+        for n, opac in zip(ns, res):
+            cache[n] = opac
+    return cache
+
+def avgOplList(opllist, ebds, weight="constant", bound="error",
+               nproc=None, cache=True):
+    """
+    Average every opacity of an ``OplList`` over the groups ``ebds``.
+
+    By default the averages are computed lazily, when ``getOpac`` is called.
+    If ``nproc`` is given, all of them are computed upfront in batches,
+    using a pool of ``nproc`` processes when ``nproc > 1``.
+
+    Parameters
+    ----------
+    opllist : OplList
+        Opacities to average.
+    ebds : numpy.ndarray
+        Group boundaries.
+    weight : str
+        ``"constant"``, ``"planck"`` or ``"rosseland"``.
+    bound : str
+        ``"error"`` or ``"continue"``, see :func:`opacplot2.utils.avgopac`.
+    nproc : int
+        Number of processes for the upfront computation.
+    cache : bool
+        Keep the averaged opacities in memory once they are computed.
+    """
 
     getEnergies = lambda n: ebds
 
+    if nproc is not None:
+        opavgs = _avgopac_all(opllist, ebds, weight, bound, nproc)
+    else:
+        opavgs = {}
+
     def getOpac(n):
+        if n in opavgs:
+            return opavgs[n]
+
         rho_n, trad_n = opllist.getDensTemp(n)
 
-        return avgopac(opllist.getEnergies(n),
-                       opllist.getOpac(n),
-                       trad_n,
-                       ebds,
-                       weight=weight,
-                       bound=bound)
+        opavg = avgopac(opllist.getEnergies(n),
+                        opllist.getOpac(n),
+                        trad_n,
+                        ebds,
+                        weight=weight,
+                        bound=bound)
+        if cache:
+            opavgs[n] = opavg
+        return opavg
 
     return OplList(opllist.nopacs, opllist.getDensTemp, getEnergies, getOpac)
 
@@ -11,8 +11,11 @@ import sys
 import types
 from six import iteritems
 
+from . import profiling
+
 class OpgHdf5(dict):
     @classmethod
+    @profiling.timed('OpgHdf5.open_file')
     def open_file(cls, filename, explicit_load=False):
         """
         Open an HDF5 file containing opacity data.
@@ -58,9 +61,44 @@ class OpgHdf5(dict):
         self._compute_ionization()
         self.Nr =  self['dens'].shape[0]
         self.Nt =  self['temp'].shape[0]
-        self.Ng =  self['groups'].shape[0] - 1
+        # EoS only tables have no groups.
+        self.Ng =  self['groups'].shape[0] - 1 if 'groups' in self else 0
         return self
 
+    @classmethod
+    def from_eos_dict(cls, eos_dict):
+        """
+        Create an ``OpgHdf5`` from a common EoS dictionary
+        (e.g. from ``toEosDict()``), to be written with ``write2file()``.
+
+        Parameters
+        ----------
+        eos_dict : dict
+            Common EoS dictionary.
+
+        Examples
+        --------
+        ::
+
+           >>> eos_dict = opp.OpgSesame('Al.ses', opp.OpgSesame.SINGLE)\
+           ...                .toEosDict(Znum=13)
+           >>> opp.OpgHdf5.from_eos_dict(eos_dict).write2file('Al.h5')
+        """
+        self = cls()
+        self.update(eos_dict)
+        return self
+
+    @staticmethod
+    def _chunkshape(shape):
+        """
+        Chunks of the datasets: one (dens, temp) plane per group for
+        multigroup opacities, so that a group is read with a single chunk.
+        """
+        if len(shape) == 3 and shape[0]*shape[1] > 0:
+            return (shape[0], shape[1], 1)
+        return None
+
+    @profiling.timed('OpgHdf5.write2file')
     def write2file(self, filename, **args):
         """Write to an HDF5 output file.
 
@@ -84,15 +122,33 @@ class OpgHdf5(dict):
                 val = args[key]
             else:
                 if self[key] is None: continue
-                val = self[key][:]
+                val = self[key]
+                if isinstance(val, tables.Leaf):
+                    if val.ndim == 3:
+                        # Copied one group plane at a time.
+                        ds = f.create_carray(f.root, key, val.atom,
+                                             val.shape, filters=h5filters,
+                                             chunkshape=self._chunkshape(
+                                                 val.shape))
+                        for g in range(val.shape[2]):
+                            ds[:, :, g] = val[:, :, g]
+                        continue
+                    val = val.read()
+            val = np.asarray(val)
+            if val.ndim == 0:
+                # Scalars are written as attributes.
+                setattr(f.root._v_attrs, key, val[()])
+                continue
             atom = tables.Atom.from_dtype(val.dtype)
-            ds = f.create_carray(f.root, key, atom, val.shape, filters=h5filters)
+            ds = f.create_carray(f.root, key, atom, val.shape,
+                                 filters=h5filters,
+                                 chunkshape=self._chunkshape(val.shape))
             ds[:] = val
 
         # I believe we should only put ion_frac in the table if it was already
         # in the data. -JT
         if 'ion_frac' in self:
-            f.createGroup(where='/', name='ion_frac', filters=h5filters)
+            f.create_group(where='/', name='ion_frac', filters=h5filters)
             for  ion_frac_key,  ion_frac_val in iteritems(self['ion_frac']):
                 atom = tables.Atom.from_dtype(ion_frac_val.dtype)
                 ds = f.create_carray(f.root.ion_frac, ion_frac_key, atom, ion_frac_val.shape)
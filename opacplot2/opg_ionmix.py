@@ -9,6 +9,8 @@ import math
 
 from .opl_grid import OplGrid
 from .constants import ERG_TO_JOULE
+from . import profiling
+from . import utils
 
 class OpacIonmix:
     """
@@ -138,6 +140,7 @@ class OpacIonmix:
     joules_to_ergs = 1.0e+07
 
 
+    @profiling.timed('OpacIonmix.read')
     def __init__(self, fn, mpi, twot=False, man=False, hassele=False, verbose=False):
 
         self.fn = fn
@@ -183,6 +186,7 @@ class OpacIonmix:
         # Read the rest of the file, remove all of the white space,
         # and store the string in self.data:
         txt  = re.sub(r'\s', '', f.read())
+        profiling.add(nbytes=f.tell())
         if sys.version < '3':
             # converting to unicode if needed for python2
             import codecs
@@ -217,6 +221,7 @@ class OpacIonmix:
             arr[i] = float(self.data.read(12))
         return arr
 
+    @profiling.timed('OpacIonmix.read_eos')
     def read_eos(self):
         # Load the EoS data from the file.
 
@@ -250,6 +255,7 @@ class OpacIonmix:
         if self.hassele:
             self.sele  = self.get_block(nd*nt).reshape(nd,nt) * self.joules_to_ergs
 
+    @profiling.timed('OpacIonmix.read_opac')
     def read_opac(self):
         # Load the opacities from the file.
         #
@@ -431,91 +437,495 @@ class OpacIonmix:
         write_opac_block(self.planck_emiss)
 
 
-    def extendToZero(self):
-        """
-        This routine adds another temperature point at zero.
-        """
+    # Tables of either layout, in the order of the file.
+    TABLES_2D = ['zbar', 'etot', 'cvtot', 'dedn', 'dzdt', 'pion', 'pele',
+                 'dpidt', 'dpedt', 'eion', 'eele', 'cvion', 'cvele', 'deidn',
+                 'deedn', 'sele']
+    TABLES_3D = ['rosseland', 'planck_absorb', 'planck_emiss']
 
-        nd = self.ndens
-        nt = self.ntemp
-        ng = self.ngroups
-
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.dzdt[:,:]
-        self.dzdt = arr
+    def extend(self, new_dens=(), new_temp=(), mode='constant', value=0.0,
+               logd=False, logt=False):
+        """
+        Extend the tables beyond the bounds of the grid.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.pion[:,:]
-        self.pion = arr
+        All the tables that were read (for either ``twot``) are extended
+        with :func:`opacplot2.regrid.extend_grid`.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.pele[:,:]
-        self.pele = arr
+        Parameters
+        ----------
+        new_dens : numpy.ndarray
+            Ion number densities to add, below or above the grid.
+        new_temp : numpy.ndarray
+            Temperatures to add, below or above the grid.
+        mode : str
+            ``'constant'`` fills with ``value``, ``'edge'`` repeats the
+            boundary values and ``'linear'`` extrapolates from the boundary
+            cells.
+        value : float
+            Fill value for ``mode='constant'``.
+        logd, logt : bool
+            Extrapolate linearly in log of the density/temperature.
+        """
+        from .regrid import extend_grid
+
+        keys = [key for key in self.TABLES_2D + self.TABLES_3D
+                if hasattr(self, key)]
+        numDens, temps, tables = extend_grid(
+            dict((key, getattr(self, key)) for key in keys), self.numDens,
+            self.temps, new_dens, new_temp, mode=mode, value=value,
+            logd=logd, logt=logt)
+        for key in keys:
+            setattr(self, key, tables[key])
+
+        self.numDens = numDens
+        self.dens = numDens * self.mpi
+        self.temps = temps
+        self.ndens = len(numDens)
+        self.ntemp = len(temps)
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.dpidt[:,:]
-        self.dpidt = arr
+    def extendToZero(self):
+        """
+        This routine adds another temperature point at zero.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.dpedt[:,:]
-        self.dpedi = arr
+        The tables are left unchanged if the grid already starts at zero.
+        """
+        if self.temps[0] == 0:
+            return
+        self.extend(new_temp=[0.0])
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.eion[:,:]
-        self.eion = arr
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.eele[:,:]
-        self.eele = arr
+def _ionmix_format(num, name):
+    # IONMIX representation of num: 0.xxxxxE+yy (12 characters).
+    # name argument is for error reporting purposes.
+    string_org = "%12.5E" % (num)
+    negative = (string_org[0] == "-")
+    lead = "-." if negative else "0."
+    string = lead + string_org[1] + string_org[3:8] + "E"
+
+    # Deal with the exponent:
+
+    # Check for zero:
+    try:
+        if int(string_org[1] + string_org[3:8]) == 0:
+            return string + "+00"
+    except ValueError:
+        raise ValueError('There was a problem writing the data in '
+                         'the {} block to IONMIX. Try writing it in '
+                         'log format.'.format(name))
+
+    # Not zero:
+    expo = int(string_org[9:]) + 1
+    if expo < 0:
+        string += "-"
+    else:
+        string += "+"
+    string += "%02d" % abs(expo)
+    return string
+
+
+def _ionmix_format_array(values, name):
+    """
+    IONMIX representation of an array of values, as an ``(n, 12)`` array of
+    characters (``uint8``), identical to ``_ionmix_format`` of each value
+    (which also fails on magnitudes between 1e-100 and 1e-99).
+
+    The 6 digit mantissas and the exponents are computed with array
+    operations. Values within 1e-6 of a rounding tie, for which the
+    floating point scaling could round the other way, are printed with
+    ``%`` as in ``_ionmix_format``.
+    """
+    values = np.asarray(values, dtype=float).ravel()
+    n = len(values)
+
+    def invalid():
+        # Let the scalar version report the first bad value.
+        for val in values: _ionmix_format(val, name)
+        raise ValueError('There was a problem writing the data in '
+                         'the {} block to IONMIX. Try writing it in '
+                         'log format.'.format(name))
+
+    if not np.all(np.isfinite(values)):
+        invalid()
+    mag = np.abs(values)
+    nonzero = mag > 0.0
+    # Decimal exponent and mantissa scaled to [1e5, 1e6).
+    expo = np.zeros(n, dtype=int)
+    scaled = np.zeros(n)
+    with np.errstate(divide='ignore', over='ignore', invalid='ignore'):
+        expo[nonzero] = np.floor(np.log10(mag[nonzero]))
+        for _ in range(2):
+            # log10 can be off by one next to powers of 10.
+            scaled[nonzero] = mag[nonzero]/10.0**(expo[nonzero] - 5)
+            expo[scaled >= 1e6] += 1
+            expo[nonzero & (scaled < 1e5)] -= 1
+        scaled[nonzero] = mag[nonzero]/10.0**(expo[nonzero] - 5)
+        mant = np.floor(scaled + 0.5)
+        ties = np.nonzero(np.abs(scaled - np.floor(scaled) - 0.5) < 1e-6)[0]
+    for i in ties:
+        string_org = "%12.5E" % values[i]
+        mant[i] = int(string_org[1] + string_org[3:8])
+        expo[i] = int(string_org[9:])
+    # Rounded up to the next power of 10.
+    carry = mant >= 1e6
+    mant[carry] = 1e5
+    expo[carry] += 1
+    mant = mant.astype(int)
+    # 0.xxxxxx convention.
+    expo = np.where(nonzero, expo + 1, 0)
+    if np.any(np.abs(expo) > 99):
+        invalid()
+
+    out = np.empty((n, 12), dtype=np.uint8)
+    out[:, 0] = np.where(np.signbit(values), ord('-'), ord('0'))
+    out[:, 1] = ord('.')
+    for k in range(6):
+        out[:, 2+k] = mant//10**(5-k) % 10 + ord('0')
+    out[:, 8] = ord('E')
+    out[:, 9] = np.where(expo < 0, ord('-'), ord('+'))
+    expo = np.abs(expo)
+    out[:, 10] = expo//10 + ord('0')
+    out[:, 11] = expo % 10 + ord('0')
+    return out
+
+
+class IonmixWriter(object):
+    """
+    Incremental writer of IONMIX files.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.zbar[:,:]
-        self.zbar = arr
+    The header and grids are written when the writer is created, the
+    tables are then written one block at a time, in the order of the
+    file, as they are produced by a reader. Opacities can be given one
+    group plane at a time, so that the full opacity cubes never need to be
+    in memory. Tables that are never given are written as zeros, and
+    constant tables (e.g. ``np.broadcast_to(0., shape)``) are written
+    without being expanded.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.cvion[:,:]
-        self.cvion = arr
+    Parameters
+    ----------
+    fn : str
+        Name of the file to write.
+    zvals : tuple
+        Atomic numbers of elements to write to file.
+    fracs : tuple
+        Element fractions.
+    numDens : numpy.ndarray
+        Number densities.
+    temps : numpy.ndarray
+        Temperature array.
+    ngroups : int
+        Number of energy groups.
+    opac_bounds : numpy.ndarray
+        Energy group boundaries.
+    sele : bool
+        Whether the file has an electron entropy table.
+    log : list
+        Names of the tables (and grids: ``temps``, ``numDens``,
+        ``opac_bounds``) to write as base 10 logarithms, after the unit
+        conversion.
+    invalid : str
+        Treatment of the values that cannot be written to IONMIX: NaN,
+        infinite and values with a 3 digit exponent, and the non-positive
+        values of the tables in ``log``. ``'fail'`` raises a ``ValueError``
+        giving the table, group and grid indexes of the first one,
+        ``'clip'`` clips them to the largest magnitude that can be written
+        (NaN and non-positive values in ``log`` are set to ``floor``) and
+        ``'floor'`` sets them all to ``floor``. Values smaller than 1e-99 in
+        magnitude are always written as zeros.
+    floor : float
+        Replacement value, after the unit conversion and logarithm.
+        Defaults to 0, or -99 for tables in ``log``.
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.cvele[:,:]
-        self.cvele = arr
+    Examples
+    --------
+    ::
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.deidn[:,:]
-        self.deidn = arr
+       >>> with opp.IonmixWriter('out.cn4', [13], [1.], dens, temps,
+       ...                       ngroups=ng, opac_bounds=groups) as imx:
+       ...     imx.write('zbar', zbar)
+       ...     imx.write('pion', pion)
+       ...     for g in range(ng):
+       ...         imx.write('planck_absorb', opp_plane(g), group=g)
 
-        arr = np.zeros((nd,nt+1))
-        arr[:,1:] = self.deedn[:,:]
-        self.deedn = arr
+    See Also
+    --------
+    writeIonmixFile
+    """
+    # 2D tables in the order of the file, with their name for error
+    # messages and whether they are converted from erg to J.
+    TABLES = [('zbar', 'average ionization', False),
+              ('dzdt', 'DZ_DT', False),
+              ('pion', 'ion pressure', True),
+              ('pele', 'electron pressure', True),
+              ('dpidt', 'D(ion pressure)_DT', True),
+              ('dpedt', 'D(electron pressure)_DT', True),
+              ('eion', 'ion energy', True),
+              ('eele', 'electron energy', True),
+              ('cvion', 'ion CV', True),
+              ('cvele', 'electron CV', True),
+              ('deidn', 'D(ion energy)_DT', True),
+              ('deedn', 'D(electron energy)_DT', True),
+              ('sele', 'electron entropy', True)]
+    # Multigroup opacities in the order of the file.
+    OPACS = [('rosseland', 'rosseland opacity'),
+             ('planck_absorb', 'planck absorption'),
+             ('planck_emiss', 'planck emissivity')]
+
+    # Number of lines of constant values written at once.
+    CONSTANT_LINES = 4096
+    # Number of values converted and formatted at once.
+    BUFFER_SIZE = 2**16
+    # Largest and smallest magnitudes with a 2 digit exponent.
+    MAX_VALUE = 9.99999e98
+    MIN_VALUE = 1e-99
+    INVALID = ['fail', 'clip', 'floor']
+
+    def __init__(self, fn, zvals, fracs, numDens, temps, ngroups=None,
+                 opac_bounds=None, sele=False, log=None, invalid='fail',
+                 floor=None):
+        self.ndens, self.ntemps = len(numDens), len(temps)
+        self.ngroups = 0 if ngroups is None else ngroups
+        if opac_bounds is None: opac_bounds = (0.0,1.0)
+        if invalid not in self.INVALID:
+            raise ValueError('invalid must be one of {0}!'
+                             .format(self.INVALID))
+        self.log = set(log or [])
+        self.invalid = invalid
+        self.floor = floor
+        # Buffer of whole rows for the unit conversion and logarithm.
+        nrows = min(self.ndens, self.BUFFER_SIZE//max(1, self.ntemps))
+        self._buf = np.empty((max(1, nrows), self.ntemps))
+
+        # Sequence of the blocks of the file, (name, group).
+        self._blocks = [(name, None) for name, _, _ in self.TABLES
+                        if name != 'sele' or sele]
+        self._blocks += [(name, g) for name, _ in self.OPACS
+                         for g in range(self.ngroups)]
+        self._next = 0
+        self._count = 0
+        self._labels = dict([(name, (label, erg))
+                             for name, label, erg in self.TABLES]
+                            + [(name, (label, False))
+                               for name, label in self.OPACS]
+                            + [('temps', ('temperature', False)),
+                               ('numDens', ('number density', False)),
+                               ('opac_bounds', ('opacity bounds', False))])
 
-        arr = np.zeros((nd,nt+1,ng))
-        arr[:,1:,:] = self.rosseland[:,:,:]
-        self.rosseland = arr
+        # Write the header:
+        self.f = f = open(fn,'w')
+        f.write("%10i%10i\n" % (self.ntemps,self.ndens))
+        f.write(" atomic #s of gases: ")
+        for z in zvals: f.write("%10i" % z)
+        f.write("\n relative fractions: ")
+        for frac in fracs: f.write("%10.2E" % frac)
+        f.write("\n")
 
-        arr = np.zeros((nd,nt+1,ng))
-        arr[:,1:,:] = self.planck_absorb[:,:,:]
-        self.planck_absorb = arr
+        # Write temperature/density grid and number of groups:
+        f.write("%12i\n" % self.ngroups)
+        self._write_grid('temps', temps)
+        self._write_grid('numDens', numDens)
+        self._opac_bounds = opac_bounds
 
-        arr = np.zeros((nd,nt+1,ng))
-        arr[:,1:,:] = self.planck_emiss[:,:,:]
-        self.planck_emiss = arr
+    def __enter__(self):
+        return self
 
-        # Reset temperatures:
+    def __exit__(self, exc_type, exc_value, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.f.close()
+        return False
+
+    def _write_values(self, var, name):
+        # Values are written 4 per line, the line being continued from the
+        # previous call within an opacity block.
+        f = self.f
+        chars = _ionmix_format_array(var, name)
+        n = len(chars)
+        head = min(n, (4 - self._count) % 4)
+        f.write(chars[:head].tobytes().decode('ascii'))
+        count = self._count + head
+        if count == 4:
+            count = 0
+            f.write("\n")
+        nlines, rest = divmod(n - head, 4)
+        if nlines:
+            # Whole lines at once: 48 characters and a newline.
+            lines = np.empty((nlines, 49), dtype=np.uint8)
+            lines[:, :48] = chars[head:head+4*nlines].reshape(nlines, 48)
+            lines[:, 48] = ord("\n")
+            f.write(lines.tobytes().decode('ascii'))
+        if rest:
+            f.write(chars[n-rest:].tobytes().decode('ascii'))
+        self._count = count + rest
+
+    def _transform(self, values, name, out=None, group=None, jd=None):
+        # Unit conversion, logarithm and treatment of the invalid values
+        # of a grid, or of rows jd, jd+1, ... of a table, in the out buffer.
+        label, erg = self._labels[name]
+        values = np.asarray(values, dtype=float)
+        if out is None:
+            out = np.empty(values.shape)
+        if erg:
+            np.multiply(values, ERG_TO_JOULE, out=out)
+        else:
+            out[...] = values
+        nonpos = None
+        if name in self.log:
+            nonpos = ~(out > 0.0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                np.log10(out, out=out)
+        mag = np.abs(out)
+        out[mag < self.MIN_VALUE] = 0.0
+        bad = ~(mag <= self.MAX_VALUE)
+        if nonpos is not None:
+            bad |= nonpos
+        if not bad.any():
+            return out
+
+        floor = self.floor
+        if floor is None:
+            floor = np.log10(self.MIN_VALUE) if name in self.log else 0.0
+        hint = ('Try writing it in log format or use '
+                if name not in self.log else 'Use ')
+        return utils.treat_invalid_values(out, bad, values, label,
+                                          self.invalid, floor, nonpos,
+                                          self.MAX_VALUE, group, jd,
+                                          hint=hint)
+
+    def _write_grid(self, name, values):
+        self._write_values(self._transform(values, name),
+                           self._labels[name][0])
+        self._end_block()
+
+    def _write_constant(self, value, n, name):
+        # Writes n times the same value, rendered once, by whole lines.
+        f = self.f
+        string = _ionmix_format(value, name)
+        head = min(n, (4 - self._count) % 4)
+        f.write(string*head)
+        n -= head
+        self._count += head
+        if self._count == 4:
+            f.write("\n")
+            self._count = 0
+        nlines, rest = divmod(n, 4)
+        line = string*4 + "\n"
+        for i in range(0, nlines, self.CONSTANT_LINES):
+            f.write(line*min(self.CONSTANT_LINES, nlines - i))
+        f.write(string*rest)
+        self._count += rest
+
+    def _end_block(self):
+        if self._count != 0: self.f.write("\n")
+        self._count = 0
+
+    @profiling.timed('IonmixWriter.write_block')
+    def _write_block(self, name, group, val):
+        label, erg = self._labels[name]
+        shape = (self.ndens, self.ntemps)
+        profiling.add(count=self.ndens*self.ntemps)
+        if group == 0 and name == self.OPACS[0][0]:
+            # The group bounds precede the opacities.
+            self._write_grid('opac_bounds', self._opac_bounds)
+        if val is None:
+            # Missing blocks are written as zeros.
+            self._write_constant(0.0, shape[0]*shape[1], label)
+        elif np.shape(val) != shape:
+            if group is None:
+                raise ValueError('Table {0} has shape {1}, expected '
+                                 '{2}!'.format(name, str(np.shape(val)),
+                                               str(shape)))
+            raise ValueError('Group {0} of table {1} has shape {2}, expected '
+                             '{3}!'.format(group, name, str(np.shape(val)),
+                                           str(shape)))
+        elif isinstance(val, np.ndarray) and not any(val.strides):
+            # Constant (broadcast) table, e.g. placeholder zeros.
+            value = self._transform(val[:1, :1], name, group=group, jd=0)
+            self._write_constant(value[0, 0], shape[0]*shape[1], label)
+        else:
+            # Converted by chunks of rows in a buffer, to avoid temporary
+            # copies of the whole table.
+            nrows = len(self._buf)
+            for jd in range(0, shape[0], nrows):
+                rows = np.asarray(val[jd:jd+nrows])
+                self._write_values(self._transform(rows, name,
+                                                   self._buf[:len(rows)],
+                                                   group, jd), label)
+        if group is None or group == self.ngroups - 1:
+            self._end_block()
+
+    def _advance(self, index):
+        # Write the blocks up to index (excluded) that were not given.
+        while self._next < index:
+            name, group = self._blocks[self._next]
+            self._write_block(name, group, None)
+            self._next += 1
+
+    def write(self, name, val, group=None):
+        """
+        Write a block.
 
-        arr = np.zeros((nt+1))
-        arr[1:] = self.temps[:]
-        self.temps = arr
+        Parameters
+        ----------
+        name : str
+            Name of the table (``writeIonmixFile`` argument).
+        val : numpy.ndarray
+            2D table of shape ``(ndens, ntemps)``, opacity plane of shape
+            ``(ndens, ntemps)`` if ``group`` is given, or full opacity
+            cube of shape ``(ndens, ntemps, ngroups)``.
+        group : int
+            Group of an opacity plane.
+        """
+        opacs = [opac for opac, _ in self.OPACS]
+        if name in opacs and group is None:
+            if np.shape(val) != (self.ndens, self.ntemps, self.ngroups):
+                raise ValueError('Table {0} has shape {1}, expected {2}!'
+                                 .format(name, str(np.shape(val)),
+                                         str((self.ndens, self.ntemps,
+                                              self.ngroups))))
+            for g in range(self.ngroups):
+                self.write(name, val[:, :, g], group=g)
+            return
+        try:
+            index = self._blocks.index((name, group))
+        except ValueError:
+            raise ValueError('Unknown IONMIX block {0} (group {1})!'
+                             .format(name, group))
+        if index < self._next:
+            raise ValueError('Block {0} (group {1}) is out of order, the '
+                             'blocks must be written in the order of the '
+                             'IONMIX file!'.format(name, group))
+        self._advance(index)
+        self._write_block(name, group, val)
+        self._next += 1
+
+    def write_blocks(self, blocks):
+        """
+        Write a sequence of ``(name, group, val)`` blocks (see ``write``).
+        """
+        for name, group, val in blocks:
+            self.write(name, val, group=group)
 
-        self.ntemp += 1
+    def close(self):
+        """
+        Write the missing blocks and close the file.
+        """
+        self._advance(len(self._blocks))
+        if self.ngroups == 0:
+            # The group bounds are written even without groups.
+            self._write_grid('opac_bounds', self._opac_bounds)
+        profiling.add(nbytes=self.f.tell())
+        self.f.close()
 
 
+@profiling.timed('writeIonmixFile')
 def writeIonmixFile(fn, zvals, fracs, numDens, temps,
                     zbar=None,  dzdt=None, pion=None, pele=None,
                     dpidt=None, dpedt=None, eion=None, eele=None,
                     cvion=None, cvele=None, deidn=None, deedn=None,
                     ngroups=None, opac_bounds=None,
                     rosseland=None, planck_absorb=None, planck_emiss=None,
-                    sele=None):
+                    sele=None, log=None, invalid='fail', floor=None):
     """
     ``opacplot2.writeIonmixFile()`` provides an explicit and flexible
     way to write IONMIX files.
@@ -568,6 +978,14 @@ def writeIonmixFile(fn, zvals, fracs, numDens, temps,
        Planck emission opacity. Only used for tabulated EoS in *FLASH*.
     sele=None : numpy.ndarray
         Electron entropy.
+    log=None : list
+        Names of the arguments to write as base 10 logarithms, see
+        :class:`IonmixWriter`.
+    invalid='fail' : str
+        Treatment of NaN, infinite and out of range values (``'fail'``,
+        ``'clip'`` or ``'floor'``), see :class:`IonmixWriter`.
+    floor=None : float
+        Replacement value for ``invalid='clip'`` or ``'floor'``.
 
     Examples
     --------
@@ -586,129 +1004,16 @@ def writeIonmixFile(fn, zvals, fracs, numDens, temps,
                        planck_emiss=op['emp_mg'][:])
     """
 
-    ndens, ntemps = len(numDens), len(temps)
-
-    if  zbar is None:  zbar = np.zeros((ndens,ntemps))
-    if  dzdt is None:  dzdt = np.zeros((ndens,ntemps))
-    if  pion is None:  pion = np.zeros((ndens,ntemps))
-    if  pele is None:  pele = np.zeros((ndens,ntemps))
-    if dpidt is None: dpidt = np.zeros((ndens,ntemps))
-    if dpedt is None: dpedt = np.zeros((ndens,ntemps))
-    if  eion is None:  eion = np.zeros((ndens,ntemps))
-    if  eele is None:  eele = np.zeros((ndens,ntemps))
-    if cvion is None: cvion = np.zeros((ndens,ntemps))
-    if cvele is None: cvele = np.zeros((ndens,ntemps))
-    if deidn is None: deidn = np.zeros((ndens,ntemps))
-    if deedn is None: deedn = np.zeros((ndens,ntemps))
-
-    if ngroups is None:
-        ngroups = 0
-    if opac_bounds   is None: opac_bounds = (0.0,1.0)
-    if rosseland     is None: rosseland = np.zeros((ndens,ntemps,ngroups))
-    if planck_absorb is None: planck_absorb = np.zeros((ndens,ntemps,ngroups))
-    if planck_emiss  is None: planck_emiss = np.zeros((ndens,ntemps,ngroups))
-
-    for tab in ["zbar", "dzdt", "pion", "pele", "dpidt", "dpedt", "eion",
-            "eele", "cvion", "cvele", "deidn", "deedn"]:
-        ctab = locals()[tab]
-        if ctab.shape != (ndens, ntemps):
-            raise ValueError('Table {0} has shape {1}, expected {2}!'.format(
-                tab, str(ctab.shape), str((ndens, ntemps))))
-    for tab in ['rosseland', 'planck_absorb', 'planck_emiss']:
-        ctab = locals()[tab]
-        if ctab.shape != (ndens, ntemps, ngroups):
-            raise ValueError('Table {0} has shape {1}, expected {2}!'.format(
-                tab, str(ctab.shape), str((ndens, ntemps, ngroups))))
-
-    # Write the header:
-    f = open(fn,'w')
-    f.write("%10i%10i\n" % (ntemps,ndens))
-    f.write(" atomic #s of gases: ")
-    for z in zvals: f.write("%10i" % z)
-    f.write("\n relative fractions: ")
-    for frac in fracs: f.write("%10.2E" % frac)
-    f.write("\n")
-
-    # Write temperature/density grid and number of groups:
-    # name argument is for error reporting purposes.
-    def convert(num, name):
-        string_org = "%12.5E" % (num)
-        negative = (string_org[0] == "-")
-        lead = "-." if negative else "0."
-        string = lead + string_org[1] + string_org[3:8] + "E"
-
-        # Deal with the exponent:
-
-        # Check for zero:
-        try:
-            if int(string_org[1] + string_org[3:8]) == 0:
-                return string + "+00"
-        except ValueError:
-            raise ValueError('There was a problem writing the data in '
-                             'the {} block to IONMIX. Try writing it in '
-                             'log format.'.format(name))
-
-        # Not zero:
-        expo = int(string_org[9:]) + 1
-        if expo < 0:
-            string += "-"
-        else:
-            string += "+"
-        string += "%02d" % abs(expo)
-        return string
-
-    def write_block(var, name):
-        count = 0
-        for n in range(len(var)):
-            count += 1
-
-            f.write("%s" % convert(var[n], name))
-
-            if count == 4:
-                count = 0
-                f.write("\n")
-
-        if count != 0: f.write("\n")
-
-    def write_opac_block(var, name):
-        count = 0
-        for g in range(ngroups):
-            for jd in range(ndens):
-                for jt in range(ntemps):
-                    count += 1
-
-                    f.write("%s" % convert(var[jd,jt,g], name))
-
-                    if count == 4:
-                        count = 0
-                        f.write("\n")
-
-        if count != 0: f.write("\n")
-
-    f.write("%12i\n" % ngroups)
-
-    write_block(temps, 'temperature')
-    write_block(numDens, 'number density')
-
-    write_block(zbar.flatten(), 'average ionization')
-
-    write_block(dzdt.flatten(), 'DZ_DT')
-    write_block(pion.flatten()*ERG_TO_JOULE, 'ion pressure')
-    write_block(pele.flatten()*ERG_TO_JOULE, 'electron pressure')
-    write_block(dpidt.flatten()*ERG_TO_JOULE, 'D(ion pressure)_DT')
-    write_block(dpedt.flatten()*ERG_TO_JOULE, 'D(electron pressure)_DT')
-    write_block(eion.flatten()*ERG_TO_JOULE, 'ion energy')
-    write_block(eele.flatten()*ERG_TO_JOULE, 'electron energy')
-    write_block(cvion.flatten()*ERG_TO_JOULE, 'ion CV')
-    write_block(cvele.flatten()*ERG_TO_JOULE, 'electron CV')
-    write_block(deidn.flatten()*ERG_TO_JOULE, 'D(ion energy)_DT')
-    write_block(deedn.flatten()*ERG_TO_JOULE, 'D(electron energy)_DT')
-
-    # Check for electron entropy (if it is there):
-    if sele is not None: write_block(sele.flatten()*ERG_TO_JOULE,
-                                 'electron entropy')
-
-    write_block(opac_bounds, 'opacity bounds')
-    write_opac_block(rosseland, 'rosseland opacity')
-    write_opac_block(planck_absorb, 'planck absorption')
-    write_opac_block(planck_emiss, 'planck emissivity')
+    blocks = [(name, None, val) for name, val in
+              [('zbar', zbar), ('dzdt', dzdt), ('pion', pion), ('pele', pele),
+               ('dpidt', dpidt), ('dpedt', dpedt), ('eion', eion),
+               ('eele', eele), ('cvion', cvion), ('cvele', cvele),
+               ('deidn', deidn), ('deedn', deedn), ('sele', sele),
+               ('rosseland', rosseland), ('planck_absorb', planck_absorb),
+               ('planck_emiss', planck_emiss)]
+              if val is not None]
+
+    with IonmixWriter(fn, zvals, fracs, numDens, temps, ngroups=ngroups,
+                      opac_bounds=opac_bounds, sele=sele is not None,
+                      log=log, invalid=invalid, floor=floor) as imx:
+        imx.write_blocks(blocks)
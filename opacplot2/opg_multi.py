@@ -15,6 +15,7 @@ import gzip
 import codecs
 
 from .constants import NA
+from . import profiling
 
 import six
 import periodictable as ptab
@@ -83,6 +84,7 @@ class OpgMulti(dict):
     _op_labels = dict(opp='PLANCK M', opr='ROSSELAND M', eps='EPS M ', opz='')
 
     @classmethod
+    @profiling.timed('OpgMulti.open_file')
     def open_file(cls, folder, base_name, verbose=True):
         """
         Parse MULTI format from a file.
@@ -121,6 +123,7 @@ class OpgMulti(dict):
         self.table_name = {'opz': _id+'2017', 'opp': _id+'3017',
                                 'eps': _id+'5017', 'opr': _id+'4017'}
 
+    @profiling.timed('OpgMulti.parse')
     def _parse(self, path, tabletype):
         """
         Parse MULTIv5 opacity/ionization file
@@ -131,6 +134,7 @@ class OpgMulti(dict):
           - tabletype [str]: table type, one of ('opp', 'opr', 'eps', 'opz')
 
         """
+        profiling.add(nbytes=os.path.getsize(path))
         if os.path.splitext(path)[1] == '.gz':
             zf = gzip.open(path, 'r')
             reader = codecs.getreader("utf-8")
@@ -219,6 +223,7 @@ class OpgMulti(dict):
                                             (len(idx), len(self['temp']), len(self['dens'])))).T
         f.close()
 
+    @profiling.timed('OpgMulti.write')
     def write(self, prefix, fmin=None, fmax=None):
         """
         Write multigroup opacities to files specified by a prefix.
@@ -390,6 +395,7 @@ class OpgMulti(dict):
             setattr(f.root._v_attrs,attr, self[attr])
         f.close()
 
+    @profiling.timed('OpgMulti.toEosDict')
     def toEosDict(self, Znum=None, Anum=None, Xnum=None, log=None):
         """
         This method creates a dictionary with keys that are common among
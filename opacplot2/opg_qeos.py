@@ -5,6 +5,7 @@ from __future__ import print_function
 
 import numpy as np
 from .constants import KELVIN_TO_EV, GPA_TO_ERGCC, MJKG_TO_ERGG
+from . import profiling
 
 class OpgQeos:
     """
@@ -48,6 +49,7 @@ class OpgQeos:
 
         return data
 
+    @profiling.timed('OpgQeos.parse')
     def parse(self):
 
         # Read the table id:
@@ -117,3 +119,5 @@ class OpgQeos:
             # I believe that energies are in MJ/kg:
             self.eint = self.getblock() * MJKG_TO_ERGG
             self.efree = self.getblock()
+
+        profiling.add(nbytes=self.fhand.tell())
@@ -11,6 +11,7 @@ import opacplot2.utils
 
 import numpy as np
 from .constants import KELVIN_TO_EV, GPA_TO_ERGCC, MJKG_TO_ERGCC
+from . import profiling
 
 import periodictable as ptab
 
@@ -101,6 +102,7 @@ class OpgSesame:
         self.parse()
 
 
+    @profiling.timed('OpgSesame.parse')
     def parse(self):
 
         while True:
@@ -129,11 +131,13 @@ class OpgSesame:
 
 
             self.fdict[recid](nentries,matid, recid)
+            profiling.add(count=nentries)
 
             if matid not in self.recs.keys():
                 self.recs[matid] = [recid]
             else:
                 self.recs[matid] = self.recs[matid] + [recid]
+        profiling.add(nbytes=self.fhand.tell())
 
     def parseComment(self, nentries, matid, recid):
 
@@ -243,6 +247,7 @@ class OpgSesame:
     def parseTcond(self, nentries, matid, recid):
         words = self.readEntries(nentries)
 
+    @profiling.timed('OpgSesame.readEntries')
     def readEntries(self,nentries):
         nlines = (nentries-1) // self.WORDS_PER_LINE + 1
 
@@ -259,17 +264,11 @@ class OpgSesame:
 
         return data
 
+    @profiling.timed('OpgSesame.toEosDict')
     def toEosDict(self, Znum=None, Anum=None,
                   Xnum=None, qeos=False, log=None,
                   filter_dens=0., filter_temps=0.,
                   tabnum=None):
-        # For SESAME, we need the hedp package to calculate zbar.
-        try:
-            from hedp import eos
-        except ImportError:
-            raise ImportError('You need the hedp module. You can get it here: '
-                              'https://github.com/luli/hedp.')
-
         if tabnum is None:
             # Select the last table (newest) table available.
             opp_ses_data = self.data[sorted(self.data.keys())[-1]]
@@ -284,7 +283,7 @@ class OpgSesame:
         # Information about filtering dens/temp grids is available here:
         # http://flash.uchicago.edu/pipermail/flash-users/2015-April/001689.html
         # We must filter dens > 0. in order to avoid problems with calculating
-        # zbar below, since eos.thomas_fermi_ionization() returns `nan` where
+        # zbar below, since thomas_fermi_ionization() returns `nan` where
         # density is 0.
         if not qeos:
             opp_ses_data = opp.utils.EosMergeGrids(
@@ -335,12 +334,12 @@ class OpgSesame:
         # Calculate zbar using thomas_fermi_ionization.
         # If there are multiple elements, it suffices to use the average
         # atomic number in this calculation - JTL
-        dens_arr, temp_arr = np.meshgrid(opp_ses_data['ele_dens'],
-                                         opp_ses_data['ele_temps'])
-        zbar = eos.thomas_fermi_ionization(dens_arr,
-                                           temp_arr,
-                                           np.average(opp_ses_data['Znum'], weights=opp_ses_data['Xnum']),
-                                           opp_ses_data['abar']).T
+        zbar = opp.utils.thomas_fermi_ionization_grid(
+                            opp_ses_data['ele_dens'],
+                            opp_ses_data['ele_temps'],
+                            np.average(opp_ses_data['Znum'],
+                                       weights=opp_ses_data['Xnum']),
+                            opp_ses_data['abar'])
         opp_ses_data['zbar'] = zbar
 
         # Translating SESAME names to common dictionary format.
@@ -4,6 +4,8 @@ from os.path import splitext
 from io import StringIO
 import periodictable
 
+from . import profiling
+
 # Avogadros number
 NA = 6.0221415e+23
 
@@ -36,6 +38,7 @@ def tops_html2text(filename):
 
 
 class OpgTOPS():
+    @profiling.timed('OpgTOPS.read')
     def __init__(self, filename, ep_max='auto', handle_large='next_group'):
         """
         Parse TOPS Opacities (no unit conversion for this intialization)
@@ -103,7 +106,7 @@ class OpgTOPS():
                                                      'S2', 'i4']
                                          }
                                   )
-                dats.reshape(self.Nm)
+                dats = dats.reshape(self.Nm)
                 self.Xnum = dats['Xnum']
                 self.Massfrac = dats['Massfrac']
                 self.Znum = dats['Znum']
@@ -243,6 +246,7 @@ class OpgTOPS():
                         if self.plnk_mg[d, t, g] == 1e10:
                             self.plnk_mg[d, t, g] = self.plnk_mg[d, t, g+1]
 
+    @profiling.timed('OpgTOPS.toEosDict')
     def toEosDict(self, fill_eos=False):
         names_dict_req_tops = {
             'idens': 'nion',
@@ -287,9 +291,11 @@ class OpgTOPS():
         eos_dict['temp'] = eos_dict['temp'] * 1e3
         eos_dict['groups'] = eos_dict['groups'] * 1e3
 
-        # Fill zeros for EOS
+        # Fill zeros for EOS. The tables are read-only views of a single
+        # zero, which the writers do not expand.
         if fill_eos:
+            zeros = np.broadcast_to(0.0, np.shape(eos_dict['Zf_DT']))
             for eos_key in names_list_req_eos:
-                eos_dict[eos_key] = np.zeros_like(eos_dict['Zf_DT'])
+                eos_dict[eos_key] = zeros
 
         return eos_dict
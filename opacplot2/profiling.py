@@ -0,0 +1,306 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+"""
+Lightweight timers and counters for the readers, writers, interpolators
+and converters.
+
+The instrumented code opens phases with :func:`timer` or :func:`timed`
+and adds bytes and counts with :func:`add` and :func:`count`. Nothing is
+recorded unless a :class:`Profiler` is active: :func:`timer` then returns
+a shared object doing nothing, so that the instrumentation costs a
+function call per phase::
+
+    >>> from opacplot2 import profiling
+    >>> with profiling.Profiler(memory=True) as prof:
+    ...     op = opp.OpgSesame('Al.ses', opp.OpgSesame.SINGLE)
+    ...     eos_dict = op.toEosDict(Znum=13)
+    >>> print(prof.format())
+    >>> prof.to_json('profile.json')
+
+Phases are nested: a phase opened inside another one is reported as
+``outer/inner``. The profiler is not thread safe.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import functools
+import json
+import time
+
+__all__ = ['Profiler', 'timer', 'timed', 'add', 'count', 'active',
+           'merge_reports', 'format_report']
+
+_timer = getattr(time, 'perf_counter', time.time)
+
+# Active profiler, None when profiling is disabled.
+_active = None
+
+
+class _NullPhase(object):
+    # Returned by timer() when profiling is disabled.
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, nbytes=0, count=0):
+        pass
+
+_NULL_PHASE = _NullPhase()
+
+
+def _new_record():
+    return {'calls': 0, 'time': 0.0, 'bytes': 0, 'count': 0,
+            'alloc': None, 'peak': None}
+
+
+class _Phase(object):
+    def __init__(self, prof, name, nbytes, count):
+        self.prof = prof
+        self.name = name
+        self.nbytes = nbytes
+        self.count = count
+
+    def add(self, nbytes=0, count=0):
+        """Adds bytes processed and items counted to the phase."""
+        self.nbytes += nbytes
+        self.count += count
+
+    def __enter__(self):
+        prof = self.prof
+        prof._stack.append(self)
+        self.path = '/'.join(phase.name for phase in prof._stack)
+        if prof._tracemalloc is not None:
+            self.mem = prof._tracemalloc.get_traced_memory()
+        self.t0 = _timer()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = _timer() - self.t0
+        prof = self.prof
+        prof._stack.pop()
+        rec = prof._records.setdefault(self.path, _new_record())
+        rec['calls'] += 1
+        rec['time'] += elapsed
+        rec['bytes'] += self.nbytes
+        rec['count'] += self.count
+        if prof._tracemalloc is not None:
+            cur0, peak0 = self.mem
+            cur, peak = prof._tracemalloc.get_traced_memory()
+            # The peak of the phase is only known when it sets a new peak,
+            # the memory kept at the end of the phase is a lower bound.
+            peak = peak - cur0 if peak > peak0 else max(cur - cur0, 0)
+            rec['alloc'] = (rec['alloc'] or 0) + cur - cur0
+            rec['peak'] = max(rec['peak'] or 0, peak)
+        return False
+
+
+class Profiler(object):
+    """
+    Collects the timings of the instrumented phases while it is active.
+
+    Parameters
+    ----------
+    memory : bool
+        Also trace the memory allocations of the phases with
+        ``tracemalloc``, which slows down the code.
+
+    Examples
+    --------
+    ::
+
+       >>> with profiling.Profiler() as prof:
+       ...     imx = opp.OpacIonmix('Al.cn4', 26.98/opp.NA, twot=True,
+       ...                          man=True)
+       >>> prof.report()['phases']['OpacIonmix.read']['time']
+    """
+    def __init__(self, memory=False):
+        self.memory = memory
+        self._records = {}
+        self._stack = []
+        self._tracemalloc = None
+        self._started = False
+        self._previous = None
+        self._t0 = None
+        self.elapsed = 0.0
+
+    def __enter__(self):
+        global _active
+        if self.memory:
+            try:
+                import tracemalloc
+            except ImportError:
+                pass
+            else:
+                self._tracemalloc = tracemalloc
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                    self._started = True
+        self._previous = _active
+        _active = self
+        self._t0 = _timer()
+        return self
+
+    def __exit__(self, *exc):
+        global _active
+        self.elapsed += _timer() - self._t0
+        _active = self._previous
+        if self._started:
+            self._tracemalloc.stop()
+            self._started = False
+        self._tracemalloc = None
+        return False
+
+    def timer(self, name, nbytes=0, count=0):
+        """Phase recorded by this profiler, see :func:`timer`."""
+        return _Phase(self, name, nbytes, count)
+
+    def count(self, name, n=1, nbytes=0):
+        """Counter recorded by this profiler, see :func:`count`."""
+        path = '/'.join([phase.name for phase in self._stack] + [name])
+        rec = self._records.setdefault(path, _new_record())
+        rec['count'] += n
+        rec['bytes'] += nbytes
+
+    def report(self):
+        """
+        Report of the phases.
+
+        Returns
+        -------
+        dict
+            ``{'elapsed': s, 'memory': bool, 'phases': {path: record}}``,
+            each record holding the number of ``calls``, the total
+            ``time`` (s, including the nested phases), the ``bytes`` read
+            or written, the ``count`` of items (records, groups, ...) and,
+            with ``memory``, the bytes allocated and not freed (``alloc``)
+            and the ``peak`` of the allocations above the start of the
+            phase.
+        """
+        return {'elapsed': self.elapsed, 'memory': self.memory,
+                'phases': dict((path, dict(rec)) for path, rec in
+                               self._records.items())}
+
+    def to_json(self, filename=None, **kwargs):
+        """
+        Report as a JSON string, also written to ``filename`` if given.
+        """
+        txt = json.dumps(self.report(), sort_keys=True, **kwargs)
+        if filename is not None:
+            with open(filename, 'w') as f:
+                f.write(txt + '\n')
+        return txt
+
+    def format(self):
+        """Report as a table, see :func:`format_report`."""
+        return format_report(self.report())
+
+
+def active():
+    """Active profiler, or None when profiling is disabled."""
+    return _active
+
+
+def timer(name, nbytes=0, count=0):
+    """
+    Context manager timing a phase of the active profiler.
+
+    Parameters
+    ----------
+    name : str
+        Name of the phase, e.g. ``'OpgSesame.parse'``.
+    nbytes : int
+        Bytes read or written during the phase. More bytes and counts can
+        be added with the ``add(nbytes, count)`` method of the phase.
+    count : int
+        Number of items processed during the phase.
+
+    Examples
+    --------
+    ::
+
+       >>> with profiling.timer('OpgQeos.parse') as phase:
+       ...     ...
+       ...     phase.add(nbytes=os.path.getsize(filename))
+    """
+    if _active is None:
+        return _NULL_PHASE
+    return _active.timer(name, nbytes, count)
+
+
+def timed(name):
+    """
+    Decorator timing each call of a function as a phase, see
+    :func:`timer`.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return func(*args, **kwargs)
+            with _active.timer(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def add(nbytes=0, count=0):
+    """
+    Adds bytes read or written and items processed to the innermost phase
+    of the active profiler.
+    """
+    if _active is not None and _active._stack:
+        _active._stack[-1].add(nbytes, count)
+
+
+def count(name, n=1, nbytes=0):
+    """
+    Adds ``n`` items (and ``nbytes`` bytes) to a counter of the active
+    profiler, within the current phase.
+    """
+    if _active is not None:
+        _active.count(name, n, nbytes)
+
+
+def merge_reports(reports):
+    """
+    Sums several reports (e.g. of the tables converted by different
+    processes).
+    """
+    merged = {'elapsed': 0.0, 'memory': False, 'phases': {}}
+    for rep in reports:
+        merged['elapsed'] += rep['elapsed']
+        merged['memory'] = merged['memory'] or rep['memory']
+        for path, rec in rep['phases'].items():
+            out = merged['phases'].setdefault(path, _new_record())
+            for key in ['calls', 'time', 'bytes', 'count']:
+                out[key] += rec[key]
+            if rec['alloc'] is not None:
+                out['alloc'] = (out['alloc'] or 0) + rec['alloc']
+                out['peak'] = max(out['peak'] or 0, rec['peak'])
+    return merged
+
+
+def format_report(report):
+    """
+    Table of a report, one line per phase, the nested phases being
+    indented below their parent.
+    """
+    lines = ['{0:40s}{1:>7s}{2:>10s}{3:>7s}{4:>10s}{5:>10s}'.format(
+        'phase', 'calls', 'time [s]', '%', 'MB', 'peak [MB]')]
+    elapsed = report['elapsed'] or 1.0
+    for path in sorted(report['phases'], key=lambda p: p.split('/')):
+        rec = report['phases'][path]
+        depth = path.count('/')
+        name = '  '*depth + path.rsplit('/', 1)[-1]
+        peak = '-' if rec['peak'] is None else \
+               '{0:.1f}'.format(rec['peak']/2.**20)
+        lines.append('{0:40s}{1:7d}{2:10.4f}{3:7.1f}{4:10.2f}{5:>10s}'.format(
+            name, rec['calls'] or rec['count'], rec['time'],
+            100*rec['time']/elapsed, rec['bytes']/2.**20, peak))
+    lines.append('Total time: {0:.4f} s'.format(report['elapsed']))
+    return '\n'.join(lines)
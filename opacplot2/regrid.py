@@ -0,0 +1,492 @@
+"""
+Re-gridding of tables defined on rectilinear (density, temperature) grids.
+
+Tables of shape ``(ndens, ntemp[, ngroups, ...])`` are resampled onto a
+target grid one axis at a time: the interpolation indexes and weights are
+computed once per pair of axes, and each pass is a gather and an axpy over
+the whole table. This is O(N) in the number of points, as opposed to
+triangulating the scattered (dens, temp) points.
+"""
+from __future__ import division
+
+import numpy as np
+
+from . import profiling
+
+__all__ = ['overlap_axis', 'union_axis', 'AxisWeights', 'RectRegrid',
+           'regrid', 'GroupRebin', 'extend_grid', 'extend_eos_dict']
+
+_EXTRAP = ['nearest', 'linear', 'nan']
+
+
+def _as_axis(arr, name='axis'):
+    arr = np.asarray(arr, dtype=float)
+    if arr.ndim != 1 or len(arr) == 0:
+        raise ValueError('{0} must be a non empty 1D array!'.format(name))
+    if np.any(np.diff(arr) <= 0):
+        raise ValueError('{0} must be strictly increasing!'.format(name))
+    return arr
+
+
+def overlap_axis(arr_1, arr_2):
+    """
+    Union of the values of two sorted axes that are within the intersection
+    of their ranges.
+
+    Parameters
+    ----------
+    arr_1 : numpy.ndarray
+        1D sorted array number 1.
+    arr_2 : numpy.ndarray
+        1D sorted array number 2.
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted unique values, or ``None`` if the ranges do not overlap.
+
+    Examples
+    --------
+    >>> overlap_axis([1, 2, 3, 4, 5], [3.5, 4.5, 5.5, 6])
+    array([3.5, 4. , 4.5, 5. ])
+    """
+    arr_1 = np.asarray(arr_1, dtype=float)
+    arr_2 = np.asarray(arr_2, dtype=float)
+    lo = max(arr_1[0], arr_2[0])
+    hi = min(arr_1[-1], arr_2[-1])
+    if lo > hi:
+        return None
+    return np.union1d(arr_1[(arr_1 >= lo) & (arr_1 <= hi)],
+                      arr_2[(arr_2 >= lo) & (arr_2 <= hi)])
+
+
+def union_axis(arr_1, arr_2):
+    """
+    Union of the values of two sorted axes, over the union of their ranges.
+
+    Parameters
+    ----------
+    arr_1 : numpy.ndarray
+        1D sorted array number 1.
+    arr_2 : numpy.ndarray
+        1D sorted array number 2.
+
+    Returns
+    -------
+    numpy.ndarray
+        Sorted unique values.
+    """
+    return np.union1d(np.asarray(arr_1, dtype=float),
+                      np.asarray(arr_2, dtype=float))
+
+
+class AxisWeights(object):
+    """
+    Linear interpolation weights from a source axis to a target axis.
+
+    Parameters
+    ----------
+    src : numpy.ndarray
+        Strictly increasing source axis.
+    dst : numpy.ndarray
+        Target points.
+    log : bool
+        Interpolate in log of the coordinate (log-linear interpolation).
+    extrap : str
+        Treatment of the target points outside of the source axis:
+        ``'nearest'`` uses the boundary value, ``'linear'`` extends the
+        boundary cell and ``'nan'`` returns NaN.
+
+    Attributes
+    ----------
+    idx : numpy.ndarray
+        Index of the left node of the cell of each target point.
+    w : numpy.ndarray
+        Weight of the right node.
+    outside : numpy.ndarray or None
+        Mask of the target points outside of the source axis when
+        ``extrap='nan'``.
+    """
+    def __init__(self, src, dst, log=False, extrap='nearest'):
+        if extrap not in _EXTRAP:
+            raise ValueError('extrap must be one of {0}!'.format(_EXTRAP))
+        src = _as_axis(src, 'src')
+        dst = np.asarray(dst, dtype=float)
+        if log:
+            if np.any(src <= 0) or np.any(dst <= 0):
+                raise ValueError('Log interpolation needs positive '
+                                 'coordinates!')
+            src, dst = np.log(src), np.log(dst)
+
+        self.outside = None
+        if len(src) == 1:
+            # Degenerate axis, constant along it.
+            self.idx = np.zeros(dst.shape, dtype=np.intp)
+            self.w = np.zeros(dst.shape)
+            self._single = True
+        else:
+            self.idx = np.clip(np.searchsorted(src, dst, side='right') - 1,
+                               0, len(src) - 2)
+            x0 = src[self.idx]
+            self.w = (dst - x0)/(src[self.idx + 1] - x0)
+            if extrap != 'linear':
+                self.w = np.clip(self.w, 0.0, 1.0)
+            self._single = False
+        if extrap == 'nan':
+            outside = (dst < src[0]) | (dst > src[-1])
+            if np.any(outside):
+                self.outside = outside
+        self.size = len(dst)
+
+    def apply(self, table, axis=0):
+        """
+        Interpolate ``table`` along ``axis``.
+
+        Parameters
+        ----------
+        table : numpy.ndarray
+            Values on the source axis along ``axis``.
+        axis : int
+            Axis of ``table`` to resample.
+
+        Returns
+        -------
+        numpy.ndarray
+            Values on the target axis along ``axis``.
+        """
+        table = np.moveaxis(np.asarray(table), axis, 0)
+        shape = (-1,) + (1,)*(table.ndim - 1)
+        v0 = table[self.idx]
+        if self._single:
+            out = v0.astype(float)
+        else:
+            v1 = table[self.idx + 1]
+            w = self.w.reshape(shape)
+            out = v0 + w*(v1 - v0)
+            # Exact values on the nodes (no round off, no inf - inf).
+            out = np.where(w == 0.0, v0, np.where(w == 1.0, v1, out))
+        if self.outside is not None:
+            out[self.outside] = np.nan
+        return np.moveaxis(out, 0, axis)
+
+
+class RectRegrid(object):
+    """
+    Separable interpolation from one rectilinear (dens, temp) grid to
+    another.
+
+    The weights are computed once, the instance can then be applied to
+    any number of tables of shape ``(ndens, ntemp, ...)``, trailing axes
+    (e.g. photon groups) being carried along.
+
+    Parameters
+    ----------
+    dens, temp : numpy.ndarray
+        Source axes.
+    dens_new, temp_new : numpy.ndarray
+        Target axes.
+    logd, logt : bool
+        Interpolate in log of the density/temperature.
+    extrap : str
+        See :class:`AxisWeights`.
+
+    Examples
+    --------
+    >>> rg = RectRegrid(dens, temp, dens_new, temp_new, logd=True, logt=True)
+    >>> pres_new = rg(pres)
+    >>> opac_new = rg(opac)   # (ndens, ntemp, ngroups)
+    """
+    @profiling.timed('RectRegrid.weights')
+    def __init__(self, dens, temp, dens_new, temp_new, logd=False,
+                 logt=False, extrap='nearest'):
+        self.dens = _as_axis(dens, 'dens')
+        self.temp = _as_axis(temp, 'temp')
+        self.dens_new = np.asarray(dens_new, dtype=float)
+        self.temp_new = np.asarray(temp_new, dtype=float)
+        self.wdens = AxisWeights(self.dens, self.dens_new, log=logd,
+                                 extrap=extrap)
+        self.wtemp = AxisWeights(self.temp, self.temp_new, log=logt,
+                                 extrap=extrap)
+
+    @property
+    def shape(self):
+        """Shape of the target grid."""
+        return (self.wdens.size, self.wtemp.size)
+
+    @profiling.timed('RectRegrid')
+    def __call__(self, table):
+        """
+        Resample ``table`` onto the target grid.
+
+        Parameters
+        ----------
+        table : numpy.ndarray
+            Array of shape ``(ndens, ntemp, ...)``.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape ``(ndens_new, ntemp_new, ...)``.
+        """
+        table = np.asarray(table)
+        if table.shape[:2] != (len(self.dens), len(self.temp)):
+            raise ValueError('Table shape {0} does not match the grid '
+                             '({1}, {2})!'.format(table.shape,
+                                                  len(self.dens),
+                                                  len(self.temp)))
+        profiling.add(nbytes=table.nbytes, count=table.size)
+        # Start with the pass that leaves the smaller intermediate table.
+        if self.wdens.size*len(self.temp) <= len(self.dens)*self.wtemp.size:
+            return self.wtemp.apply(self.wdens.apply(table, 0), 1)
+        return self.wdens.apply(self.wtemp.apply(table, 1), 0)
+
+
+def regrid(table, dens, temp, dens_new, temp_new, logd=False, logt=False,
+           extrap='nearest'):
+    """
+    Resample a ``(dens, temp[, group])`` table onto another rectilinear grid.
+
+    Shorthand for ``RectRegrid(dens, temp, dens_new, temp_new, ...)(table)``,
+    use :class:`RectRegrid` directly to resample several tables.
+
+    Parameters
+    ----------
+    table : numpy.ndarray
+        Array of shape ``(ndens, ntemp, ...)``.
+    dens, temp : numpy.ndarray
+        Source axes.
+    dens_new, temp_new : numpy.ndarray
+        Target axes.
+    logd, logt : bool
+        Interpolate in log of the density/temperature.
+    extrap : str
+        See :class:`AxisWeights`.
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of shape ``(ndens_new, ntemp_new, ...)``.
+    """
+    return RectRegrid(dens, temp, dens_new, temp_new, logd=logd, logt=logt,
+                      extrap=extrap)(table)
+
+
+class GroupRebin(object):
+    """
+    Rebinning of multigroup opacities onto another group structure.
+
+    Each target group value is the average of the source groups it
+    overlaps, weighted by the width of the overlap. Target groups that are
+    within a single source group (e.g. with the union of the boundaries of
+    two structures) take its value.
+
+    Parameters
+    ----------
+    groups : numpy.ndarray
+        Source group boundaries (ngroups+1).
+    new_groups : numpy.ndarray
+        Target group boundaries, within the range of ``groups``.
+    harmonic : bool
+        Average the inverse opacity, as for Rosseland means.
+
+    Attributes
+    ----------
+    weights : numpy.ndarray
+        Normalized overlap matrix of shape ``(new ngroups, ngroups)``.
+    """
+    def __init__(self, groups, new_groups, harmonic=False):
+        groups = _as_axis(groups, 'groups')
+        new_groups = _as_axis(new_groups, 'new_groups')
+        lo = np.maximum(new_groups[:-1, None], groups[None, :-1])
+        hi = np.minimum(new_groups[1:, None], groups[None, 1:])
+        weights = np.clip(hi - lo, 0.0, None)
+        covered = weights.sum(axis=1)
+        if np.any(covered <= 0):
+            raise ValueError('new_groups must be within the range of '
+                             'groups!')
+        self.weights = weights/covered[:, None]
+        self.harmonic = harmonic
+        self.identity = (len(groups) == len(new_groups) and
+                         np.array_equal(groups, new_groups))
+
+    @profiling.timed('GroupRebin')
+    def __call__(self, opac, groups=slice(None)):
+        """
+        Rebin ``opac`` along its last axis.
+
+        Parameters
+        ----------
+        opac : numpy.ndarray
+            Array of shape ``(..., ngroups)``.
+        groups : slice
+            Target groups to compute, to work on the groups by chunks.
+
+        Returns
+        -------
+        numpy.ndarray
+            Array of shape ``(..., new ngroups)``.
+        """
+        weights = self.weights[groups]
+        if self.identity:
+            return np.asarray(opac)[..., groups]
+        # Only the source groups overlapping the target chunk are needed.
+        cols = np.nonzero(weights.any(axis=0))[0]
+        c0, c1 = cols[0], cols[-1] + 1
+        opac = np.asarray(opac)[..., c0:c1]
+        weights = weights[:, c0:c1]
+        if self.harmonic:
+            # Null opacities give an infinite mean free path, kept finite
+            # here so that the null weights do not make NaNs.
+            tiny = np.finfo(float).tiny
+            with np.errstate(divide='ignore', over='ignore'):
+                return 1.0/np.dot(1.0/np.maximum(opac, tiny), weights.T)
+        return np.dot(opac, weights.T)
+
+
+_PAD_MODES = ['constant', 'edge', 'linear']
+
+
+def _pad_points(axis, new, name):
+    # Split the new points into those below and above the axis.
+    new = np.unique(np.asarray(new, dtype=float))
+    inside = (new >= axis[0]) & (new <= axis[-1])
+    if np.any(inside):
+        raise ValueError('New {0} points must be outside of the grid, got '
+                         '{1}!'.format(name, new[inside]))
+    return new[new < axis[0]], new[new > axis[-1]]
+
+
+@profiling.timed('extend_grid')
+def extend_grid(tables, dens, temp, new_dens=(), new_temp=(),
+                mode='constant', value=0.0, logd=False, logt=False):
+    """
+    Extend tables beyond the bounds of their (dens, temp) grid.
+
+    Each table is allocated once with its extended shape: the original
+    values are copied in, and the new density rows, then the new
+    temperature columns (including the corners), are filled.
+
+    Parameters
+    ----------
+    tables : dict or list
+        Arrays of shape ``(ndens, ntemp, ...)``, e.g. with a trailing group
+        axis.
+    dens, temp : numpy.ndarray
+        Grid of the tables.
+    new_dens, new_temp : numpy.ndarray
+        Points to add, below or above the grid.
+    mode : str
+        ``'constant'`` fills with ``value``, ``'edge'`` repeats the
+        boundary values and ``'linear'`` extrapolates from the boundary
+        cells.
+    value : float
+        Fill value for ``mode='constant'``.
+    logd, logt : bool
+        Extrapolate linearly in log of the density/temperature.
+
+    Returns
+    -------
+    tuple
+        ``(dens, temp, tables)``, the extended grid and tables (in the same
+        container type as ``tables``).
+
+    Examples
+    --------
+    Add a zero temperature point with null values::
+
+       >>> dens, temp, tabs = extend_grid({'pele': pele}, dens, temp,
+       ...                                new_temp=[0.])
+    """
+    if mode not in _PAD_MODES:
+        raise ValueError('mode must be one of {0}!'.format(_PAD_MODES))
+    dens = _as_axis(dens, 'dens')
+    temp = _as_axis(temp, 'temp')
+    d_lo, d_hi = _pad_points(dens, new_dens, 'density')
+    t_lo, t_hi = _pad_points(temp, new_temp, 'temperature')
+    nd, nt = len(dens), len(temp)
+    d0, t0 = len(d_lo), len(t_lo)
+    dens_new = np.concatenate([d_lo, dens, d_hi])
+    temp_new = np.concatenate([t_lo, temp, t_hi])
+
+    if mode != 'constant':
+        extrap = 'nearest' if mode == 'edge' else 'linear'
+        wdens = [AxisWeights(dens, pts, log=logd, extrap=extrap)
+                 for pts in [d_lo, d_hi]]
+        wtemp = [AxisWeights(temp, pts, log=logt, extrap=extrap)
+                 for pts in [t_lo, t_hi]]
+
+    def extend(table):
+        table = np.asarray(table)
+        if table.shape[:2] != (nd, nt):
+            raise ValueError('Table shape {0} does not match the grid '
+                             '({1}, {2})!'.format(table.shape, nd, nt))
+        out = np.empty((len(dens_new), len(temp_new)) + table.shape[2:],
+                       dtype=np.result_type(table.dtype, float))
+        out[d0:d0+nd, t0:t0+nt] = table
+        if mode == 'constant':
+            out[:d0] = value
+            out[d0+nd:] = value
+            out[:, :t0] = value
+            out[:, t0+nt:] = value
+            return out
+        cols = slice(t0, t0+nt)
+        if d0:
+            out[:d0, cols] = wdens[0].apply(table, 0)
+        if len(d_hi):
+            out[d0+nd:, cols] = wdens[1].apply(table, 0)
+        # The temperature pass covers the new densities too.
+        if t0:
+            out[:, :t0] = wtemp[0].apply(out[:, cols], 1)
+        if len(t_hi):
+            out[:, t0+nt:] = wtemp[1].apply(out[:, cols], 1)
+        return out
+
+    if isinstance(tables, dict):
+        tables = dict((key, extend(tab)) for key, tab in tables.items())
+    else:
+        tables = [extend(tab) for tab in tables]
+    return dens_new, temp_new, tables
+
+
+def extend_eos_dict(eos, new_dens=(), new_temp=(), mode='constant',
+                    value=0.0, logd=False, logt=False):
+    """
+    Extend the tables of a common EoS dictionary (see ``toEosDict``)
+    beyond the bounds of its grid, in place.
+
+    All the arrays of shape ``(ndens, ntemp, ...)`` are extended with
+    :func:`extend_grid`, as well as ``dens``, ``temp`` and the ion number
+    density ``idens`` (proportional to ``dens``).
+
+    Parameters
+    ----------
+    eos : dict
+        Common EoS dictionary.
+    new_dens : numpy.ndarray
+        Mass densities to add, below or above the grid.
+    new_temp : numpy.ndarray
+        Temperatures to add, below or above the grid.
+    mode, value, logd, logt
+        See :func:`extend_grid`.
+
+    Returns
+    -------
+    dict
+        ``eos``.
+    """
+    dens = np.asarray(eos['dens'], dtype=float)
+    temp = np.asarray(eos['temp'], dtype=float)
+    keys = [key for key in eos if key not in ['dens', 'temp', 'idens']
+            and np.ndim(eos[key]) >= 2
+            and np.shape(eos[key])[:2] == (len(dens), len(temp))]
+    dens_new, temp_new, tables = extend_grid(
+        dict((key, eos[key]) for key in keys), dens, temp, new_dens,
+        new_temp, mode=mode, value=value, logd=logd, logt=logt)
+    eos.update(tables)
+    if 'idens' in eos:
+        # The ratio is taken at the largest density, which is never zero.
+        i = np.argmax(np.abs(dens))
+        eos['idens'] = dens_new*(np.asarray(eos['idens'])[i]/dens[i])
+    eos['dens'] = dens_new
+    eos['temp'] = temp_new
+    return eos
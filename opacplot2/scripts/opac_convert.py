@@ -1,11 +1,27 @@
 import opacplot2 as opp
+from opacplot2 import profiling
 import argparse
+import glob
+import hashlib
+import json
 import os.path
+import shutil
+import tempfile
+import time
+import traceback
 
-def get_input_data():
+import numpy as np
+
+# Extensions of the output formats.
+output_ext = {'ionmix': '.cn4',
+              'hdf5': '.h5',
+              'multi': '.opz.gz'}
+
+def get_input_data(argv=None):
     # Available formats.
-    avail_output_formats = ['ionmix']
-    avail_input_formats = ['propaceos', 'multi', 'sesame', 'sesame-qeos', 'tops']
+    avail_output_formats = ['ionmix', 'hdf5', 'multi']
+    avail_input_formats = ['propaceos', 'multi', 'sesame', 'sesame-qeos', 'tops',
+                           'hdf5']
 
     # Creating the argument parser.
     parser = argparse.ArgumentParser(
@@ -41,33 +57,87 @@ def get_input_data():
                         default='ionmix',
                         help='Output filetype. Default: IONMIX.')
 
-    parser.add_argument('input_file',
+    parser.add_argument('input_files',
+                        action='store', type=str, nargs='*',
+                        help='Input files or glob patterns.')
+
+    parser.add_argument('--manifest',
+                        action='store', type=str,
+                        help='File listing input files (or glob patterns), '
+                             'one per line.')
+
+    parser.add_argument('--outdir',
+                        action='store', type=str,
+                        help='Output directory. Default: same as the input.')
+
+    parser.add_argument('-j', '--jobs',
+                        action='store', type=int, default=1,
+                        help='Number of tables converted in parallel.')
+
+    parser.add_argument('--update',
                         action='store', type=str,
-                        help='Input file.')
+                        choices=['mtime', 'hash'],
+                        help='Only convert tables whose output is missing or '
+                             'older than the input (mtime) or was made from '
+                             'a different input or options (hash).')
+
+    parser.add_argument('--summary',
+                        action='store', type=str,
+                        help='Write the timing and failures of each table '
+                             'to this JSON file.')
 
     parser.add_argument('--log',
                         action='store', type=str,
                         help='Logarithmic data keys.')
 
+    parser.add_argument('--invalid',
+                        action='store', type=str, default='fail',
+                        choices=['fail', 'clip', 'floor'],
+                        help='Treatment of the NaN, infinite or out of range '
+                             'values (and non-positive values of the '
+                             'logarithmic data) in IONMIX outputs, and of '
+                             'the logarithms in HDF5 outputs.')
+
+    parser.add_argument('--floor',
+                        action='store', type=float,
+                        help='Replacement value for --invalid clip or floor.')
+
     parser.add_argument('--tabnum',
                         action='store', type=str,
                         help='Specify the SESAME table number.')
 
-    args = parser.parse_args()
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Print the time spent in each phase of the '
+                             'conversions.')
 
-    # Get the relevant paths and filenames.
-    path_in = os.path.abspath(args.input_file)
-    basedir, fn_in = os.path.split(path_in)
-    # Split filename twice in case of MULTI files (.opr.gz, etc)
-    basename = os.path.splitext(os.path.splitext(fn_in)[0])[0]
+    parser.add_argument('--profile_json',
+                        action='store', type=str,
+                        help='Write the profile report to this JSON file '
+                             '(implies --profile).')
+
+    parser.add_argument('--profile_memory',
+                        action='store_true',
+                        help='Also profile the memory allocations (slower, '
+                             'implies --profile).')
+
+    args = parser.parse_args(argv)
+
+    # Get the input files.
+    paths_in = expand_inputs(args.input_files, args.manifest,
+                             known_ext=args.input is None)
+    if not paths_in:
+        parser.error('No input file.')
+    if args.outname is not None and len(paths_in) > 1:
+        parser.error('--outname can only be used with a single input file.')
 
     # Adjusting the input.
     # Set the base output name that specified by --outname.
-    # Otherwise, set it to the same as the base input name.
+    # Otherwise, it is set for each file from the base input name.
     if args.outname is not None:
         args.outname = os.path.splitext(os.path.abspath(args.outname))[0]
-    else:
-        args.outname = os.path.join(basedir, basename)
+    if args.outdir is not None:
+        args.outdir = os.path.abspath(args.outdir)
 
     # Create lists out of the strings for Znum, Xfracs, and log if given.
     if args.Znum is not None:
@@ -84,36 +154,99 @@ def get_input_data():
         except ValueError:
             raise ValueError('Please provide a valid SESAME table number.')
 
+    if args.profile_json is not None or args.profile_memory:
+        args.profile = True
+
     input_data = {'args' : args,
-                  'basename' : basename,
-                  'path_in' : path_in,
-                  'basedir' : basedir,
-                  'fn_in' : fn_in}
+                  'paths_in' : paths_in}
 
     return input_data
 
+def split_path(path):
+    """
+    Returns the absolute path, directory, base name and file name of
+    ``path``.
+    """
+    path_in = os.path.abspath(path)
+    basedir, fn_in = os.path.split(path_in)
+    # Split filename twice in case of MULTI files (.opr.gz, etc)
+    basename = os.path.splitext(os.path.splitext(fn_in)[0])[0]
+    return path_in, basedir, basename, fn_in
+
+def get_ext(fn):
+    """
+    Returns the extension of ``fn``, skipping ``.gz``.
+    """
+    if os.path.splitext(fn)[1] == '.gz':
+        return os.path.splitext(os.path.splitext(fn)[0])[1]
+    return os.path.splitext(fn)[1]
+
+# Extensions of the files of a MULTI table.
+multi_ext = ['.eps', '.opp', '.opz', '.opr']
+
+def expand_inputs(patterns, manifest=None, known_ext=True):
+    """
+    Expands the input files, glob patterns and manifest file into a list of
+    absolute paths.
+
+    The manifest lists one file or pattern per line, relative to its
+    directory, lines starting with ``#`` being ignored. Files that would
+    be converted to the same output (e.g. the ``.opp``, ``.opr``, ... files
+    of a MULTI table) are only listed once. Patterns matching no file are
+    kept so that they are reported as failures. When a pattern matches
+    several files, only those with a known input extension are kept if
+    ``known_ext`` is set.
+    """
+    patterns = [(pattern, os.getcwd()) for pattern in patterns]
+    if manifest is not None:
+        mandir = os.path.dirname(os.path.abspath(manifest))
+        with open(manifest) as f:
+            patterns += [(line.split('#')[0].strip(), mandir) for line in f]
+
+    paths = []
+    seen = set()
+    for pattern, basedir in patterns:
+        if not pattern:
+            continue
+        pattern = os.path.join(basedir, os.path.expanduser(pattern))
+        matches = sorted(glob.glob(pattern))
+        if len(matches) > 1 and known_ext:
+            # Do not pick up the outputs of previous conversions.
+            matches = [path for path in matches
+                       if get_ext(path) in input_ext]
+        for path in matches or [pattern]:
+            path_in, basedir_in, basename, _ = split_path(path)
+            if get_ext(path) in multi_ext:
+                key = os.path.join(basedir_in, basename)
+            else:
+                key = path_in
+            if key not in seen:
+                seen.add(key)
+                paths.append(path_in)
+    return paths
+
+# Input formats from the file extensions.
+input_ext = {'.prp':'propaceos',
+             '.eps':'multi',
+             '.opp':'multi',
+             '.opz':'multi',
+             '.opr':'multi',
+             '.mexport':'sesame-qeos',
+             '.ses':'sesame',
+             '.html':'tops',
+             '.tops':'tops',
+             '.h5':'hdf5',
+             }
+
 def read_format_ext(args, fn_in):
     # Try to read from the input file extension.
-    ext_dict = {'.prp':'propaceos',
-                '.eps':'multi',
-                '.opp':'multi',
-                '.opz':'multi',
-                '.opr':'multi',
-                '.mexport':'sesame-qeos',
-                '.ses':'sesame',
-                '.html':'tops',
-                '.tops':'tops',
-                }
     # If the input file is compressed, choose the next extension.
-    if os.path.splitext(fn_in)[1] == '.gz':
-        _, ext = os.path.splitext(os.path.splitext(fn_in)[0])
-    else:
-        _, ext = os.path.splitext(fn_in)
+    ext = get_ext(fn_in)
 
     # Choose the correct input type based on extension and set args.input
     # accordingly.
-    if ext in ext_dict.keys():
-        args.input = ext_dict[ext]
+    if ext in input_ext.keys():
+        args.input = input_ext[ext]
     else:
         raise Warning('Cannot tell filetype from extension. Please specify '
                       'input file type with --input.')
@@ -135,9 +268,10 @@ class Formats_toEosDict(object):
 
         # Use handle_dict to create the eos_dict based on the input format.
         try:
-            self.eos_dict = self.handle_dict[args.input]()
+            handle = self.handle_dict[args.input]
         except KeyError:
             raise KeyError('Must use valid format name.')
+        self.eos_dict = handle()
 
     def set_handle_dict(self):
         self.handle_dict = {'propaceos' : self.propaceos_toEosDict,
@@ -145,6 +279,7 @@ class Formats_toEosDict(object):
                             'sesame' : self.sesame_toEosDict,
                             'sesame-qeos' : self.sesame_qeos_toEosDict,
                             'tops' : self.tops_toEosDict,
+                            'hdf5' : self.hdf5_toEosDict,
                             }
 
     def propaceos_toEosDict(self):
@@ -153,7 +288,7 @@ class Formats_toEosDict(object):
         try:
             import opacplot2.opg_propaceos
             op = opp.opg_propaceos.OpgPropaceosAscii(self.path_in)
-            eos_dict = op.toEosDict(log=self.args.log)
+            eos_dict = op.toEosDict()
             return eos_dict
         except ImportError:
             raise ImportError('You do not have the opg_propaceos script.')
@@ -161,8 +296,7 @@ class Formats_toEosDict(object):
     def multi_toEosDict(self):
         op = opp.OpgMulti.open_file(self.basedir, self.basename)
         eos_dict = op.toEosDict(Znum=self.args.Znum,
-                                Xnum=self.args.Xfracs,
-                                log=self.args.log)
+                                Xnum=self.args.Xfracs)
         return eos_dict
 
     def sesame_toEosDict(self):
@@ -180,12 +314,10 @@ class Formats_toEosDict(object):
         if self.args.tabnum is not None:
             eos_dict = op.toEosDict(Znum=self.args.Znum,
                                     Xnum=self.args.Xfracs,
-                                    log=self.args.log,
                                     tabnum=self.args.tabnum)
         else:
             eos_dict = op.toEosDict(Znum=self.args.Znum,
-                                    Xnum=self.args.Xfracs,
-                                    log=self.args.log)
+                                    Xnum=self.args.Xfracs)
         return eos_dict
 
     def sesame_qeos_toEosDict(self):
@@ -203,11 +335,10 @@ class Formats_toEosDict(object):
 
         if self.args.tabnum is not None:
             eos_dict = op.toEosDict(Znum=self.args.Znum, Xnum=self.args.Xfracs,
-                                    qeos=True, log=self.args.log,
-                                    tabnum=self.args.tabnum)
+                                    qeos=True, tabnum=self.args.tabnum)
         else:
             eos_dict = op.toEosDict(Znum=self.args.Znum, Xnum=self.args.Xfracs,
-                                    qeos=True, log=self.args.log)
+                                    qeos=True)
         return eos_dict
 
     def tops_toEosDict(self):
@@ -215,9 +346,15 @@ class Formats_toEosDict(object):
         eos_dict = op.toEosDict(fill_eos=True)
         return eos_dict
 
+    def hdf5_toEosDict(self):
+        # The HDF5 datasets already use the common dictionary names. They
+        # are left on disk and read block by block when writing.
+        return opp.OpgHdf5.open_file(self.path_in)
+
 class EosDict_toIonmixFile(object):
     """
-    Takes a common EoS dictionary and writes it to the correct output format.
+    Takes a common EoS dictionary and writes it to the correct output format
+    (IONMIX, HDF5 or MULTI, despite the name).
     """
     def __init__(self, args, eos_dict):
         # Initialize the handling function dictionary.
@@ -231,7 +368,71 @@ class EosDict_toIonmixFile(object):
         self.handle_dict[args.output]()
 
     def set_handle_dict(self):
-        self.handle_dict = {'ionmix' : self.eosDict_toIonmix}
+        self.handle_dict = {'ionmix' : self.eosDict_toIonmix,
+                            'hdf5' : self.eosDict_toHdf5,
+                            'multi' : self.eosDict_toMulti}
+
+    def eosDict_toHdf5(self):
+        # The common dictionary keys are the HDF5 dataset names. Arrays are
+        # written compressed and chunked, scalars as attributes.
+        op = opp.OpgHdf5.from_eos_dict(self.eos_dict)
+        for key in self.args.log or []:
+            if key in op:
+                op[key] = self.log_table(key, op[key])
+        if self.args.verbose:
+            print('Wrote the following data to HDF5 file:\n'
+                  '{}'.format(', '.join(sorted(op.keys()))))
+        op.write2file(self.args.outname + '.h5')
+
+    def log_table(self, key, tab):
+        """
+        Base 10 logarithm of a table, the invalid values (NaN, infinite and
+        non-positive values) being treated as in the IONMIX outputs.
+        """
+        # In place when the table is ours to modify.
+        if not (isinstance(tab, np.ndarray) and tab.flags.writeable and
+                tab.dtype.kind == 'f'):
+            tab = np.array(tab, dtype=float)
+        floor = self.args.floor
+        if floor is None:
+            floor = np.log10(opp.IonmixWriter.MIN_VALUE)
+        for group, block in ([(None, tab)] if tab.ndim < 3 else
+                             [(g, tab[:, :, g])
+                              for g in range(tab.shape[2])]):
+            # Block by block, so that only a group plane is copied.
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out = np.log10(block)
+            nonpos = ~(block > 0.0)
+            opp.utils.treat_invalid_values(
+                out, ~np.isfinite(out) | nonpos, block, key,
+                self.args.invalid, floor, nonpos, group=group,
+                jd=0 if block.ndim == 2 else None, fmt='HDF5')
+            block[...] = out
+        return tab
+
+    def eosDict_toMulti(self):
+        # MULTI tables only hold the average ionization and the opacities.
+        if self.args.log:
+            raise Warning('--log cannot be used with MULTI outputs, the '
+                          'MULTI tables are already stored as logarithms.')
+        multi_conv = {'dens':'dens',
+                      'temp':'temp',
+                      'Zf_DT':'zbar',
+                      'groups':'groups',
+                      'opp_mg':'opp_mg',
+                      'opr_mg':'opr_mg',
+                      'emp_mg':'emp_mg'}
+        op = opp.OpgMulti()
+        for key in multi_conv.keys():
+            if key in self.eos_dict.keys():
+                op[multi_conv[key]] = self.eos_dict[key]
+        if 'zbar' not in op:
+            raise Warning('Missing average ionization for MULTI file!')
+        op.set_id(self.args.tabnum if self.args.tabnum is not None else 0)
+        if self.args.verbose:
+            print('Wrote the following data to MULTI files:\n'
+                  '{}'.format(', '.join(sorted(op.keys()))))
+        op.write(self.args.outname)
 
     def eosDict_toIonmix(self):
         # These are the naming conventions translated to ionmix arguments.
@@ -252,7 +453,8 @@ class EosDict_toIonmixFile(object):
         # Initialize ionmix argument dictionary.
         imx_dict = {}
 
-        # Translating the keys over.
+        # Translating the keys over. The tables themselves are not looked
+        # up here: they are streamed to the file below.
         for key in imx_conv.keys():
             if key in self.eos_dict.keys():
                 imx_dict[imx_conv[key]] = self.eos_dict[key]
@@ -295,26 +497,250 @@ class EosDict_toIonmixFile(object):
                     verb_str = verb_str + '{}. {} \n'.format(i, verb_conv[key])
             print(verb_str)
 
-        # Write the ionmix file based on what data is stored in imx_dict.
-        opp.writeIonmixFile(self.args.outname + '.cn4', **imx_dict)
-
-def convert_tables():
-    # Grab the input data.
-    input_data = get_input_data()
-
-    # Read the file extension if the user did not specify an input.
-    if input_data['args'].input is None:
-        read_format_ext(input_data['args'], input_data['fn_in'])
-
-
+        # Write the ionmix file based on what data is stored in imx_dict,
+        # one table (or opacity group) at a time, in the order of the file,
+        # so that lazily loaded inputs are never read as a whole.
+        imx_keys = dict((imx_conv[key], key) for key in imx_conv)
+        order = [name for name, _, _ in opp.IonmixWriter.TABLES] + \
+                [name for name, _ in opp.IonmixWriter.OPACS]
+        keys = [imx_keys[name] for name in order
+                if name in imx_keys and name in imx_dict]
+        blocks = ((imx_conv[key], group, block) for key, group, block in
+                  opp.utils.iter_eos_blocks(self.eos_dict, keys))
+        with opp.IonmixWriter(self.args.outname + '.cn4',
+                              imx_dict['zvals'], imx_dict['fracs'],
+                              np.asarray(imx_dict['numDens']),
+                              np.asarray(imx_dict['temps']),
+                              ngroups=imx_dict.get('ngroups'),
+                              opac_bounds=imx_dict.get('opac_bounds'),
+                              log=[imx_conv.get(key, key)
+                                   for key in self.args.log or []],
+                              invalid=self.args.invalid,
+                              floor=self.args.floor) as imx:
+            imx.write_blocks(blocks)
+
+def input_files(path_in, fmt):
+    """
+    Returns the files read to convert ``path_in``: all the files of a MULTI
+    table, otherwise ``path_in``.
+    """
+    if fmt != 'multi':
+        return [path_in]
+    _, basedir, basename, _ = split_path(path_in)
+    return sorted(path for path in glob.glob(os.path.join(basedir,
+                                                          basename + '.*'))
+                  if get_ext(path) in multi_ext)
+
+def output_files(outname, fmt):
+    """
+    Files that can be written for the output name ``outname``: all the
+    files of a MULTI table, otherwise the file with the extension of the
+    format.
+    """
+    if fmt != 'multi':
+        return [outname + output_ext[fmt]]
+    return [outname + ext + '.gz' for ext in multi_ext]
 
-    # Reading in data and converting it to the common dictionary format.
-    eos_dict = Formats_toEosDict(input_data['args'],
-                                 input_data['basedir'],
-                                 input_data['basename'],
-                                 input_data['path_in']).eos_dict
+def write_output(args, eos_dict):
+    """
+    Writes ``eos_dict`` in the output format of ``args``.
 
-    EosDict_toIonmixFile(input_data['args'], eos_dict)
+    The files are written to a temporary directory next to the output and
+    only moved to ``args.outname`` once they are complete, so that a failed
+    conversion does not leave a partial output looking up-to-date.
+    """
+    outdir, basename = os.path.split(os.path.abspath(args.outname))
+    tmp_dir = tempfile.mkdtemp(prefix='.' + basename + '.', dir=outdir)
+    try:
+        # The temporary files keep the name of the output, which is
+        # stored in the gzip headers of MULTI files.
+        tmp_args = argparse.Namespace(**vars(args))
+        tmp_args.outname = os.path.join(tmp_dir, basename)
+        EosDict_toIonmixFile(tmp_args, eos_dict)
+        replace = getattr(os, 'replace', os.rename)
+        for path, tmp_path in zip(output_files(args.outname, args.output),
+                                  output_files(tmp_args.outname,
+                                               args.output)):
+            if os.path.exists(tmp_path):
+                replace(tmp_path, path)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+def input_hash(paths, args):
+    """
+    Hash of the content of the input files and of the conversion options.
+    """
+    sha = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                sha.update(block)
+    options = dict((key, getattr(args, key)) for key in
+                   ['Znum', 'Xfracs', 'input', 'output', 'log', 'invalid',
+                    'floor', 'tabnum'])
+    sha.update(json.dumps(options, sort_keys=True).encode())
+    return sha.hexdigest()
+
+def is_up_to_date(paths, path_out, method, args):
+    """
+    Whether ``path_out`` is up-to-date with respect to its inputs, based on
+    the modification times (``'mtime'``) or on the hash of the inputs and
+    options stored next to the output at the previous conversion
+    (``'hash'``).
+    """
+    if not os.path.exists(path_out):
+        return False
+    if method == 'mtime':
+        return all(os.path.getmtime(path) <= os.path.getmtime(path_out)
+                   for path in paths)
+    try:
+        with open(path_out + '.sha1') as f:
+            return f.read().strip() == input_hash(paths, args)
+    except IOError:
+        return False
+
+def convert_file(args, path_in):
+    """
+    Converts a single table.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        Options from :func:`get_input_data`. ``args.input`` and
+        ``args.outname`` are set for this file on a copy.
+    path_in : str
+        Input file.
+
+    Returns
+    -------
+    dict
+        ``input``, ``output``, ``status`` (``'converted'``, ``'skipped'`` or
+        ``'failed'``), ``time`` (s) and ``error``, and the ``profile``
+        report (see :mod:`opacplot2.profiling`) with ``args.profile``.
+    """
+    if not args.profile:
+        return _convert_file(args, path_in)
+    with profiling.Profiler(memory=args.profile_memory) as prof:
+        result = _convert_file(args, path_in)
+    result['profile'] = prof.report()
+    return result
+
+def _convert_file(args, path_in):
+    t0 = time.time()
+    args = argparse.Namespace(**vars(args))
+    path_in, basedir, basename, fn_in = split_path(path_in)
+    result = {'input': path_in, 'output': None, 'status': 'failed',
+              'time': 0., 'error': None}
+    try:
+        # Read the file extension if the user did not specify an input.
+        if args.input is None:
+            read_format_ext(args, fn_in)
+        if args.outname is None:
+            args.outname = os.path.join(args.outdir or basedir, basename)
+        path_out = args.outname + output_ext[args.output]
+        result['output'] = path_out
+
+        paths = input_files(path_in, args.input)
+        if os.path.abspath(path_out) in paths:
+            raise Warning('The output would overwrite the input, please use '
+                          '--outname or --outdir.')
+        if args.update is not None and \
+           is_up_to_date(paths, path_out, args.update, args):
+            result['status'] = 'skipped'
+        else:
+            # Reading in data and converting it to the common dictionary
+            # format.
+            with profiling.timer('read') as phase:
+                eos_dict = Formats_toEosDict(args, basedir, basename,
+                                             path_in).eos_dict
+                phase.add(nbytes=sum(os.path.getsize(path)
+                                     for path in paths))
+
+            try:
+                # Check the consistency of the EoS tables before writing
+                # them.
+                report = opp.utils.check_eos_consistency(eos_dict)
+                if report['fail'] or args.verbose:
+                    print(opp.utils.format_eos_report(report,
+                                                      verbose=args.verbose))
+
+                with profiling.timer('write'):
+                    write_output(args, eos_dict)
+            finally:
+                # Lazily loaded inputs (HDF5) keep their file open.
+                if hasattr(eos_dict, 'f'):
+                    eos_dict.f.close()
+            if args.update == 'hash':
+                with open(path_out + '.sha1', 'w') as f:
+                    f.write(input_hash(paths, args) + '\n')
+            result['status'] = 'converted'
+    except Exception as err:
+        result['error'] = '{}: {}'.format(type(err).__name__, err)
+        if args.verbose:
+            traceback.print_exc()
+    result['time'] = time.time() - t0
+    return result
+
+def _convert_file_star(job):
+    # Pool.imap only passes one argument.
+    return convert_file(*job)
+
+def format_summary(results, elapsed):
+    """
+    Summary of a batch conversion: one line per table and the totals.
+    """
+    lines = []
+    for res in results:
+        line = '{:9s} {:8.2f} s  {}'.format(res['status'], res['time'],
+                                            res['input'])
+        if res['error'] is not None:
+            line += '\n          {}'.format(res['error'])
+        lines.append(line)
+    counts = dict((status, sum(res['status'] == status for res in results))
+                  for status in ['converted', 'skipped', 'failed'])
+    lines.append('{} tables: {converted} converted, {skipped} skipped, '
+                 '{failed} failed in {:.2f} s.'.format(len(results), elapsed,
+                                                       **counts))
+    return '\n'.join(lines)
+
+def convert_tables(argv=None):
+    # Grab the input data.
+    input_data = get_input_data(argv)
+    args = input_data['args']
+    paths_in = input_data['paths_in']
+
+    t0 = time.time()
+    jobs = [(args, path_in) for path_in in paths_in]
+    if args.jobs > 1 and len(jobs) > 1:
+        # The workers import opacplot2 once and convert several tables.
+        import multiprocessing
+        pool = multiprocessing.Pool(min(args.jobs, len(jobs)))
+        try:
+            results = pool.map(_convert_file_star, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [convert_file(*job) for job in jobs]
+    elapsed = time.time() - t0
+
+    if len(results) > 1 or results[0]['status'] != 'converted':
+        print(format_summary(results, elapsed))
+    if args.profile:
+        report = profiling.merge_reports([res['profile'] for res in results
+                                          if 'profile' in res])
+        print(profiling.format_report(report))
+        if args.profile_json is not None:
+            report['tables'] = dict((res['input'], res['profile'])
+                                    for res in results if 'profile' in res)
+            with open(args.profile_json, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+    if args.summary is not None:
+        with open(args.summary, 'w') as f:
+            json.dump({'results': results, 'time': elapsed}, f, indent=2)
+    if any(res['status'] == 'failed' for res in results):
+        raise SystemExit(1)
+    return results
 
 if __name__=='__main__':
     convert_tables()
@@ -5,7 +5,8 @@ import matplotlib.pyplot as plt
 import numpy as np
 import os.path
 import periodictable as ptab
-import scipy as sp
+from opacplot2 import profiling
+from opacplot2 import regrid
 plt.rcParams.update({'text.usetex': False})
 
 def get_input_data():
@@ -22,13 +23,19 @@ def get_input_data():
 
 
     parser.add_argument('input_1',
-                        action='store', type=str,
+                        action='store', type=str, nargs='?',
                         help='Input file 1.')
 
     parser.add_argument('input_2',
-                        action='store', type=str,
+                        action='store', type=str, nargs='?',
                         help='Input file 2.')
 
+    parser.add_argument('--pairs',
+                        action='store', type=str,
+                        help='Batch mode: file listing the pairs of files to '
+                             'compare, one pair per line with an optional '
+                             'comma separated list of filetypes.')
+
     parser.add_argument('-f', '--filetypes',
                         action='store', type=str,
                         help='Input filetypes.')
@@ -81,6 +88,31 @@ def get_input_data():
                         const=True, default=False,
                         help='Linear values for interpolated grid.')
 
+    parser.add_argument('--opac',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Also compare the opacities.')
+
+    parser.add_argument('--log_error',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Error on the log of the opacities.')
+
+    parser.add_argument('--groups',
+                        action='store', type=str, default='first',
+                        choices=['first', 'second', 'union'],
+                        help='Group structure used to compare opacities.')
+
+    parser.add_argument('--chunk',
+                        action='store', type=int,
+                        help='Number of groups processed at once.')
+
+    parser.add_argument('--log_interp',
+                        action='store_const',
+                        const=True, default=False,
+                        help='Interpolate in log of the density and '
+                             'temperature.')
+
     parser.add_argument('--tabnum_1',
                         action='store', type=str,
                         help='Specify the SESAME table number for file 1.')
@@ -89,18 +121,32 @@ def get_input_data():
                         action='store', type=str,
                         help='Specify the SESAME table number for file 2.')
 
-    args = parser.parse_args()
+    parser.add_argument('--profile',
+                        action='store_true',
+                        help='Print the time spent in each phase.')
 
-    # Get the relevant paths and filenames.
-    path_in_1 = os.path.abspath(args.input_1)
-    path_in_2 = os.path.abspath(args.input_2)
+    parser.add_argument('--profile_json',
+                        action='store', type=str,
+                        help='Write the profile report to this JSON file '
+                             '(implies --profile).')
 
-    basedir_1, fn_1 = os.path.split(path_in_1)
-    basedir_2, fn_2 = os.path.split(path_in_2)
+    parser.add_argument('--profile_memory',
+                        action='store_true',
+                        help='Also profile the memory allocations (slower, '
+                             'implies --profile).')
 
-    # Split filename twice in case of MULTI files (.opr.gz, etc)
-    basename_1 = os.path.splitext(os.path.splitext(fn_1)[0])[0]
-    basename_2 = os.path.splitext(os.path.splitext(fn_2)[0])[0]
+    args = parser.parse_args()
+
+    if args.pairs is None and (args.input_1 is None or args.input_2 is None):
+        parser.error('Two input files or --pairs are required.')
+
+    # Get the relevant paths and filenames.
+    if args.pairs is None:
+        path_in_1, basedir_1, basename_1, fn_1 = split_path(args.input_1)
+        path_in_2, basedir_2, basename_2, fn_2 = split_path(args.input_2)
+    else:
+        path_in_1 = basedir_1 = basename_1 = fn_1 = None
+        path_in_2 = basedir_2 = basename_2 = fn_2 = None
 
     # Create lists for filetypes.
     if args.filetypes is not None:
@@ -161,6 +207,46 @@ def get_input_data():
 
     return input_data
 
+def split_path(path):
+    """
+    Returns the absolute path, directory, base name and file name of
+    ``path``.
+    """
+    path_in = os.path.abspath(path)
+    basedir, fn = os.path.split(path_in)
+    # Split filename twice in case of MULTI files (.opr.gz, etc)
+    basename = os.path.splitext(os.path.splitext(fn)[0])[0]
+    return path_in, basedir, basename, fn
+
+def read_pairs(path):
+    """
+    Reads a batch file of pairs of files to compare.
+
+    Each non empty line holds two file names and optionally a comma separated
+    list of their filetypes. Lines starting with ``#`` are ignored. Relative
+    file names are relative to the directory of the batch file.
+
+    Returns
+    -------
+    list
+        ``[(path_1, path_2, filetypes or None), ...]``.
+    """
+    basedir = os.path.dirname(os.path.abspath(path))
+    pairs = []
+    with open(path) as f:
+        for num, line in enumerate(f):
+            fields = line.split('#')[0].split()
+            if not fields:
+                continue
+            if len(fields) not in [2, 3]:
+                raise ValueError('Line {} of {} should have two file names '
+                                 'and optionally the filetypes!'
+                                 .format(num+1, path))
+            path_1, path_2 = [os.path.join(basedir, fn) for fn in fields[:2]]
+            filetypes = fields[2].split(',') if len(fields) == 3 else None
+            pairs.append((path_1, path_2, filetypes))
+    return pairs
+
 def read_format_ext(args, f_1, f_2):
     # Try to read from the input file extension.
     ext_dict = {'.prp':'propaceos',
@@ -322,6 +408,7 @@ class Formats_Read(object):
     ionmix_names_dict_inv = {v:k for k, v
                              in ionmix_names_dict.items()}
 
+    @profiling.timed('read')
     def __init__(self, form, basedir, basename, path_in,
                  mpi=None, znum=None, xnum=None,
                  filters=[0.,0.], verbose=False, tabnum=None):
@@ -340,16 +427,6 @@ class Formats_Read(object):
         self.xnum = xnum
         self.tabnum = tabnum
 
-        # For SESAME, we need the hedp package to calculate zbar.
-        need_hedp_list = ['sesame', 'sesame-qeos']
-        if self.form in need_hedp_list:
-            try:
-                global hedp
-                import hedp.eos
-            except ImportError:
-                raise ImportError('You need the hedp module. You can get it here: '
-                                  'https://github.com/luli/hedp.')
-
         # Use handle_dict to create the eos_dict based on the input format.
         try:
             self.data = self.handle_dict[self.form]()
@@ -448,7 +525,7 @@ class Formats_Read(object):
                   'Electron temperature and density grids...')
 
         # We must merge ion_ and ele_ grids for qeos-sesame data.
-        # Then we can calculate zbar using hedp module.
+        # Then we can calculate zbar.
         op.data[table_key] = opp.utils.EosMergeGrids(
                             op.data[table_key], intersect=['ele', 'ioncc'],
                             filter_dens=lambda x: (x>self.filters[0]),
@@ -457,13 +534,12 @@ class Formats_Read(object):
 
         if self.verbose:
             print('Calculating average ionization...')
-        dens_arr, temp_arr = np.meshgrid(op.data[table_key]['ele_dens'],
-                                         op.data[table_key]['ele_temps'])
-
-        zbar = hedp.eos.thomas_fermi_ionization(
-                                    dens_arr, temp_arr,
-                                    op.data[table_key]['Znum'],
-                                    op.data[table_key]['abar']).T
+        zbar = opp.utils.thomas_fermi_ionization_grid(
+                                    op.data[table_key]['ele_dens'],
+                                    op.data[table_key]['ele_temps'],
+                                    np.average(op.data[table_key]['Znum'],
+                                               weights=self.xnum),
+                                    op.data[table_key]['abar'])
 
         op.data[table_key]['zbar'] = zbar
 
@@ -517,7 +593,7 @@ class Formats_Read(object):
             print('Merging the Ion and '
                   'Electron temperature and density grids...')
         # We must merge ion_ and ele_ grids for qeos-sesame data.
-        # Then we can calculate zbar using hedp module.
+        # Then we can calculate zbar.
         op.data[table_key] = opp.utils.EosMergeGrids(
                             op.data[table_key], intersect=['ele', 'ion'],
                             filter_dens=lambda x: (x>self.filters[0]),
@@ -526,13 +602,12 @@ class Formats_Read(object):
 
         if self.verbose:
             print('Calculating average ionization...')
-        dens_arr, temp_arr = np.meshgrid(op.data[table_key]['ele_dens'],
-                                         op.data[table_key]['ele_temps'])
-
-        zbar = hedp.eos.thomas_fermi_ionization(
-                                    dens_arr, temp_arr,
-                                    op.data[table_key]['Znum'],
-                                    op.data[table_key]['abar']).T
+        zbar = opp.utils.thomas_fermi_ionization_grid(
+                                    op.data[table_key]['ele_dens'],
+                                    op.data[table_key]['ele_temps'],
+                                    np.average(op.data[table_key]['Znum'],
+                                               weights=self.xnum),
+                                    op.data[table_key]['abar'])
 
         op.data[table_key]['zbar'] = zbar
 
@@ -614,10 +689,64 @@ class get_eos_array(object):
     def ionmix(self, eos, arr):
         return getattr(eos.data, Formats_Read.ionmix_names_dict[arr])
 
+# Re-gridding weights, computed once per pair of grids and reused for every
+# compared key (and every pair of files sharing the same grids). Only the
+# most recently used ones are kept.
+_regrid_cache = {}
+_regrid_cache_keys = []
+_REGRID_CACHE_SIZE = 16
+
+def get_regrid(dens, temp, dens_new, temp_new, log=False):
+    """
+    Returns the (cached) :class:`opacplot2.regrid.RectRegrid` from the grid
+    ``(dens, temp)`` onto ``(dens_new, temp_new)``.
+    """
+    key = tuple(np.asarray(arr, dtype=float).tobytes()
+                for arr in (dens, temp, dens_new, temp_new)) + (log,)
+    if key in _regrid_cache:
+        # Most recently used last.
+        _regrid_cache_keys.remove(key)
+        _regrid_cache_keys.append(key)
+    else:
+        _regrid_cache[key] = regrid.RectRegrid(dens, temp, dens_new,
+                                               temp_new, logd=log, logt=log)
+        _regrid_cache_keys.append(key)
+        while len(_regrid_cache_keys) > _REGRID_CACHE_SIZE:
+            del _regrid_cache[_regrid_cache_keys.pop(0)]
+    return _regrid_cache[key]
+
+@profiling.timed('compare_eos')
 def compare_eos(eos_1, eos_2, verbose=False,
                 plot=False,
                 write_log_file=False,
-                lin_grid=False):
+                lin_grid=False,
+                log_interp=False):
+    """
+    Error report for the EoS tables shared by two files.
+
+    Both tables are interpolated onto the union of their grid points in the
+    overlap of their ranges, with separable (bi)linear interpolation.
+
+    Parameters
+    ----------
+    eos_1, eos_2 : Formats_Read
+        Files to compare, errors are relative to both.
+    verbose : bool
+        Print the compared keys and ranges.
+    plot : bool
+        Save % error plots for each key.
+    write_log_file : bool
+        Append the errors to ``eos_errors.txt``.
+    lin_grid : bool
+        Linear axes for the plots.
+    log_interp : bool
+        Interpolate in log of the density and temperature.
+
+    Returns
+    -------
+    dict
+        ``{key: (RMS error, max absolute error)}`` as fractions.
+    """
 
     logfile_name = 'eos_errors.txt'
 
@@ -625,8 +754,7 @@ def compare_eos(eos_1, eos_2, verbose=False,
     # Not including 'idens', 'dens', 'temp', 'groups', 'opp_mg', 'opp_int',
     # 'opr_int',  'emp_mg', 'opr_mg', 'emp_int', 'Abar','Zmax', 'Ut_DT',
     # 'Znum', 'BulkMod', 'Xnum', 'Anum', 'Zsymb',  'ElemNum', 'Anum_prp'.
-    # (aka no opacity data currently).
-    # TODO add opacity comparison capabilities.
+    # (opacities are compared by `compare_opac`).
     keys = ['Pec_DT', 'Zf_DT', 'Pi_DT', 'Uec_DT', 'Ui_DT']
 
     shared_keys = [key for key in keys
@@ -640,7 +768,7 @@ def compare_eos(eos_1, eos_2, verbose=False,
         print(err_report_str)
 
     # Perform error report using number densities.
-    error_report = []
+    error_report = {}
 
     # Freak out if there is no number density.
     if 'idens' not in eos_1.common_keys or 'idens' not in eos_2.common_keys:
@@ -652,18 +780,9 @@ def compare_eos(eos_1, eos_2, verbose=False,
     dens_2 = get_eos_array(eos_2, 'idens').arr
     temp_2 = get_eos_array(eos_2, 'temp').arr
 
-    # These will be used for the interpolator function `griddata`.
-    d_interp_1, t_interp_1 = np.meshgrid(dens_1, temp_1)
-    d_interp_2, t_interp_2 = np.meshgrid(dens_2, temp_2)
-
     # Creating a new grid to interpolate onto.
-    d = opp.utils.intersect_1D_sorted_arr(dens_1, dens_2)
-    t = opp.utils.intersect_1D_sorted_arr(temp_1, temp_2)
-    D_new, T_new = np.meshgrid(d,t)
-
-    # These will be used for the interpolator function `griddata`.
-    d_interp_1, t_interp_1 = np.meshgrid(dens_1, temp_1)
-    d_interp_2, t_interp_2 = np.meshgrid(dens_2, temp_2)
+    d = regrid.overlap_axis(dens_1, dens_2)
+    t = regrid.overlap_axis(temp_1, temp_2)
 
     if (d is None) or (t is None):
         raise Warning('Density and temperature arrays must have some overlap!')
@@ -672,6 +791,10 @@ def compare_eos(eos_1, eos_2, verbose=False,
         print('Temperature range: {:.5E} to {:.5E} eV.'.format(t[0], t[-1]))
         print('Generating error report...')
 
+    # The interpolation weights only depend on the grids, not on the key.
+    regrid_1 = get_regrid(dens_1, temp_1, d, t, log=log_interp)
+    regrid_2 = get_regrid(dens_2, temp_2, d, t, log=log_interp)
+
     fn_1 = os.path.split(eos_1.path_in)[1]
     fn_2 = os.path.split(eos_2.path_in)[1]
 
@@ -688,29 +811,8 @@ def compare_eos(eos_1, eos_2, verbose=False,
         data_2 = get_eos_array(eos_2, key).arr
 
         # Use interpolation to account for mismatched grid sizes.
-        # `rescale=True` to account for the orders of magnitude difference
-        # in the dens/temp grids.
-        # `scipy.interpolate.interp2d` was not giving accurate interpolation.
-        # I believe this is due to the orders of magnitude difference also,
-        # which `griddata` can easily fix. - JT
-        # Additionally, `griddata` is much faster than using an interpolator
-        # function to fill an empty grid.
-        interp_data_1 = sp.interpolate.griddata(
-                                (d_interp_1.flatten(), t_interp_1.flatten()),
-                                data_1.T.flatten(),
-                                (D_new.flatten(), T_new.flatten()),
-                                rescale=True,
-                                method='linear')
-        interp_data_2 = sp.interpolate.griddata(
-                                (d_interp_2.flatten(), t_interp_2.flatten()),
-                                data_2.T.flatten(),(D_new.flatten(), T_new.flatten()),
-                                rescale=True,
-                                method='linear')
-
-        interp_data_1 = interp_data_1.reshape(D_new.shape[0], D_new.shape[1])
-        interp_data_2 = interp_data_2.reshape(D_new.shape[0], D_new.shape[1])
-        interp_data_1 = interp_data_1.T
-        interp_data_2 = interp_data_2.T
+        interp_data_1 = regrid_1(data_1)
+        interp_data_2 = regrid_2(data_2)
 
         err_1_sqr = np.square((interp_data_1 - interp_data_2)/interp_data_1)
         err_2_sqr = np.square((interp_data_1 - interp_data_2)/interp_data_2)
@@ -761,12 +863,310 @@ def compare_eos(eos_1, eos_2, verbose=False,
             with open(logfile_name, 'a') as f:
                 f.write('{}, {}, {}\n'.format(key, err_rms, err_abs))
 
+        error_report[key] = (err_rms, err_abs)
+
         print('Error statistics for {}:'.format(key))
         print('RMS % Error: {:.5e}.'.format(err_rms*100))
         print('Max % Absolute Error: {:.5e}.'.format(err_abs*100))
 
+    return error_report
+
+
+# Number of (dens, temp, group) points processed at once by compare_opac.
+OPAC_CHUNK_SIZE = 2**22
+
+def _relative_errors(data_1, data_2, log_error=False):
+    # Relative errors with respect to each table, NaN where undefined.
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if log_error:
+            err_1 = np.abs(np.log(data_1) - np.log(data_2))
+            err_2 = err_1
+        else:
+            err_1 = np.abs((data_1 - data_2)/data_1)
+            err_2 = np.abs((data_1 - data_2)/data_2)
+    err_1[~np.isfinite(err_1)] = np.nan
+    if err_2 is not err_1:
+        err_2[~np.isfinite(err_2)] = np.nan
+    return err_1, err_2
+
+@profiling.timed('compare_opac')
+def compare_opac(eos_1, eos_2, verbose=False,
+                 write_log_file=False,
+                 log_interp=False,
+                 log_error=False,
+                 groups='first',
+                 chunk=None):
+    """
+    Error report for the (multigroup) opacities shared by two files.
+
+    The tables are interpolated onto the overlap grid as in
+    :func:`compare_eos` and rebinned onto a common group structure, the
+    errors are then accumulated over chunks of groups so that the memory
+    use does not scale with the size of the opacity cubes.
+
+    Parameters
+    ----------
+    eos_1, eos_2 : Formats_Read
+        Files to compare, errors are relative to both.
+    verbose : bool
+        Print the errors of each group.
+    write_log_file : bool
+        Append the errors to ``eos_errors.txt``.
+    log_interp : bool
+        Interpolate in log of the density and temperature.
+    log_error : bool
+        Use the error on the log of the opacities, ``|ln(op_1/op_2)|``,
+        instead of the relative error.
+    groups : str
+        Common group structure: the groups of the ``'first'`` or ``'second'``
+        file (the other one being averaged over them, harmonically for
+        Rosseland opacities) or the ``'union'`` of their boundaries.
+        Only the groups within the overlap of both ranges are compared.
+    chunk : int
+        Number of groups per chunk, by default such that a chunk holds about
+        ``OPAC_CHUNK_SIZE`` points.
+
+    Returns
+    -------
+    dict
+        For each key, a dict with the overall ``'rms'`` and ``'max'`` errors,
+        the errors per group ``'group_rms'`` and ``'group_max'`` and the
+        common ``'groups'`` boundaries. Points where the error is undefined
+        (e.g. null opacities) are not counted.
+    """
+    logfile_name = 'eos_errors.txt'
+
+    # Gray opacities are compared as single group opacities.
+    keys = ['opp_mg', 'opr_mg', 'emp_mg', 'opp_int', 'opr_int', 'emp_int']
+    shared_keys = [key for key in keys
+                   if key in eos_1.common_keys
+                   and key in eos_2.common_keys]
+    if groups not in ['first', 'second', 'union']:
+        raise ValueError('groups must be first, second or union!')
+
+    if 'idens' not in eos_1.common_keys or 'idens' not in eos_2.common_keys:
+        raise Warning('No number density data!')
+
+    dens_1 = get_eos_array(eos_1, 'idens').arr
+    temp_1 = get_eos_array(eos_1, 'temp').arr
+    dens_2 = get_eos_array(eos_2, 'idens').arr
+    temp_2 = get_eos_array(eos_2, 'temp').arr
+    d = regrid.overlap_axis(dens_1, dens_2)
+    t = regrid.overlap_axis(temp_1, temp_2)
+    if (d is None) or (t is None):
+        raise Warning('Density and temperature arrays must have some overlap!')
+    regrid_1 = get_regrid(dens_1, temp_1, d, t, log=log_interp)
+    regrid_2 = get_regrid(dens_2, temp_2, d, t, log=log_interp)
+
+    # Common group structure.
+    rebin_1 = rebin_2 = None
+    if any(key.endswith('_mg') for key in shared_keys):
+        if 'groups' not in eos_1.common_keys or \
+           'groups' not in eos_2.common_keys:
+            raise Warning('No group boundaries!')
+        groups_1 = np.asarray(get_eos_array(eos_1, 'groups').arr, dtype=float)
+        groups_2 = np.asarray(get_eos_array(eos_2, 'groups').arr, dtype=float)
+        if groups == 'union':
+            g = regrid.overlap_axis(groups_1, groups_2)
+        else:
+            g = groups_1 if groups == 'first' else groups_2
+            lo = max(groups_1[0], groups_2[0])
+            hi = min(groups_1[-1], groups_2[-1])
+            g = g[(g >= lo) & (g <= hi)]
+        if g is None or len(g) < 2:
+            raise Warning('The group structures must have a group in common!')
+        if verbose:
+            print('Comparing {} groups from {:.5E} to {:.5E} eV.'
+                  .format(len(g) - 1, g[0], g[-1]))
+        rebin_1 = {harm: regrid.GroupRebin(groups_1, g, harmonic=harm)
+                   for harm in [False, True]}
+        rebin_2 = {harm: regrid.GroupRebin(groups_2, g, harmonic=harm)
+                   for harm in [False, True]}
+
+    fn_1 = os.path.split(eos_1.path_in)[1]
+    fn_2 = os.path.split(eos_2.path_in)[1]
+    if write_log_file:
+        with open(logfile_name, 'a') as f:
+            f.write('Files: {}, {}\n'.format(fn_1, fn_2))
+            f.write('[Array, RMS Error, Absolute Error]\n')
+
+    error_report = {}
+    for key in shared_keys:
+        data_1 = get_eos_array(eos_1, key).arr
+        data_2 = get_eos_array(eos_2, key).arr
+        if key.endswith('_mg'):
+            harm = key.startswith('opr')
+            rb_1, rb_2 = rebin_1[harm], rebin_2[harm]
+            ng = len(g) - 1
+            key_groups = g
+        else:
+            data_1, data_2 = data_1[..., None], data_2[..., None]
+            rb_1 = rb_2 = lambda arr, sl: arr[..., sl]
+            ng = 1
+            key_groups = None
+
+        if chunk is None:
+            nchunk = max(1, OPAC_CHUNK_SIZE//(len(d)*len(t)))
+        else:
+            nchunk = max(1, int(chunk))
+
+        sumsq_1, sumsq_2 = np.zeros(ng), np.zeros(ng)
+        max_1, max_2 = np.zeros(ng), np.zeros(ng)
+        count = np.zeros(ng, dtype=int)
+        for g0 in range(0, ng, nchunk):
+            sl = slice(g0, min(g0 + nchunk, ng))
+            interp_1 = regrid_1(rb_1(data_1, sl))
+            interp_2 = regrid_2(rb_2(data_2, sl))
+            err_1, err_2 = _relative_errors(interp_1, interp_2, log_error)
+            valid = ~np.isnan(err_1) & ~np.isnan(err_2)
+            count[sl] = valid.sum(axis=(0, 1))
+            err_1[~valid] = 0.
+            err_2[~valid] = 0.
+            sumsq_1[sl] = np.square(err_1).sum(axis=(0, 1))
+            sumsq_2[sl] = np.square(err_2).sum(axis=(0, 1))
+            max_1[sl] = err_1.max(axis=(0, 1))
+            max_2[sl] = err_2.max(axis=(0, 1))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            group_rms = np.sqrt(np.maximum(sumsq_1, sumsq_2)/count)
+        group_max = np.maximum(max_1, max_2)
+        ntot = max(count.sum(), 1)
+        err_rms = np.sqrt(max(sumsq_1.sum(), sumsq_2.sum())/ntot)
+        err_abs = group_max.max()
+        error_report[key] = {'rms': err_rms, 'max': err_abs,
+                             'group_rms': group_rms, 'group_max': group_max,
+                             'groups': key_groups}
+
+        if write_log_file:
+            with open(logfile_name, 'a') as f:
+                f.write('{}, {}, {}\n'.format(key, err_rms, err_abs))
+
+        if log_error:
+            print('Log error statistics for {}:'.format(key))
+        else:
+            print('Error statistics for {}:'.format(key))
+        print('RMS % Error: {:.5e}.'.format(err_rms*100))
+        print('Max % Absolute Error: {:.5e}.'.format(err_abs*100))
+        if verbose and key_groups is not None:
+            for ig in range(ng):
+                print('  Group {:4d} [{:.4e}, {:.4e}] eV: RMS % Error '
+                      '{:.5e}, Max % Error {:.5e}.'
+                      .format(ig + 1, key_groups[ig], key_groups[ig+1],
+                              group_rms[ig]*100, group_max[ig]*100))
+
+    return error_report
+
+def compare_pairs(pairs, args):
+    """
+    Compares several pairs of files (batch mode).
+
+    Files appearing in several pairs with the same reader options (file
+    type, mpi, Znum, Xfracs, filters and tabnum) are only read once, and the
+    interpolation weights are shared between pairs with the same grids.
+    Failures are reported at the end instead of stopping the batch.
+
+    Parameters
+    ----------
+    pairs : list
+        ``[(path_1, path_2, filetypes or None), ...]``, see
+        :func:`read_pairs`.
+    args : argparse.Namespace
+        Options from :func:`get_input_data`, applied to every pair.
+
+    Returns
+    -------
+    tuple
+        ``(results, failures)``, lists of ``((path_1, path_2), report)`` and
+        ``((path_1, path_2), error)``.
+    """
+    readers = {}
+    def read(path, num, filetype):
+        path_in, basedir, basename, fn = split_path(path)
+        options = dict(mpi=getattr(args, 'mpi_{}'.format(num)),
+                       znum=getattr(args, 'Znum_{}'.format(num)),
+                       xnum=getattr(args, 'Xfracs_{}'.format(num)),
+                       filters=getattr(args, 'filters_{}'.format(num)),
+                       tabnum=getattr(args, 'tabnum_{}'.format(num)))
+        # The same file read as file 1 and file 2 with the same options
+        # is only read once.
+        key = (path_in, filetype, repr(sorted(options.items())))
+        if key not in readers:
+            readers[key] = Formats_Read(filetype, basedir, basename, path_in,
+                                        verbose=args.verbose, **options)
+        return readers[key]
+
+    results = []
+    failures = []
+    for path_1, path_2, filetypes in pairs:
+        try:
+            if filetypes is None:
+                filetypes = args.filetypes
+            if filetypes is None:
+                ns = argparse.Namespace()
+                read_format_ext(ns, path_1, path_2)
+                filetypes = ns.filetypes
+            print('Comparing {} and {}:'.format(path_1, path_2))
+            eos_1 = read(path_1, 1, filetypes[0])
+            eos_2 = read(path_2, 2, filetypes[1])
+            report = compare_eos(eos_1, eos_2,
+                                 verbose=args.verbose,
+                                 plot=args.plot,
+                                 write_log_file=args.writelog,
+                                 lin_grid=args.lin_grid,
+                                 log_interp=args.log_interp)
+            if args.opac:
+                opac_report = compare_opac(eos_1, eos_2,
+                                           verbose=args.verbose,
+                                           write_log_file=args.writelog,
+                                           log_interp=args.log_interp,
+                                           log_error=args.log_error,
+                                           groups=args.groups,
+                                           chunk=args.chunk)
+                report.update((key, (err['rms'], err['max']))
+                              for key, err in opac_report.items())
+            results.append(((path_1, path_2), report))
+        except Exception as err:
+            print('Failed: {}'.format(err))
+            failures.append(((path_1, path_2), err))
+
+    print('\nSummary: {} pairs compared, {} failed.'.format(len(results),
+                                                          len(failures)))
+    for (path_1, path_2), report in results:
+        if report:
+            key = max(report, key=lambda k: report[k][1])
+            worst = '{:.5e} ({})'.format(report[key][1]*100, key)
+        else:
+            worst = '- (no shared keys)'
+        print('{} vs {}: max % error {}.'.format(os.path.split(path_1)[1],
+                                                 os.path.split(path_2)[1],
+                                                 worst))
+    for (path_1, path_2), err in failures:
+        print('{} vs {}: FAILED ({}).'.format(os.path.split(path_1)[1],
+                                              os.path.split(path_2)[1], err))
+    return results, failures
+
 def check_error():
     input_data = get_input_data()
+    args = input_data['args']
+    if not (args.profile or args.profile_json or args.profile_memory):
+        return _check_error(input_data)
+
+    prof = profiling.Profiler(memory=args.profile_memory)
+    try:
+        with prof:
+            _check_error(input_data)
+    finally:
+        print(prof.format())
+        if args.profile_json is not None:
+            prof.to_json(args.profile_json, indent=2)
+
+def _check_error(input_data):
+    if input_data['args'].pairs is not None:
+        _, failures = compare_pairs(read_pairs(input_data['args'].pairs),
+                                    input_data['args'])
+        if failures:
+            raise SystemExit(1)
+        return
 
     if input_data['args'].filetypes is None:
         read_format_ext(input_data['args'],
@@ -798,7 +1198,16 @@ def check_error():
     compare_eos(eos_1, eos_2, verbose=input_data['args'].verbose,
                 plot=input_data['args'].plot,
                 write_log_file=input_data['args'].writelog,
-                lin_grid=input_data['args'].lin_grid)
+                lin_grid=input_data['args'].lin_grid,
+                log_interp=input_data['args'].log_interp)
+
+    if input_data['args'].opac:
+        compare_opac(eos_1, eos_2, verbose=input_data['args'].verbose,
+                     write_log_file=input_data['args'].writelog,
+                     log_interp=input_data['args'].log_interp,
+                     log_error=input_data['args'].log_error,
+                     groups=input_data['args'].groups,
+                     chunk=input_data['args'].chunk)
 
 if __name__=='__main__':
     check_error()
@@ -0,0 +1,51 @@
+"""
+Benchmark of ``import opacplot2`` and of the deferred numba compilation.
+
+Run with::
+
+    python -m opacplot2.tests.bench_import
+
+Every measurement runs in a fresh interpreter. The import itself should
+stay under ``IMPORT_BUDGET`` seconds: the heavy dependencies (matplotlib,
+PyTables, numba, scipy) are only imported when needed.
+"""
+from __future__ import print_function
+
+import json
+import subprocess
+import sys
+
+IMPORT_BUDGET = 0.5
+
+HEAVY_MODULES = ['matplotlib', 'tables', 'numba', 'scipy', 'periodictable']
+
+_import_code = """
+import json, sys, time
+t0 = time.time()
+import opacplot2
+t1 = time.time()
+heavy = [m for m in {heavy!r} if m in sys.modules]
+import numpy as np
+opacplot2.utils.planck_int(np.array([1.]))
+t2 = time.time()
+print(json.dumps([t1 - t0, t2 - t1, heavy]))
+"""
+
+
+def time_import():
+    """Return the time of ``import opacplot2``, the time of the first
+    ``planck_int`` call (which compiles the numba kernel, if numba is
+    available), and the heavy modules imported by ``import opacplot2``.
+    """
+    out = subprocess.check_output(
+        [sys.executable, '-c', _import_code.format(heavy=HEAVY_MODULES)])
+    # The last line, after anything printed by the first call.
+    return tuple(json.loads(out.decode().strip().splitlines()[-1]))
+
+
+if __name__ == '__main__':
+    t_import, t_first, heavy = time_import()
+    print('import opacplot2: {0:.3f} s (budget {1} s)'.format(t_import,
+                                                             IMPORT_BUDGET))
+    print('first planck_int call: {0:.3f} s'.format(t_first))
+    print('heavy modules imported: {0}'.format(', '.join(heavy) or 'none'))
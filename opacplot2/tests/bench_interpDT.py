@@ -0,0 +1,84 @@
+"""
+Benchmark of ``opacplot2.utils.interpDT`` against the former interp2d path.
+
+Run with::
+
+    python -m opacplot2.tests.bench_interpDT
+
+The former implementation built ``scipy.interpolate.interp2d`` and was
+called one point at a time, the derivatives using ``scipy.misc.derivative``
+(two interpolations each). When interp2d is not available (SciPy >= 1.14),
+it is emulated with a scalar ``RegularGridInterpolator`` lookup, which has
+the same per-call pattern.
+"""
+from __future__ import print_function
+
+import os
+import time
+
+import numpy as np
+
+import opacplot2 as opp
+
+
+def legacy_interpDT(arr, dens, temps, lookup=opp.INTERP_FUNC):
+    try:
+        from scipy.interpolate import interp2d
+        f2d = interp2d(dens, temps, arr.T, kind='linear')
+        f = lambda d, t: f2d(d, t)[0]
+    except (ImportError, NotImplementedError):
+        from scipy.interpolate import RegularGridInterpolator
+        rgi = RegularGridInterpolator((dens, temps), arr,
+                                      bounds_error=False, fill_value=None)
+        f = lambda d, t: rgi([[d, t]])[0]
+
+    if lookup == opp.INTERP_FUNC:
+        def wrapper(d, t):
+            d = min(max(d, dens[0]), dens[-1])
+            t = min(max(t, temps[0]), temps[-1])
+            return f(d, t)
+        return wrapper
+    if lookup == opp.INTERP_DFDD:
+        return lambda d, t: (f(d*(1 + 1e-12), t)
+                             - f(d*(1 - 1e-12), t))/(2e-12*d)
+    return lambda d, t: (f(d, t*(1 + 1e-12))
+                         - f(d, t*(1 - 1e-12)))/(2e-12*t)
+
+
+def bench(npts=2000, seed=0):
+    imx = opp.OpacIonmix(os.path.join(os.path.dirname(__file__),
+                                      'data', 'imx_sample.cn4'),
+                         1.00794, man=True, twot=True)
+    rng = np.random.RandomState(seed)
+    d = rng.uniform(imx.dens[0], imx.dens[-1], npts)
+    t = rng.uniform(imx.temps[0], imx.temps[-1], npts)
+
+    for name, lookup in [('INTERP_FUNC', opp.INTERP_FUNC),
+                         ('INTERP_DFDD', opp.INTERP_DFDD),
+                         ('INTERP_DFDT', opp.INTERP_DFDT)]:
+        old = legacy_interpDT(imx.pion, imx.dens, imx.temps, lookup)
+        new = opp.utils.interpDT(imx.pion, imx.dens, imx.temps,
+                                 lookup=lookup)
+
+        t0 = time.time()
+        ref = np.array([old(di, ti) for di, ti in zip(d, t)])
+        t_old = time.time() - t0
+
+        t0 = time.time()
+        scal = np.array([new(di, ti) for di, ti in zip(d, t)])
+        t_scal = time.time() - t0
+
+        t0 = time.time()
+        res = new(d, t)
+        t_arr = time.time() - t0
+
+        err = np.abs(res - ref).max()/np.abs(ref).max()
+        print('{0}: old {1:.3e} s, new (scalar) {2:.3e} s, '
+              'new (array) {3:.3e} s, speedup {4:.0f}x, '
+              'max rel. difference {5:.2e}'.format(
+                  name, t_old, t_scal, t_arr, t_old/max(t_arr, 1e-9), err))
+        assert np.all(scal == res)
+
+
+if __name__ == '__main__':
+    bench()
@@ -0,0 +1,113 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import copy
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import opacplot2 as opp
+from opacplot2 import benchmarks
+
+
+class test_synthetic(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_formats(self):
+        # Every synthetic table is read back by its reader.
+        eos = opp.utils.synthetic_eos_dict(7, 5, 4, seed=0)
+        path = os.path.join(self.tmp_dir, 'syn')
+        fns = dict((fmt, benchmarks.write_synthetic(fmt, path, 7, 5, 4,
+                                                    seed=0))
+                   for fmt in benchmarks.SYNTHETIC_FORMATS)
+
+        ses = opp.OpgSesame(fns['sesame'], opp.OpgSesame.SINGLE)
+        ses = ses.toEosDict(Znum=13)
+        self.assertTrue(np.allclose(ses['Pec_DT'], eos['Pec_DT'], rtol=1e-7)
+                        and np.allclose(ses['Ui_DT'], eos['Ui_DT'],
+                                        rtol=1e-7) and
+                        np.allclose(ses['temp'], eos['temp'], rtol=1e-7),
+                        msg='Checking the synthetic SESAME table!')
+        tops = opp.OpgTOPS(fns['tops']).toEosDict()
+        self.assertTrue(np.allclose(tops['opr_mg'], eos['opr_mg'],
+                                    rtol=1e-6) and
+                        np.allclose(tops['groups'][:-1], eos['groups'][:-1],
+                                    rtol=1e-6) and
+                        np.array_equal(tops['Znum'], [13]),
+                        msg='Checking the synthetic TOPS table!')
+        qeos = opp.OpgQeos(fns['qeos'], 'eos')
+        self.assertTrue(np.allclose(qeos.pres, eos['Pec_DT'] + eos['Pi_DT'],
+                                    rtol=1e-6) and
+                        np.allclose(qeos.temps, eos['temp'], rtol=1e-6),
+                        msg='Checking the synthetic QEOS table!')
+        multi = opp.OpgMulti.open_file(self.tmp_dir, 'syn', verbose=False)
+        self.assertTrue(np.allclose(multi['opp_mg'], eos['opp_mg'],
+                                    rtol=1e-6),
+                        msg='Checking the synthetic MULTI table!')
+        h5 = opp.OpgHdf5.open_file(fns['hdf5'])
+        try:
+            self.assertTrue(np.array_equal(h5['emp_mg'][:], eos['emp_mg']),
+                            msg='Checking the synthetic HDF5 table!')
+        finally:
+            h5.f.close()
+        imx = opp.OpacIonmix(fns['ionmix'], eos['Abar']/opp.NA, twot=True,
+                             man=True)
+        self.assertTrue(np.allclose(imx.zbar, eos['Zf_DT'], rtol=1e-5),
+                        msg='Checking the synthetic IONMIX table!')
+
+        with self.assertRaises(ValueError):
+            benchmarks.write_synthetic('tops', path, 7, 5, 0)
+
+
+class test_suite(unittest.TestCase):
+    def test_run(self):
+        report = benchmarks.run_benchmarks((6, 5, 4), repeat=2,
+                                           select=['parse/*', 'convert/*'],
+                                           min_run_time=0.01)
+        results = report['results']
+        self.assertTrue(sorted(results) ==
+                        sorted(['parse/' + fmt for fmt in
+                                benchmarks.SYNTHETIC_FORMATS] +
+                               ['convert/sesame-toEosDict',
+                                'convert/sesame-ionmix',
+                                'convert/sesame-hdf5', 'convert/hdf5-ionmix',
+                                'convert/tops-ionmix',
+                                'convert/multi-hdf5']) and
+                        all(res['values_per_s'] > 0 and res['mb_per_s'] > 0
+                            for res in results.values()),
+                        msg='Checking the benchmark results!')
+
+        baseline = copy.deepcopy(report)
+        self.assertTrue(benchmarks.compare_baseline(report, baseline) == [],
+                        msg='Checking the comparison to the same results!')
+        self.assertTrue(results['parse/qeos']['number'] > 1,
+                        msg='Checking that short cases are called several '
+                            'times per run!')
+        baseline['results']['parse/qeos']['time'] /= 2.
+        self.assertTrue([reg[:2] for reg in benchmarks.compare_baseline(
+                            report, baseline, time_floor=0.)] ==
+                        [('parse/qeos', 'time')],
+                        msg='Checking the detection of regressions!')
+        # Twice as slow, but by less than the floor.
+        baseline['results']['parse/qeos']['time'] = 1e-4
+        report['results']['parse/qeos']['time'] = 2e-4
+        self.assertTrue(benchmarks.compare_baseline(report, baseline) == [],
+                        msg='Checking the floor of the regressions!')
+        baseline['meta']['size'] = [7, 5, 4]
+        with self.assertRaises(ValueError):
+            benchmarks.compare_baseline(report, baseline)
+
+
+if __name__ == '__main__':
+    unittest.main()
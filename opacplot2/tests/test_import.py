@@ -0,0 +1,61 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import sys
+import unittest
+
+import opacplot2 as opp
+from opacplot2.tests import bench_import
+
+
+# Names exported by opacplot2 before the lazy imports, except for the
+# modules imported by the submodules (numpy, six, ...).
+EXPORTED_NAMES = [
+    'ATOMIC_SYMBOLS', 'ATOMIC_WEIGHTS', 'BC_BOUND', 'BC_EXTRAP',
+    'BC_EXTRAP_ZERO', 'ELE_AL', 'ELE_HE', 'ERG_TO_JOULE', 'FMT',
+    'GPA_TO_ERGCC', 'HBAR', 'INTERP_DFDD', 'INTERP_DFDT', 'INTERP_FUNC',
+    'JOULE_TO_ERG', 'KB', 'KELVIN_TO_EV', 'MAX_ELE', 'ME', 'MJKG_TO_ERGCC',
+    'MJKG_TO_ERGG', 'MULTI_EXT_FMT', 'NA', 'OpacIonmix', 'OpacPlotter',
+    'OpacTabop', 'OpgHdf5', 'OpgMulti', 'OpgQeos', 'OpgSesame', 'OpgTOPS',
+    'OplGrid', 'PFMT', 'PLANCK', 'RADCONST', 'SMALL_FLOAT_LOG', 'constants',
+    'eos_plotter', 'get_related_multi_tables', 'histdata', 'histogram',
+    'opac_plotter', 'opg_hdf5', 'opg_ionmix', 'opg_multi', 'opg_qeos',
+    'opg_sesame', 'opg_tabop', 'opg_tops', 'opl_grid', 'opl_list',
+    'plot_2D_map', 'plot_Zbar', 'plot_diff_mg_opac', 'plot_eos_field',
+    'plot_eos_grid', 'plot_zbar', 'tops_html2text', 'utils',
+    'writeIonmixFile']
+
+
+class test_import(unittest.TestCase):
+    @unittest.skipIf(sys.version_info < (3, 7),
+                     'Lazy imports need module __getattr__')
+    def test_import_time(self):
+        t_import, t_first, heavy = bench_import.time_import()
+        self.assertTrue(heavy == [],
+                        msg='Checking that import opacplot2 does not import '
+                            '{0}!'.format(heavy))
+        self.assertTrue(t_import < bench_import.IMPORT_BUDGET,
+                        msg='Checking that import opacplot2 takes less than '
+                            '{0} s!'.format(bench_import.IMPORT_BUDGET))
+
+    def test_lazy_attributes(self):
+        self.assertTrue(opp.OpacIonmix is opp.opg_ionmix.OpacIonmix and
+                        opp.utils.interpDT is not None and
+                        'OpgSesame' in dir(opp),
+                        msg='Checking lazy access to opacplot2 names!')
+        with self.assertRaises(AttributeError):
+            opp.not_an_attribute
+
+    def test_exported_names(self):
+        missing = [name for name in EXPORTED_NAMES
+                   if getattr(opp, name, None) is None]
+        self.assertTrue(missing == [],
+                        msg='Checking that {0} are still exported!'.format(
+                            missing))
+        self.assertTrue(opp.OplGrid is opp.opl_grid.OplGrid and
+                        opp.PFMT == opp.opg_multi.PFMT,
+                        msg='Checking the lazily exported names!')
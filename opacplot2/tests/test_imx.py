@@ -49,6 +49,16 @@ class test_imx(unittest.TestCase):
                                 self.abar/opp.NA,
                                 twot=True, man=True, verbose=False)
         eos_data_extended.extendToZero()
+        nt = self.eos_data.ntemp
+        self.assertTrue(eos_data_extended.ntemp == nt + 1 and
+                        eos_data_extended.temps[0] == 0. and
+                        eos_data_extended.dpedt.shape[1] == nt + 1 and
+                        np.all(eos_data_extended.dpedt[:, 0] == 0.) and
+                        eos_data_extended.rosseland.shape[1] == nt + 1,
+                        msg='Checking the zero temperature point!')
+        eos_data_extended.extendToZero()
+        self.assertTrue(eos_data_extended.ntemp == nt + 1,
+                        msg='Checking a second zero temperature point!')
 
     def test_writeIonmixFile(self):
         try:
@@ -72,6 +82,82 @@ class test_imx(unittest.TestCase):
             if os.path.exists(self.tmp_file):
                 os.remove(self.tmp_file)
 
+    def test_IonmixWriter(self):
+        # Writing the opacities one group plane at a time gives the same
+        # file as writeIonmixFile.
+        pars = {key: getattr(self.eos_data, key) for key in self.fields}
+        try:
+            opp.writeIonmixFile(self.tmp_file, (self.zmax,), self.fracs,
+                                **pars)
+            with opp.IonmixWriter(self.tmp_file_0, (self.zmax,), self.fracs,
+                                  pars['numDens'], pars['temps'],
+                                  ngroups=pars['ngroups'],
+                                  opac_bounds=pars['opac_bounds']) as imx:
+                for key in ['zbar', 'pion', 'pele', 'eion', 'eele']:
+                    imx.write(key, pars[key])
+                for key in ['rosseland', 'planck_absorb', 'planck_emiss']:
+                    for g in range(pars['ngroups']):
+                        imx.write(key, pars[key][:, :, g], group=g)
+                with self.assertRaises(ValueError):
+                    imx.write('zbar', pars['zbar'])
+            with open(self.tmp_file) as f_ref, open(self.tmp_file_0) as f:
+                self.assertTrue(f.read() == f_ref.read(),
+                                msg='Checking the streamed IONMIX file!')
+        finally:
+            for fn in [self.tmp_file, self.tmp_file_0]:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def test_IonmixWriter_constant(self):
+        # Missing and broadcast constant tables are written without being
+        # expanded, and give the same file as full arrays.
+        pars = {key: getattr(self.eos_data, key) for key in self.fields}
+        shape = pars['zbar'].shape
+        files = [self.tmp_file, self.tmp_file_0]
+        try:
+            pars.update(zbar=np.full(shape, 2.5), pion=np.zeros(shape))
+            opp.writeIonmixFile(files[0], (self.zmax,), self.fracs, **pars)
+            pars.update(zbar=np.broadcast_to(2.5, shape),
+                        pion=np.broadcast_to(0., shape))
+            opp.writeIonmixFile(files[1], (self.zmax,), self.fracs, **pars)
+            with open(files[0]) as f_ref, open(files[1]) as f:
+                self.assertTrue(f.read() == f_ref.read(),
+                                msg='Checking constant IONMIX tables!')
+        finally:
+            for fn in files:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def test_IonmixWriter_invalid(self):
+        pars = {key: getattr(self.eos_data, key) for key in self.fields}
+        rosseland = pars['rosseland'].copy()
+        rosseland[1, 2, 0] = 0.
+        rosseland[0, 1, 1] = np.nan
+        # The input tables are left untouched.
+        pars.update(rosseland=rosseland, log=['rosseland'])
+        try:
+            with self.assertRaises(ValueError) as cm:
+                opp.writeIonmixFile(self.tmp_file, (self.zmax,), self.fracs,
+                                    **pars)
+            self.assertTrue('group 0, density index 1, temperature index 2'
+                            in str(cm.exception),
+                            msg='Checking the location of invalid values!')
+            opp.writeIonmixFile(self.tmp_file, (self.zmax,), self.fracs,
+                                invalid='floor', floor=-30., **pars)
+            eos_data_new = opp.OpacIonmix(self.tmp_file, self.abar/opp.NA,
+                                          twot=True, man=True, verbose=False)
+            valid = rosseland > 0
+            self.assertTrue(np.allclose(eos_data_new.rosseland[valid],
+                                        np.log10(rosseland[valid]),
+                                        atol=1e-5) and
+                            np.all(eos_data_new.rosseland[~valid] == -30.) and
+                            rosseland[1, 2, 0] == 0. and
+                            np.isnan(rosseland[0, 1, 1]),
+                            msg='Checking logarithmic tables!')
+        finally:
+            if os.path.exists(self.tmp_file):
+                os.remove(self.tmp_file)
+
     def test_ionmix_write(self):
         # Verify the OpacIonmix.write function.
         try:
@@ -0,0 +1,183 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+import opacplot2 as opp
+from opacplot2.scripts import opac_convert
+
+
+class test_batch(unittest.TestCase):
+    BASE_DIR = os.path.join(os.path.dirname(__file__), 'data')
+
+    def setUp(self):
+        self.tmp_dir = tempfile.mkdtemp()
+        for fn in ['matr_009999.ses', 'He_snp.opp.gz', 'He_snp.opr.gz',
+                   'He_snp.opz.gz', 'He_snp.eps.gz']:
+            shutil.copy(os.path.join(self.BASE_DIR, fn), self.tmp_dir)
+        shutil.copy(os.path.join(self.BASE_DIR, 'matr_009999.ses'),
+                    os.path.join(self.tmp_dir, 'Al.ses'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_expand_inputs(self):
+        manifest = os.path.join(self.tmp_dir, 'tables.txt')
+        with open(manifest, 'w') as f:
+            f.write('# Nightly tables\nHe_snp.*\nAl.ses\n')
+        paths = opac_convert.expand_inputs(
+                    [os.path.join(self.tmp_dir, '*.ses')], manifest)
+        self.assertTrue([os.path.basename(p) for p in paths] ==
+                        ['Al.ses', 'matr_009999.ses', 'He_snp.eps.gz'],
+                        msg='Checking the expansion of the inputs!')
+
+    def test_convert(self):
+        summary = os.path.join(self.tmp_dir, 'summary.json')
+        argv = ['--Znum', '13', '--update', 'hash', '--summary', summary,
+                '-j', '2', os.path.join(self.tmp_dir, '*.ses')]
+        results = opac_convert.convert_tables(argv)
+        self.assertTrue([res['status'] for res in results] ==
+                        ['converted']*2 and os.path.exists(summary),
+                        msg='Checking the batch conversion!')
+        imx = opp.OpacIonmix(os.path.join(self.tmp_dir, 'Al.cn4'),
+                             26.98/opp.NA, twot=True, man=True)
+        self.assertTrue(imx.ntemp == 26 and np.all(imx.zbar > 0),
+                        msg='Checking the converted table!')
+
+        results = opac_convert.convert_tables(argv)
+        self.assertTrue([res['status'] for res in results] ==
+                        ['skipped']*2,
+                        msg='Checking that up-to-date tables are skipped!')
+        results = opac_convert.convert_tables(argv[:1] + ['14'] + argv[2:])
+        self.assertTrue([res['status'] for res in results] ==
+                        ['converted']*2,
+                        msg='Checking that the options are hashed!')
+
+        with self.assertRaises(SystemExit):
+            opac_convert.convert_tables(
+                    [os.path.join(self.tmp_dir, 'missing.ses')])
+
+    def test_failed_output(self):
+        # Zero pressures cannot be written as logarithms.
+        ses = os.path.join(self.tmp_dir, 'Al.ses')
+        argv = ['--Znum', '13', '--log', 'Pec_DT', '--invalid', 'fail',
+                '--update', 'mtime', ses]
+        for i in range(2):
+            with self.assertRaises(SystemExit):
+                opac_convert.convert_tables(argv)
+            self.assertTrue(sorted(os.listdir(self.tmp_dir)) ==
+                            sorted(['matr_009999.ses', 'Al.ses',
+                                    'He_snp.opp.gz', 'He_snp.opr.gz',
+                                    'He_snp.opz.gz', 'He_snp.eps.gz']),
+                            msg='Checking that failed outputs are removed!')
+        results = opac_convert.convert_tables(argv[:5] + ['clip'] + argv[6:])
+        self.assertTrue(results[0]['status'] == 'converted' and
+                        os.listdir(self.tmp_dir).count('Al.cn4') == 1,
+                        msg='Checking the conversion after a failure!')
+
+    def test_output_formats(self):
+        ses = os.path.join(self.tmp_dir, 'Al.ses')
+        opac_convert.convert_tables(['--Znum', '13', '-o', 'hdf5', ses])
+        eos_dict = opp.OpgSesame(ses, opp.OpgSesame.SINGLE).toEosDict(Znum=13)
+        h5 = opp.OpgHdf5.open_file(os.path.join(self.tmp_dir, 'Al.h5'))
+        try:
+            self.assertTrue(h5['Abar'] == eos_dict['Abar'] and
+                            np.array_equal(h5['Pec_DT'][:],
+                                           eos_dict['Pec_DT']),
+                            msg='Checking the HDF5 output!')
+        finally:
+            h5.f.close()
+
+        multi = os.path.join(self.tmp_dir, 'He_snp.opp.gz')
+        with self.assertRaises(SystemExit):
+            # Would overwrite the input files.
+            opac_convert.convert_tables(['--Znum', '2', '-o', 'multi',
+                                         multi])
+        for fmt in ['hdf5', 'multi']:
+            opac_convert.convert_tables(['--Znum', '2', '-o', fmt,
+                                         '--outname', os.path.join(
+                                             self.tmp_dir, 'He_out'),
+                                         multi])
+        ref = opp.OpgMulti.open_file(self.tmp_dir, 'He_snp', verbose=False)
+        out = opp.OpgMulti.open_file(self.tmp_dir, 'He_out', verbose=False)
+        h5 = opp.OpgHdf5.open_file(os.path.join(self.tmp_dir, 'He_out.h5'))
+        try:
+            self.assertTrue(np.allclose(out['opr_mg'], ref['opr_mg'],
+                                        rtol=1e-7) and
+                            np.allclose(out['zbar'], ref['zbar'], rtol=1e-7),
+                            msg='Checking the MULTI output!')
+            self.assertTrue(np.array_equal(h5['opp_mg'][:], ref['opp_mg']) and
+                            h5['opp_mg'].chunkshape[-1] == 1,
+                            msg='Checking the chunks of the HDF5 output!')
+        finally:
+            h5.f.close()
+
+    def test_hdf5_log(self):
+        # The invalid values of the logarithms are treated as for IONMIX.
+        ses = os.path.join(self.tmp_dir, 'Al.ses')
+        argv = ['--Znum', '13', '-o', 'hdf5', '--log', 'Pec_DT', ses]
+        results = opac_convert.convert_tables(argv + ['--invalid', 'clip'])
+        pec = opp.OpgSesame(ses, opp.OpgSesame.SINGLE).toEosDict(
+                    Znum=13)['Pec_DT']
+        failed = opac_convert.convert_file(
+                    opac_convert.get_input_data(argv)['args'], ses)
+        self.assertTrue(results[0]['status'] == 'converted' and
+                        'Pec_DT block to HDF5 (density index 6, temperature '
+                        'index 0)' in failed['error'],
+                        msg='Checking the location of invalid values!')
+        opac_convert.convert_tables(argv + ['--invalid', 'floor', '--floor',
+                                            '-30'])
+        h5 = opp.OpgHdf5.open_file(os.path.join(self.tmp_dir, 'Al.h5'))
+        try:
+            valid = pec > 0
+            self.assertTrue(np.allclose(h5['Pec_DT'][:][valid],
+                                        np.log10(pec[valid])) and
+                            np.all(h5['Pec_DT'][:][~valid] == -30.),
+                            msg='Checking logarithmic HDF5 tables!')
+        finally:
+            h5.f.close()
+
+    def test_hdf5_input(self):
+        # HDF5 tables are streamed to IONMIX without loading them.
+        ses = os.path.join(self.tmp_dir, 'Al.ses')
+        opac_convert.convert_tables(['--Znum', '13', '-o', 'hdf5', ses])
+        opac_convert.convert_tables(['--Znum', '13', '--outname',
+                                     os.path.join(self.tmp_dir, 'Al_ref'),
+                                     ses])
+        results = opac_convert.convert_tables(
+                    [os.path.join(self.tmp_dir, 'Al.h5')])
+        with open(os.path.join(self.tmp_dir, 'Al.cn4')) as f, \
+             open(os.path.join(self.tmp_dir, 'Al_ref.cn4')) as f_ref:
+            self.assertTrue(results[0]['status'] == 'converted' and
+                            f.read() == f_ref.read(),
+                            msg='Checking the conversion of HDF5 tables!')
+
+    def test_profile(self):
+        ses = os.path.join(self.tmp_dir, 'Al.ses')
+        profile = os.path.join(self.tmp_dir, 'profile.json')
+        results = opac_convert.convert_tables(['--Znum', '13',
+                                               '--profile_json', profile,
+                                               ses])
+        with open(profile) as f:
+            report = json.load(f)
+        self.assertTrue('profile' in results[0] and
+                        list(report['tables']) == [ses] and
+                        report['phases']['read']['bytes'] ==
+                        os.path.getsize(ses) and
+                        report['phases']['write/IonmixWriter.write_block']
+                        ['calls'] > 0,
+                        msg='Checking the profile of the conversion!')
+
+
+if __name__ == '__main__':
+    unittest.main()
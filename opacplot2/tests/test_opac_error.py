@@ -0,0 +1,153 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import argparse
+import os
+import tempfile
+import unittest
+
+import numpy as np
+
+from opacplot2.scripts import opac_error
+
+
+class _FakeIonmix(object):
+    # Stands in for Formats_Read of an IONMIX file.
+    def __init__(self, dens, temps, func, groups=None, opac=None):
+        class data(object):
+            pass
+        self.ft = 'ionmix'
+        self.path_in = 'fake.cn4'
+        self.data = data()
+        self.data.numDens = dens
+        self.data.temps = temps
+        D, T = np.meshgrid(dens, temps, indexing='ij')
+        for attr in ['pele', 'pion', 'zbar', 'eele', 'eion']:
+            setattr(self.data, attr, func(D, T))
+        self.common_keys = ['idens', 'temp', 'Pec_DT', 'Pi_DT', 'Zf_DT',
+                            'Uec_DT', 'Ui_DT']
+        if groups is not None:
+            self.data.opac_bounds = groups
+            for attr in ['rosseland', 'planck_absorb', 'planck_emiss']:
+                setattr(self.data, attr, opac)
+            self.common_keys += ['groups', 'opr_mg', 'opp_mg', 'emp_mg']
+
+
+class test_compare_eos(unittest.TestCase):
+    def test_bilinear(self):
+        # Bilinear data is reproduced exactly on any grid.
+        func = lambda d, t: 1. + 2.*d + 3.*t + d*t
+        eos_1 = _FakeIonmix(np.linspace(1., 10., 20),
+                            np.linspace(0.5, 5., 15), func)
+        eos_2 = _FakeIonmix(np.sort(np.random.RandomState(0)
+                                    .uniform(0.5, 12., 33)),
+                            np.linspace(0.1, 4., 11), func)
+        report = opac_error.compare_eos(eos_1, eos_2)
+        self.assertTrue(sorted(report) == sorted(eos_1.common_keys[2:]) and
+                        all(err[1] < 1e-13 for err in report.values()),
+                        msg='Checking compare_eos on bilinear data!')
+
+        eos_3 = _FakeIonmix(eos_2.data.numDens, eos_2.data.temps,
+                            lambda d, t: 1.01*func(d, t))
+        report = opac_error.compare_eos(eos_1, eos_3)
+        self.assertTrue(all(abs(err[1] - 0.01) < 1e-12
+                            for err in report.values()),
+                        msg='Checking compare_eos errors!')
+
+    def test_opac(self):
+        dens = np.linspace(1., 10., 20)
+        temps = np.linspace(0.5, 5., 15)
+        groups = np.logspace(0, 3, 41)
+        opac = np.random.RandomState(1).rand(20, 15, 40) + 0.5
+        eos_1 = _FakeIonmix(dens, temps, np.multiply, groups, opac)
+        # Finer group structure, covering part of the range.
+        fine = np.unique(np.concatenate([groups[5:], np.logspace(1, 2.5,
+                                                                 17)]))
+        mid = 0.5*(fine[1:] + fine[:-1])
+        opac_2 = opac[..., np.searchsorted(groups, mid) - 1]
+        opac_2[..., -1] *= 1.1
+        eos_2 = _FakeIonmix(dens, temps, np.multiply, fine, opac_2)
+        for grp in ['first', 'second', 'union']:
+            for chunk in [None, 3]:
+                report = opac_error.compare_opac(eos_1, eos_2, groups=grp,
+                                                 chunk=chunk)
+                err = report['opp_mg']
+                self.assertTrue(np.allclose(err['group_max'][:-1], 0.,
+                                            atol=1e-14) and
+                                abs(err['max'] - 0.1) < 1e-12 and
+                                err['groups'][0] == groups[5],
+                                msg='Checking compare_opac with {} '
+                                    'groups!'.format(grp))
+        report = opac_error.compare_opac(eos_1, eos_2, groups='union',
+                                         log_error=True)
+        self.assertTrue(np.isclose(report['opr_mg']['max'], np.log(1.1)),
+                        msg='Checking the log error!')
+
+    def test_caches(self):
+        func = lambda d, t: 1. + d*t
+        grids = {'a.cn4': (np.linspace(1., 10., 20), np.linspace(.5, 5., 15)),
+                 'b.cn4': (np.linspace(1., 9., 13), np.linspace(.5, 4., 11))}
+        reads = []
+        class FakeRead(opac_error.Formats_Read):
+            def __new__(cls, form, basedir, basename, path_in, **options):
+                reads.append(os.path.basename(path_in))
+                return _FakeIonmix(*grids[os.path.basename(path_in)] +
+                                   (func,))
+        args = argparse.Namespace(filetypes=['ionmix', 'ionmix'],
+                                  verbose=False, plot=False, writelog=False,
+                                  lin_grid=False, log_interp=False,
+                                  opac=False)
+        for num in [1, 2]:
+            for opt in ['mpi', 'Znum', 'Xfracs', 'filters', 'tabnum']:
+                setattr(args, '{}_{}'.format(opt, num), None)
+        pairs = [('a.cn4', 'b.cn4', None), ('b.cn4', 'a.cn4', None)]
+        read = opac_error.Formats_Read
+        opac_error.Formats_Read = FakeRead
+        try:
+            results, failures = opac_error.compare_pairs(pairs, args)
+            self.assertTrue(len(results) == 2 and failures == [] and
+                            sorted(reads) == ['a.cn4', 'b.cn4'],
+                            msg='Checking that files are only read once!')
+            # Different options for the second files.
+            args.mpi_2 = 26.98
+            del reads[:]
+            opac_error.compare_pairs(pairs, args)
+            self.assertTrue(len(reads) == 4,
+                            msg='Checking the options of the reader cache!')
+        finally:
+            opac_error.Formats_Read = read
+
+        for n in range(2*opac_error._REGRID_CACHE_SIZE):
+            opac_error.get_regrid(grids['a.cn4'][0], grids['a.cn4'][1],
+                                  grids['b.cn4'][0] + 1e-3*n,
+                                  grids['b.cn4'][1])
+        self.assertTrue(len(opac_error._regrid_cache) ==
+                        len(opac_error._regrid_cache_keys) ==
+                        opac_error._REGRID_CACHE_SIZE,
+                        msg='Checking the size of the regrid cache!')
+
+    def test_read_pairs(self):
+        fd, path = tempfile.mkstemp(suffix='.txt')
+        with os.fdopen(fd, 'w') as f:
+            f.write('# Reference vs. converted\n\n'
+                    'a.ses b.cn4\n'
+                    'c.cn4 d.cn4 ionmix,ionmix  # Comment\n')
+        try:
+            pairs = opac_error.read_pairs(path)
+        finally:
+            os.remove(path)
+        basedir = os.path.dirname(path)
+        self.assertTrue(pairs == [(os.path.join(basedir, 'a.ses'),
+                                   os.path.join(basedir, 'b.cn4'), None),
+                                  (os.path.join(basedir, 'c.cn4'),
+                                   os.path.join(basedir, 'd.cn4'),
+                                   ['ionmix', 'ionmix'])],
+                        msg='Checking the batch file parsing!')
+
+
+if __name__ == '__main__':
+    unittest.main()
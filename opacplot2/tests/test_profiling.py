@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import json
+import os
+import unittest
+
+import numpy as np
+
+import opacplot2 as opp
+from opacplot2 import profiling
+
+
+class test_profiler(unittest.TestCase):
+    def test_disabled(self):
+        self.assertTrue(profiling.active() is None and
+                        profiling.timer('phase') is profiling._NULL_PHASE,
+                        msg='Checking that nothing is recorded by default!')
+        with profiling.timer('phase') as phase:
+            phase.add(nbytes=10)
+        profiling.count('items')
+
+    def test_phases(self):
+        @profiling.timed('inner')
+        def inner(n):
+            profiling.add(nbytes=8*n, count=n)
+            return np.ones(n)
+
+        with profiling.Profiler(memory=True) as prof:
+            with profiling.timer('outer', count=1):
+                for i in range(3):
+                    inner(1000)
+                profiling.count('items', 5)
+            inner(10)
+        self.assertTrue(profiling.active() is None,
+                        msg='Checking that the profiler is deactivated!')
+        phases = prof.report()['phases']
+        self.assertTrue(sorted(phases) == ['inner', 'outer', 'outer/inner',
+                                           'outer/items'] and
+                        phases['outer/inner']['calls'] == 3 and
+                        phases['outer/inner']['bytes'] == 24000 and
+                        phases['outer/items']['count'] == 5 and
+                        phases['outer']['time'] >=
+                        phases['outer/inner']['time'],
+                        msg='Checking the nested phases!')
+        self.assertTrue(phases['outer/inner']['peak'] >= 8000 and
+                        phases['outer']['alloc'] is not None,
+                        msg='Checking the memory of the phases!')
+
+        report = json.loads(prof.to_json())
+        merged = profiling.merge_reports([report, report])
+        self.assertTrue(merged['phases']['inner']['calls'] == 2 and
+                        merged['elapsed'] == 2*report['elapsed'] and
+                        '\n  inner ' in prof.format(),
+                        msg='Checking the merge of the reports!')
+
+    def test_readers(self):
+        fn = os.path.join(os.path.dirname(__file__), 'data',
+                          'matr_009999.ses')
+        with profiling.Profiler() as prof:
+            opp.OpgSesame(fn, opp.OpgSesame.SINGLE).toEosDict(Znum=13)
+        phases = prof.report()['phases']
+        self.assertTrue(phases['OpgSesame.parse']['bytes'] ==
+                        os.path.getsize(fn) and
+                        phases['OpgSesame.parse/OpgSesame.readEntries']
+                        ['calls'] == 6 and
+                        'OpgSesame.toEosDict/EosMergeGrids' in phases,
+                        msg='Checking the profile of the SESAME reader!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+
+import unittest
+
+import numpy as np
+
+import opacplot2 as opp
+from opacplot2 import regrid
+
+
+class test_axes(unittest.TestCase):
+    def test_overlap(self):
+        a = np.array([1., 2., 3., 4., 5.])
+        b = np.array([3.5, 4.5, 5.5, 6.])
+        self.assertTrue(np.array_equal(regrid.overlap_axis(a, b),
+                                       [3.5, 4., 4.5, 5.]) and
+                        np.array_equal(regrid.overlap_axis(b, a),
+                                       [3.5, 4., 4.5, 5.]),
+                        msg='Checking the overlap of two axes!')
+        # The last point of the second array used to be dropped.
+        c = np.array([0.5, 2.5, 4.])
+        self.assertTrue(np.array_equal(opp.utils.intersect_1D_sorted_arr(a, c),
+                                       [1., 2., 2.5, 3., 4.]) and
+                        np.array_equal(opp.utils.intersect_1D_sorted_arr(c, a),
+                                       [1., 2., 2.5, 3., 4.]),
+                        msg='Checking intersect_1D_sorted_arr is symmetric!')
+        self.assertTrue(regrid.overlap_axis(a, a + 10) is None,
+                        msg='Checking disjoint axes!')
+        self.assertTrue(np.array_equal(regrid.union_axis(a, b),
+                                       [1, 2, 3, 3.5, 4, 4.5, 5, 5.5, 6]),
+                        msg='Checking the union of two axes!')
+
+
+class test_RectRegrid(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.RandomState(3)
+        self.dens = np.sort(rng.uniform(1e-3, 1e2, 30))
+        self.temp = np.sort(rng.uniform(1e-1, 1e3, 25))
+        self.dens_new = np.sort(rng.uniform(1e-3, 1e2, 40))
+        self.temp_new = np.sort(rng.uniform(1e-1, 1e3, 35))
+
+    def test_bilinear(self):
+        # Bilinear functions are reproduced exactly inside the grid.
+        f = lambda d, t: (2. + 3.*d[:, None] - 0.5*t[None, :]
+                          + 0.1*d[:, None]*t[None, :])
+        dn = np.clip(self.dens_new, self.dens[0], self.dens[-1])
+        tn = np.clip(self.temp_new, self.temp[0], self.temp[-1])
+        res = regrid.regrid(f(self.dens, self.temp), self.dens, self.temp,
+                            dn, tn)
+        self.assertTrue(np.allclose(res, f(dn, tn), rtol=1e-12),
+                        msg='Checking separable bilinear interpolation!')
+
+    def test_log_groups(self):
+        rng = np.random.RandomState(4)
+        table = rng.rand(len(self.dens), len(self.temp), 5)
+        rg = regrid.RectRegrid(self.dens, self.temp, self.dens_new,
+                               self.temp_new, logd=True, logt=True)
+        res = rg(table)
+        ref = np.empty(rg.shape + (5,))
+        ld, lt = np.log(self.dens), np.log(self.temp)
+        for ig in range(5):
+            tmp = np.array([np.interp(np.log(self.temp_new), lt, row)
+                            for row in table[:, :, ig]])
+            ref[:, :, ig] = np.array([np.interp(np.log(self.dens_new), ld,
+                                                col) for col in tmp.T]).T
+        self.assertTrue(res.shape == (40, 35, 5) and
+                        np.allclose(res, ref, rtol=1e-12),
+                        msg='Checking log-linear interpolation with groups!')
+
+    def test_identity_extrap(self):
+        table = np.arange(30*25, dtype=float).reshape(30, 25)
+        self.assertTrue(np.array_equal(regrid.regrid(table, self.dens,
+                                                     self.temp, self.dens,
+                                                     self.temp), table),
+                        msg='Checking regridding onto the same grid!')
+        out = regrid.regrid(table, self.dens, self.temp,
+                            [self.dens[0]/2, self.dens[-1]], [self.temp[0]],
+                            extrap='nan')
+        self.assertTrue(np.isnan(out[0, 0]) and out[1, 0] == table[-1, 0],
+                        msg='Checking NaN outside of the grid!')
+        lin = regrid.regrid(table, self.dens, self.temp, self.dens,
+                            [2*self.temp[-1] - self.temp[-2]],
+                            extrap='linear')
+        self.assertTrue(np.allclose(lin[:, 0], 2*table[:, -1] - table[:, -2]),
+                        msg='Checking linear extrapolation!')
+
+
+class test_GroupRebin(unittest.TestCase):
+    def test_rebin(self):
+        rng = np.random.RandomState(5)
+        groups = np.cumsum(rng.rand(21))
+        opac = rng.rand(3, 4, 20)
+        # Union of boundaries: the values are copied.
+        new_groups = regrid.union_axis(groups, rng.uniform(groups[0],
+                                                           groups[-1], 7))
+        res = regrid.GroupRebin(groups, new_groups)(opac)
+        mid = 0.5*(new_groups[1:] + new_groups[:-1])
+        ref = opac[..., np.searchsorted(groups, mid) - 1]
+        self.assertTrue(np.allclose(res, ref, rtol=1e-14),
+                        msg='Checking rebinning onto finer groups!')
+        # Coarse groups: the integral over the groups is conserved.
+        coarse = groups[::4]
+        rb = regrid.GroupRebin(groups, coarse)
+        res = rb(opac)
+        self.assertTrue(np.allclose((res*np.diff(coarse)).sum(axis=-1),
+                                    (opac*np.diff(groups)).sum(axis=-1)),
+                        msg='Checking rebinning onto coarser groups!')
+        self.assertTrue(np.allclose(rb(opac, slice(1, 3)), res[..., 1:3],
+                                    rtol=1e-14),
+                        msg='Checking rebinning of a chunk of groups!')
+        opac[0, 0, 0] = 0.
+        harm = regrid.GroupRebin(groups, coarse, harmonic=True)(opac)
+        ref = 1/(np.diff(groups)[:4]/opac[1, 1, :4]).sum()*np.diff(coarse)[0]
+        self.assertTrue(harm[0, 0, 0] < 1e-300 and np.isclose(harm[1, 1, 0],
+                                                             ref),
+                        msg='Checking harmonic rebinning!')
+
+
+class test_extend_grid(unittest.TestCase):
+    def test_extend(self):
+        dens = np.array([1., 2., 4.])
+        temp = np.array([1., 10., 100., 1000.])
+        f = lambda d, t: 2. + 3.*d[:, None] + 0.5*np.log10(t)[None, :]
+        table = f(dens, temp)
+        opac = np.dstack([table, 2*table])
+        new_dens, new_temp = [0.5, 8.], [0.1, 1e4]
+        dn, tn, tabs = regrid.extend_grid({'tab': table, 'opac': opac}, dens,
+                                          temp, new_dens, new_temp,
+                                          mode='linear', logt=True)
+        self.assertTrue(np.array_equal(dn, [0.5, 1., 2., 4., 8.]) and
+                        np.array_equal(tn, [0.1, 1., 10., 100., 1000., 1e4]),
+                        msg='Checking the extended grid!')
+        self.assertTrue(np.allclose(tabs['tab'], f(dn, tn)) and
+                        np.allclose(tabs['opac'][..., 1], 2*f(dn, tn)),
+                        msg='Checking linear extrapolation!')
+
+        _, _, tabs = regrid.extend_grid([table], dens, temp, new_dens,
+                                        new_temp, mode='edge')
+        self.assertTrue(np.array_equal(tabs[0][1:-1, 1:-1], table) and
+                        tabs[0][0, 0] == table[0, 0] and
+                        np.array_equal(tabs[0][-1, 1:-1], table[-1]),
+                        msg='Checking the boundary values!')
+        _, _, tabs = regrid.extend_grid([opac], dens, temp,
+                                        new_temp=[0.], value=-1.)
+        self.assertTrue(tabs[0].shape == (3, 5, 2) and
+                        np.all(tabs[0][:, 0] == -1.),
+                        msg='Checking constant values!')
+        with self.assertRaises(ValueError):
+            regrid.extend_grid([table], dens, temp, new_dens=[3.])
+
+    def test_eos_dict(self):
+        eos = {'dens': np.array([1., 2.]), 'temp': np.array([1., 2., 3.]),
+               'idens': np.array([10., 20.]), 'Pec_DT': np.ones((2, 3)),
+               'opp_mg': np.ones((2, 3, 4)), 'groups': np.arange(5.),
+               'Znum': np.array([13])}
+        regrid.extend_eos_dict(eos, new_dens=[4.], new_temp=[0.])
+        self.assertTrue(np.array_equal(eos['idens'], [10., 20., 40.]) and
+                        eos['Pec_DT'].shape == (3, 4) and
+                        eos['opp_mg'].shape == (3, 4, 4) and
+                        eos['opp_mg'][-1].sum() == 0. and
+                        len(eos['groups']) == 5,
+                        msg='Checking the extension of an EoS dictionary!')
+
+        eos = opp.utils.synthetic_eos_dict(4, 3, 2)
+        idens = eos['idens'].copy()
+        regrid.extend_eos_dict(eos, new_dens=[0.])
+        regrid.extend_eos_dict(eos, new_temp=[1e5], mode='edge')
+        self.assertTrue(np.allclose(eos['idens'][1:], idens) and
+                        eos['idens'][0] == 0.,
+                        msg='Checking the ion densities after a zero '
+                            'density!')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -34,3 +34,12 @@ class test_sesame(unittest.TestCase):
             self.data['total_temps'],
             self.data['ele_temps'],
             err_msg='Checking that the temperatures are consistent!')
+
+    def test_sesame_zbar(self):
+        eos_dict = self.fh.toEosDict(Znum=13)
+        ref = opp.utils.thomas_fermi_ionization(
+                        eos_dict['dens'][:, None], eos_dict['temp'][None, :],
+                        13, eos_dict['Abar'])
+        np.testing.assert_allclose(
+            eos_dict['Zf_DT'], ref, rtol=1e-14,
+            err_msg='Checking the Thomas-Fermi ionization of toEosDict!')
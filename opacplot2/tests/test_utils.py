@@ -52,6 +52,110 @@ class test_randomize_ionmix(unittest.TestCase):
             if os.path.exists(self.tmp_file):
                 os.remove(self.tmp_file)
 
+    def test_randomize_seed(self):
+        tmp_files = [self.tmp_file, self.tmp_file + '_1']
+        try:
+            for fn in tmp_files:
+                opp.utils.randomize_ionmix(self.reference_file, fn, seed=3)
+            with open(self.reference_file) as f_ref, \
+                 open(tmp_files[0]) as f_0, open(tmp_files[1]) as f_1:
+                lines_ref, lines_0 = f_ref.readlines(), f_0.readlines()
+                self.assertTrue(lines_0 == f_1.readlines(),
+                                msg='Checking the seed of randomize_ionmix!')
+            self.assertTrue([len(line) for line in lines_0] ==
+                            [len(line) for line in lines_ref] and
+                            lines_0[:4] == lines_ref[:4],
+                            msg='Checking the layout of the randomized '
+                                'file!')
+        finally:
+            for fn in tmp_files:
+                if os.path.exists(fn):
+                    os.remove(fn)
+
+    def test_synthetic_ionmix(self):
+        eos_dict = opp.utils.synthetic_eos_dict(7, 5, 3, seed=0)
+        try:
+            opp.utils.synthetic_ionmix(self.tmp_file, 7, 5, 3, seed=0)
+            imx = opp.OpacIonmix(self.tmp_file, eos_dict['Abar']/opp.NA,
+                                 twot=True, man=True, verbose=False)
+        finally:
+            if os.path.exists(self.tmp_file):
+                os.remove(self.tmp_file)
+        self.assertTrue(imx.rosseland.shape == (7, 5, 3) and
+                        np.all(imx.planck_absorb > 0) and
+                        np.allclose(imx.pele, eos_dict['Pec_DT'],
+                                    rtol=1e-5) and
+                        np.allclose(imx.temps, eos_dict['temp'], rtol=1e-5),
+                        msg='Checking the synthetic IONMIX file!')
+        self.assertTrue(eos_dict['opp_mg'].shape == (7, 5, 3) and
+                        not opp.utils.check_eos_consistency(eos_dict)['fail'],
+                        msg='Checking the synthetic EoS dictionary!')
+
+class test_planck_int(unittest.TestCase):
+    def setUp(self):
+        self.x = np.concatenate([[-1., 0.],
+                                 np.logspace(-4, 3, 2001)])
+
+    def test_array_kernels(self):
+        for tol, fs, fa in opp.utils._planck_int_tol_map:
+            res_s = fs(self.x)
+            res_a = fa(self.x)
+            self.assertTrue(np.allclose(res_a, res_s, rtol=1e-14, atol=0),
+                            msg='Checking {0} against the scalar '
+                                'kernel!'.format(fa.__name__))
+            self.assertTrue(fa(2.5) == fa(np.array([2.5]))[0] and
+                            np.isnan(fa(np.nan)),
+                            msg='Checking {0} on scalars!'.format(fa.__name__))
+
+    def test_tolerance(self):
+        from scipy.integrate import quad
+        x = np.logspace(-2, 2, 41)
+        ref = np.array([quad(lambda t: t**3/np.expm1(t), 0, xi)[0]
+                        for xi in x])
+        try:
+            for tol, fs, fa in opp.utils._planck_int_tol_map:
+                opp.utils.planck_int_set_tolerance(tol)
+                self.assertTrue(np.all(np.abs(opp.utils.planck_int(x) - ref)
+                                       <= 1.01*tol*np.maximum(ref, 1.)),
+                                msg='Checking planck_int tolerance!')
+        finally:
+            opp.utils.planck_int_set_tolerance(3.7610575515626060127e-04)
+
+    def test_integrator(self):
+        x = np.logspace(-2, 2, 41)
+        pi_low = opp.utils.PlanckIntegrator(2e-2)
+        pi_high = opp.utils.PlanckIntegrator(1e-9)
+        glob = opp.utils.planck_int(x)
+        self.assertTrue(pi_low.kernel.__name__.startswith('planck_int_205') and
+                        pi_high.kernel.__name__.startswith('planck_int_621') and
+                        pi_high.tol > 1e-9 and
+                        np.all(pi_high(x) == pi_high.kernel(x)) and
+                        np.all(opp.utils.planck_int(x) == glob),
+                        msg='Checking PlanckIntegrator tolerances!')
+
+    def test_group_table(self):
+        groups = np.concatenate([[0.], np.logspace(-1, 4, 31)])
+        temps = np.logspace(-3, 8, 1001)
+        pi = opp.utils.PlanckIntegrator(1e-8)
+        ref = np.diff(opp.utils._planck_int_m(groups/temps[:, np.newaxis], 3),
+                      axis=-1)
+        for tol in [1e-6, 1e-10]:
+            table = pi.tabulate(groups, tol=tol)
+            dp = table(temps)
+            self.assertTrue(dp.shape == (1001, 31) and
+                            table.max_error <= tol and
+                            np.abs(dp - ref).max() <= table.max_error,
+                            msg='Checking PlanckGroupTable error bound!')
+        with self.assertRaises(ValueError):
+            # Below the rounding error.
+            pi.tabulate(groups, tol=1e-17)
+        with self.assertRaises(ValueError):
+            opp.utils.PlanckGroupTable(groups, tol=1e-12, max_cells=256)
+        self.assertTrue(np.abs(pi.group_integrals(groups, temps) - ref).max()
+                        < 1e-7,
+                        msg='Checking PlanckIntegrator.group_integrals!')
+
+
 class test_interpDT(unittest.TestCase):
     BASE_DIR = os.path.join(os.path.dirname(__file__), 'data')
     reference_name = os.path.join(BASE_DIR, 'imx_sample.cn4')
@@ -113,6 +217,119 @@ class test_interpDT(unittest.TestCase):
                         msg='Checking that interpDT finds positive'
                             'DFDT for ion pressure!')
 
+    def test_interp_arrays(self):
+        interp = opp.utils.interpDT(self.pion, self.dens, self.temps)
+        d = np.linspace(self.dens[0], self.dens[-1], 7)
+        t = np.linspace(self.temps[0], self.temps[-1], 7)
+        res = interp(d, t)
+        self.assertTrue(res.shape == d.shape and
+                        np.all(res == [interp(di, ti) for di, ti in zip(d, t)]),
+                        msg='Checking that interpDT accepts arrays!')
+
+    def test_interp_bilinear(self):
+        # A bilinear function is interpolated exactly, and so are its
+        # derivatives.
+        f = lambda d, t: 2. + 3.*d - 0.5*t + 0.1*d*t
+        arr = f(self.dens[:, np.newaxis], self.temps[np.newaxis, :])
+        d = np.linspace(self.dens[0], self.dens[-1], 11)
+        t = np.linspace(self.temps[0], self.temps[-1], 11)[::-1]
+        for lookup, ref in [(opp.INTERP_FUNC, f(d, t)),
+                            (opp.INTERP_DFDD, 3. + 0.1*t),
+                            (opp.INTERP_DFDT, -0.5 + 0.1*d)]:
+            interp = opp.utils.interpDT(arr, self.dens, self.temps,
+                                        lookup=lookup)
+            self.assertTrue(np.allclose(interp(d, t), ref, rtol=1e-10),
+                            msg='Checking interpDT on a bilinear function!')
+
+
+class test_RectGridInterp(unittest.TestCase):
+    def setUp(self):
+        self.dens = np.array([1e-3, 3e-3, 1e-2, 0.1, 0.2, 1., 10.])
+        self.temps = np.array([1., 2., 5., 10., 30., 100.])
+        self.f = lambda d, t: 2. + 3.*d - 0.5*t + 0.1*d*t
+        self.arr = self.f(self.dens[:, np.newaxis], self.temps[np.newaxis, :])
+        self.engines = ['numpy']
+        if opp.utils.njit is not None:
+            self.engines.append('numba')
+
+    def test_nonuniform(self):
+        d = np.array([1e-3, 2e-3, 0.15, 5., 10.])
+        t = np.array([1.5, 100., 7., 1., 50.])
+        for engine in self.engines:
+            grid = opp.utils.RectGridInterp(self.dens, self.temps,
+                                            engine=engine)
+            self.assertTrue(np.allclose(grid(self.arr, d, t), self.f(d, t)),
+                            msg='Checking bilinear interpolation on a '
+                                'nonuniform grid ({0})!'.format(engine))
+            groups = np.stack([self.arr, 2*self.arr], axis=-1)
+            res = grid(groups, d, t)
+            self.assertTrue(res.shape == (5, 2) and
+                            np.allclose(res[:, 1], 2*self.f(d, t)),
+                            msg='Checking interpolation of trailing '
+                                'dimensions ({0})!'.format(engine))
+
+    def test_log_axes(self):
+        from scipy.interpolate import RegularGridInterpolator
+        arr = np.log(self.dens[:, np.newaxis]*self.temps[np.newaxis, :]**2)
+        ref = RegularGridInterpolator((np.log10(self.dens),
+                                       np.log10(self.temps)), arr)
+        d = np.logspace(-3, 1, 9)
+        t = np.logspace(0, 2, 9)
+        for engine in self.engines:
+            grid = opp.utils.RectGridInterp(self.dens, self.temps, logx=True,
+                                            logy=True, engine=engine)
+            self.assertTrue(np.allclose(grid(arr, d, t),
+                                        ref(np.log10([d, t]).T)),
+                            msg='Checking interpolation on log axes '
+                                '({0})!'.format(engine))
+
+    def test_extrap(self):
+        d = np.array([1e-4, 20., 0.5])
+        t = np.array([50., 200., 0.1])
+        dc = np.clip(d, self.dens[0], self.dens[-1])
+        tc = np.clip(t, self.temps[0], self.temps[-1])
+        for engine in self.engines:
+            res = {}
+            for extrap in ['nearest', 'linear', 'clamp']:
+                grid = opp.utils.RectGridInterp(self.dens, self.temps,
+                                                extrap=extrap, engine=engine)
+                res[extrap] = grid(self.arr, d, t)
+            self.assertTrue(np.allclose(res['nearest'], self.f(dc, tc)),
+                            msg='Checking nearest extrapolation!')
+            self.assertTrue(np.allclose(res['linear'], self.f(d, t)),
+                            msg='Checking linear extrapolation!')
+            self.assertTrue(np.all(res['clamp'] <= self.arr.max()) and
+                            np.all(res['clamp'] >= self.arr.min()),
+                            msg='Checking clamped extrapolation!')
+
+    def test_fastInterpDT(self):
+        eos_dict = {'dens': self.dens, 'temp': self.temps, 'Pi_DT': self.arr}
+        fi = opp.utils.fastInterpDT(eos_dict)
+        self.assertTrue(np.allclose(fi['Pi_DT'](0.5, 20.), self.f(0.5, 20.)),
+                        msg='Checking fastInterpDT on an EoS dictionary!')
+
+    def test_fastInterpDT_all_groups(self):
+        groups = np.logspace(-1, 3, 6)
+        opr = np.random.RandomState(0).rand(len(self.dens), len(self.temps), 5)
+        eos_dict = {'dens': self.dens, 'temp': self.temps, 'groups': groups,
+                    'opr_mg': opr, 'emp_mg': 2*opr}
+        fi = opp.utils.fastInterpDT(eos_dict)
+        d = np.array([2e-3, 0.5, 3.])
+        t = np.array([1.5, 20., 80.])
+        alphaa = fi.alphaa_all(d, t)
+        emr = fi.emr_all(d, t)
+        self.assertTrue(alphaa.shape == (3, 5) and emr.shape == (3, 5),
+                        msg='Checking the shapes of all groups lookups!')
+        for ig in range(1, 6):
+            self.assertTrue(
+                np.allclose(alphaa[:, ig-1], fi['alphaa_{0}'.format(ig)](d, t))
+                and np.allclose(emr[:, ig-1], fi['emr_{0}'.format(ig)](d, t)),
+                msg='Checking all groups lookups against single groups!')
+        fi = opp.utils.fastInterpDT(eos_dict, planck_tol=1e-10)
+        self.assertTrue(np.allclose(fi.emr_all(d, t), emr, rtol=1e-3) and
+                        np.allclose(fi['emr_2'](d, t), emr[:, 1], rtol=1e-3),
+                        msg='Checking emission rates from a planck table!')
+
 
 class test_EosMergeGrids(unittest.TestCase):
     def setUp(self):
@@ -136,6 +353,34 @@ class test_EosMergeGrids(unittest.TestCase):
             == self.md['ele_dens'].size,
             msg='Check if our dens filter is actually working!')
 
+    def test_merged_tables(self):
+        for key in ['ele_pres', 'ele_eint', 'ioncc_pres', 'ioncc_eint']:
+            species = key.split('_')[0]
+            rows = np.nonzero(self.md.mask[species + '_dens'])[0]
+            cols = np.nonzero(self.md.mask[species + '_temps'])[0]
+            ref = self.eos_data[key][rows][:, cols]
+            self.assertTrue(np.array_equal(self.md[key], ref),
+                            msg='Checking merged table {0}!'.format(key))
+            self.assertTrue(self.md[key] is self.md[key],
+                            msg='Checking that merged tables are cached!')
+            self.assertFalse(self.md[key].flags.writeable,
+                             msg='Checking that merged tables are '
+                                 'read-only!')
+
+    def test_read_only(self):
+        # Every other density: the merged tables are copies.
+        md = opp.utils.EosMergeGrids(
+                    self.eos_data,
+                    filter_dens=lambda x: np.arange(len(x)) % 2 == 0,
+                    thresh=['ele_pres'])
+        for key in ['ele_dens', 'ele_pres', 'ioncc_eint']:
+            self.assertFalse(np.may_share_memory(md[key],
+                                                 self.eos_data[key]) or
+                             md[key].flags.writeable,
+                             msg='Checking that copies are read-only!')
+        with self.assertRaises(ValueError):
+            np.log10(md['ioncc_eint'], out=md['ioncc_eint'])
+
     def check_filter_dens(self):
         self.assertTrue(
             (self.md['ele_temps'] > 1).sum() \
@@ -144,3 +389,233 @@ class test_EosMergeGrids(unittest.TestCase):
 
 
 
+
+class test_ensure_monotonicity(unittest.TestCase):
+    def reference(self, X, Y, table, axis):
+        # Cell by cell repair.
+        table = table.copy()
+        if axis == 'temp':
+            table = table.T
+        for y_idx in range(1, table.shape[1]):
+            for x_idx in range(1, table.shape[0]):
+                if table[x_idx, y_idx] - table[x_idx-1, y_idx] < 0.0:
+                    table[x_idx, y_idx] = table[x_idx-1, y_idx] + 1e-9
+        return table.T if axis == 'temp' else table
+
+    def test_identical(self):
+        rng = np.random.RandomState(1)
+        dens = np.logspace(-3, 2, 40)
+        temp = np.logspace(0, 3, 30)
+        table = np.cumsum(rng.rand(40, 30) - 0.1, axis=0)
+        table = np.cumsum(table - 0.1, axis=1)
+        table[5, 7] = table[6, 7] = table[4, 7] - 1e-10
+        table[10, 3] = np.nan
+        for axis in ['dens', 'temp']:
+            ref = self.reference(dens, temp, table, axis)
+            res, report = opp.utils.ensure_monotonicity(dens, temp, table,
+                                                        axis=axis,
+                                                        report=True)
+            self.assertTrue(np.array_equal(res, ref, equal_nan=True),
+                            msg='Checking ensure_monotonicity along '
+                                '{0}!'.format(axis))
+            changed = np.nonzero(~((res == table) |
+                                   (np.isnan(res) & np.isnan(table))))
+            self.assertTrue(report['count'] == len(changed[0]) > 0 and
+                            np.array_equal(report['index'], changed) and
+                            np.array_equal(report['new'], res[changed]),
+                            msg='Checking the repair report!')
+
+
+class test_interp_isochores_1d(unittest.TestCase):
+    def test_interp(self):
+        rng = np.random.RandomState(2)
+        temps_ion = np.logspace(-1, 4, 60)
+        temps_ele = np.sort(rng.choice(temps_ion[5:-5], 25, replace=False))
+        eos = {'ele_temps': temps_ele, 'ioncc_temps': temps_ion,
+               'ele_dens': np.logspace(-3, 2, 40),
+               'ele_pres': rng.rand(40, 25) + 1.0,
+               'ele_eint': rng.rand(40, 25) - 0.5}
+        pres, eint = eos['ele_pres'], eos['ele_eint']
+        res = opp.utils.interp_isochores_1d(eos)
+        ref = np.array([np.interp(temps_ion, temps_ele, row) for row in pres])
+        self.assertTrue(res is eos and
+                        np.allclose(eos['ele_pres'], ref, rtol=1e-14) and
+                        np.array_equal(eos['ele_temps'], temps_ion),
+                        msg='Checking the linear interpolation!')
+        on_grid = np.isin(temps_ion, temps_ele)
+        self.assertTrue(np.array_equal(eos['ele_eint'][:, on_grid], eint),
+                        msg='Checking the copy of the matching isotherms!')
+
+        eos.update(ele_temps=temps_ele, ele_pres=pres, ele_eint=eint)
+        opp.utils.interp_isochores_1d(eos, log=True)
+        ref = np.exp([np.interp(np.log(temps_ion), np.log(temps_ele),
+                                np.log(row)) for row in pres])
+        ref_eint = np.array([np.interp(temps_ion, temps_ele, row)
+                             for row in eint])
+        pos = np.isin(temps_ion, temps_ele)
+        self.assertTrue(np.allclose(eos['ele_pres'], ref, rtol=1e-12),
+                        msg='Checking the log-log interpolation!')
+        self.assertTrue(np.all(np.isfinite(eos['ele_eint'])) and
+                        np.array_equal(eos['ele_eint'][:, pos],
+                                       ref_eint[:, pos]),
+                        msg='Checking log interpolation of negative values!')
+
+
+class test_thomas_fermi_ionization(unittest.TestCase):
+    def test_grid(self):
+        dens = np.logspace(-4, 3, 50)
+        temp = np.logspace(-2, 4, 40)
+        D, T = np.meshgrid(dens, temp)
+        ref = opp.utils.thomas_fermi_ionization(D, T, 13, 26.98).T
+        zbar = opp.utils.thomas_fermi_ionization_grid(dens, temp, 13, 26.98)
+        self.assertTrue(np.allclose(zbar, ref, rtol=1e-14, atol=0) and
+                        np.all((zbar > 0) & (zbar <= 13)),
+                        msg='Checking the Thomas-Fermi ionization grid!')
+        # Cold solid aluminum and high temperature limit.
+        self.assertTrue(abs(opp.utils.thomas_fermi_ionization(2.7, 0., 13,
+                                                              26.98)
+                            - 2.44) < 0.01 and
+                        zbar[0, -1] > 12.9,
+                        msg='Checking Thomas-Fermi ionization values!')
+        zbar[:] = 0.
+        again = opp.utils.thomas_fermi_ionization_grid(dens, temp, 13, 26.98)
+        self.assertTrue(np.allclose(again, ref, rtol=1e-14, atol=0),
+                        msg='Checking the cached grid is not modified!')
+        self.assertTrue(np.isnan(opp.utils.thomas_fermi_ionization(0., 1., 1,
+                                                                   1.)),
+                        msg='Checking null density!')
+
+
+class test_check_eos_consistency(unittest.TestCase):
+    def setUp(self):
+        # Ideal gas with constant heat capacity: F = -c T ln(T) + T ln(rho)
+        # so that P = rho T and E = c T.
+        self.dens = np.logspace(-2, 2, 200)
+        self.temp = np.logspace(0, 3, 150)
+        d, t = np.meshgrid(self.dens, self.temp, indexing='ij')
+        c = 1.5
+        self.eos = {'ele_dens': self.dens, 'ele_temps': self.temp,
+                    'ele_pres': d*t, 'ele_eint': c*t,
+                    'ele_free': -c*t*np.log(t) + t*np.log(d)}
+
+    def test_consistent(self):
+        report = opp.utils.check_eos_consistency(self.eos)
+        self.assertTrue(report['num_tests'] == 6 and report['fail'] == 0,
+                        msg='Checking a consistent EoS!')
+
+    def test_violations(self):
+        self.eos['ele_pres'][50, 20] *= -1
+        self.eos['ele_eint'][10, 40:45] = 0.
+        report = opp.utils.check_eos_consistency(self.eos)
+        counts = dict(((c['check'], c['key']), c['count'])
+                      for c in report['checks'])
+        self.assertTrue(counts[('positive', 'pres')] == 1 and
+                        counts[('dP/drho', 'pres')] == 1 and
+                        counts[('dE/dT', 'eint')] == 1 and
+                        counts[('P(F)', 'pres')] == 1 and
+                        counts[('E(F)', 'eint')] == 5 and
+                        counts[('positive', 'eint')] == 0,
+                        msg='Checking the violation counts!')
+        mask = [c['mask'] for c in report['checks']
+                if c['check'] == 'positive' and c['key'] == 'pres'][0]
+        self.assertTrue(mask[50, 20],
+                        msg='Checking the violation masks!')
+
+    def test_eos_dict(self):
+        eos_dict = {'dens': self.dens, 'temp': self.temp,
+                    'Pec_DT': np.log10(self.eos['ele_pres']),
+                    'Uec_DT': self.eos['ele_eint'],
+                    'Fec_DT': self.eos['ele_free']}
+        report = opp.utils.check_eos_consistency(eos_dict, species=['ec'],
+                                                 log=['Pec_DT'])
+        self.assertTrue(report['num_tests'] == 6 and report['fail'] == 0,
+                        msg='Checking an EoS dictionary!')
+
+
+class test_avgopac(unittest.TestCase):
+    def setUp(self):
+        self.energies = np.logspace(0, 4, 500)
+        self.opacs = 1e3/self.energies**2 + np.sin(self.energies)**2
+        self.ebnds = np.logspace(0.5, 3.5, 20)
+        self.trad = 300.
+
+    def test_constant_weight(self):
+        opavg = opp.utils.avgopac(self.energies, self.opacs, self.trad,
+                                  self.ebnds, weight='constant')
+        for i in range(len(self.ebnds)-1):
+            en = np.linspace(self.ebnds[i], self.ebnds[i+1], 200001)
+            op = np.interp(en, self.energies, self.opacs)
+            ref = 0.5*(op[1:] + op[:-1]).mean()
+            self.assertTrue(abs(opavg[i]/ref - 1) < 1e-6,
+                            msg='Checking constant weight group average!')
+
+    def test_planck_weight(self):
+        from scipy.integrate import quad
+        op = lambda en: np.interp(en, self.energies, self.opacs)
+        w = lambda en: en**3/np.expm1(en/self.trad)
+        opavg = opp.utils.avgopac(self.energies, self.opacs, self.trad,
+                                  self.ebnds, weight='planck')
+        for i in range(len(self.ebnds)-1):
+            a, b = self.ebnds[i], self.ebnds[i+1]
+            ref = quad(lambda en: w(en)*op(en), a, b, limit=500)[0] \
+                  / quad(w, a, b)[0]
+            self.assertTrue(abs(opavg[i]/ref - 1) < 1e-6,
+                            msg='Checking planck weight group average!')
+
+    def test_rosseland_weight(self):
+        from scipy.integrate import quad
+        op = lambda en: np.interp(en, self.energies, self.opacs)
+        # Temperature derivative of the Planck function.
+        w = lambda en: en**4*np.exp(en/self.trad)/np.expm1(en/self.trad)**2
+        opavg = opp.utils.avgopac(self.energies, self.opacs, self.trad,
+                                  self.ebnds, weight='rosseland')
+        for i in range(len(self.ebnds)-1):
+            a, b = self.ebnds[i], self.ebnds[i+1]
+            ref = quad(w, a, b)[0] / quad(lambda en: w(en)/op(en), a, b,
+                                          limit=500)[0]
+            self.assertTrue(abs(opavg[i]/ref - 1) < 1e-6,
+                            msg='Checking rosseland weight group average!')
+        for trad in [1., 30., 3000.]:
+            ref, relerr = opp.utils.group_average_quad(
+                            self.energies, self.opacs, self.ebnds,
+                            trad=trad, weight='rosseland')
+            self.assertTrue(np.all(np.abs(relerr) < 1e-6),
+                            msg='Checking rosseland weight group average!')
+
+        # The 1/k integral diverges where the opacity vanishes.
+        opacs = self.opacs.copy()
+        opacs[len(opacs)//2] = 0.
+        ref, relerr = opp.utils.group_average_quad(
+                        self.energies, opacs, self.ebnds, trad=self.trad,
+                        weight='rosseland')
+        self.assertTrue(np.sum(ref == 0) == 1 and
+                        np.all(np.abs(relerr) < 1e-6),
+                        msg='Checking zero opacities in the rosseland '
+                            'weight group average!')
+
+    def test_batched_spectra(self):
+        opacs = np.array([self.opacs*(n+1) for n in range(3)])
+        opavg = opp.utils.group_average(self.energies, opacs, self.ebnds,
+                                        trad=[100., 200., 300.],
+                                        weight='planck')
+        self.assertTrue(opavg.shape == (3, len(self.ebnds)-1))
+        np.testing.assert_allclose(
+            opavg[2],
+            3*opp.utils.avgopac(self.energies, self.opacs, 300.,
+                                self.ebnds, weight='planck'))
+
+    def test_bound_error(self):
+        with self.assertRaises(ValueError):
+            opp.utils.avgopac(self.energies, self.opacs, self.trad,
+                              np.array([0.1, 10.]))
+
+    def test_avgOplList_nproc(self):
+        from opacplot2.convert_opl import avgOplList
+        from opacplot2.opl_list import OplList
+        opacs = [self.opacs*(n+1) for n in range(8)]
+        opllist = OplList(8, lambda n: (1., 100.+10*n),
+                          lambda n: self.energies, lambda n: opacs[n])
+        lazy = avgOplList(opllist, self.ebnds, weight='planck')
+        pool = avgOplList(opllist, self.ebnds, weight='planck', nproc=2)
+        for n in range(8):
+            np.testing.assert_allclose(lazy.getOpac(n), pool.getOpac(n))
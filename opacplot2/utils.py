@@ -1,22 +1,19 @@
 from __future__ import print_function
 
 import re
-import random
+import bisect
 
 import math
 import numpy as np
 
 from .constants import BC_BOUND, BC_EXTRAP_ZERO
 from .constants import INTERP_FUNC, INTERP_DFDD, INTERP_DFDT
+from .regrid import overlap_axis
+from . import profiling
 
 import os.path
 import opacplot2
 
-import scipy as sp
-import scipy.interpolate
-import scipy.misc
-
-import copy
 
 # from yt import physical_constants as p
 # from yt import units as u
@@ -24,19 +21,82 @@ import copy
 #               p.pi**4 * (u.eV/p.kb)**4 * (u.cm**2/u.g)).in_cgs())
 emis_const = 633391171028.5317
 
-try:
-    import numba
-    vectorize = numba.vectorize('float64(float64)', nopython=True)
-except:
+def _module_available(name):
+    # Whether a module can be imported, without importing it.
     try:
-        print('numba.vectorize not loaded, will use numpy.vectorize!')
-        def vectorize(f): return np.vectorize(f, otypes=[float])
-    except:
-        print('numpy.vectorize not loaded, will use `list(map(f, x))`!')
-        def vectorize(f): return \
-            (lambda x: list(map(f, x)) if isinstance(x, list) else f(x))
+        from importlib.util import find_spec
+    except ImportError:
+        import imp
+        try:
+            imp.find_module(name)
+            return True
+        except ImportError:
+            return False
+    return find_spec(name) is not None
+
+# numba is only imported, and the kernels compiled, at their first call.
+# The compiled kernels are cached on disk if the OPACPLOT2_NUMBA_CACHE
+# environment variable is set, or after `set_numba_cache(True)`.
+_numba_cache = os.environ.get('OPACPLOT2_NUMBA_CACHE', '0') not in ['', '0']
 
+def set_numba_cache(enable=True):
+    """Cache the numba kernels on disk, so that they are only compiled once
+    per installation. Only applies to the kernels not compiled yet.
 
+    Parameters
+    ----------
+    enable : bool, optional
+        enable or disable the cache, by default True
+    """
+    global _numba_cache
+    _numba_cache = enable
+
+class _LazyJit(object):
+    """Wrapper compiling `func` with `compile` at the first call. If the
+    compilation fails, `fallback` is used instead."""
+    def __init__(self, func, compile, fallback):
+        self.py_func = func
+        self.__name__ = func.__name__
+        self.__doc__ = func.__doc__
+        self._compile = compile
+        self._fallback = fallback
+        self._compiled = None
+
+    def compile(self):
+        if self._compiled is None:
+            try:
+                self._compiled = self._compile(self.py_func)
+            except Exception as e:
+                print('numba compilation of {0} failed ({1}), will use '
+                      'python!'.format(self.__name__, e))
+                self._compiled = self._fallback(self.py_func)
+        return self._compiled
+
+    def __call__(self, *args):
+        f = self._compiled
+        if f is None:
+            f = self.compile()
+        return f(*args)
+
+njit = None
+if _module_available('numba'):
+    def vectorize(f):
+        def compile(f):
+            import numba
+            return numba.vectorize('float64(float64)', nopython=True,
+                                   cache=_numba_cache)(f)
+        return _LazyJit(f, compile,
+                        lambda f: np.vectorize(f, otypes=[float]))
+
+    def njit(**options):
+        def decorator(f):
+            def compile(f):
+                import numba
+                return numba.njit(cache=_numba_cache, **options)(f)
+            return _LazyJit(f, compile, lambda f: f)
+        return decorator
+else:
+    def vectorize(f): return np.vectorize(f, otypes=[float])
 
 
 @vectorize
@@ -280,23 +340,110 @@ def planck_int_205(x):
     return p
 
 
+# Coefficients of the x->0 series of the planck integral (Bernoulli
+# numbers), in powers of x^2 from the highest one, as in the kernels above.
+_planck_series_x2 = [43867.0/107290978560589824000.0,
+                     -3617.0/202741834014720000.0,
+                     1.0/1270312243200.0,
+                     -691.0/19615115520000.0,
+                     1.0/622702080.0,
+                     -1.0/13305600.0,
+                     1.0/272160.0,
+                     -1.0/5040.0,
+                     1.0/60.0]
+
+def _planck_int_array(nexp, nseries, xcross, name):
+    """Build the pure NumPy version of a `planck_int_*` kernel, with `nexp`
+    terms of the exp(-x) expansion above `xcross` and the last `nseries`
+    coefficients of the series below. The arithmetic is the one of the
+    scalar kernels, applied to the masked arrays of each branch.
+    """
+    coefs = _planck_series_x2[-nseries:]
+    def kernel(x):
+        x = np.asarray(x, dtype=float)
+        out = np.zeros(x.shape)
+        small = (x > 0.0) & (x < xcross)
+        # NaNs go to the large x branch, as in the scalar kernels.
+        large = ~((x <= 0.0) | small)
+
+        xs = x[small]
+        x2 = xs*xs
+        p = coefs[0]
+        for c in coefs[1:]:
+            p = c + x2*p
+        p = -1.0/8.0 + xs*p
+        p = 1.0/3.0 + xs*p
+        out[small] = x2*xs*p
+
+        xl = x[large]
+        x2 = xl*xl
+        x3 = x2*xl
+        expmx = np.exp(-xl)
+        p = 6.4939394022668291491 - expmx*(6.0+6.0*xl+3.0*x2+x3)
+        expmnx = expmx
+        for n in range(2, nexp+1):
+            expmnx = expmnx*expmx
+            p = p - expmnx*((6.0/n**4) + (6.0/n**3)*xl + (3.0/n**2)*x2
+                            + (1.0/n)*x3)
+        out[large] = p
+        return out[()]
+    kernel.__name__ = name
+    kernel.__doc__ = 'Array version of `{0}`.'.format(name[:-6])
+    return kernel
+
+planck_int_621_array = _planck_int_array(6, 9, 2.6220995131254904878,
+                                         'planck_int_621_array')
+planck_int_521_array = _planck_int_array(5, 9, 2.8319431973583671745,
+                                         'planck_int_521_array')
+planck_int_421_array = _planck_int_array(4, 9, 3.0912856367280557733,
+                                         'planck_int_421_array')
+planck_int_321_array = _planck_int_array(3, 9, 3.4233592106975994941,
+                                         'planck_int_321_array')
+planck_int_221_array = _planck_int_array(2, 9, 3.8709108458308740467,
+                                         'planck_int_221_array')
+planck_int_217_array = _planck_int_array(2, 7, 3.5772328849933323604,
+                                         'planck_int_217_array')
+planck_int_213_array = _planck_int_array(2, 5, 3.1958913758529258675,
+                                         'planck_int_213_array')
+planck_int_209_array = _planck_int_array(2, 3, 2.6732813723804727115,
+                                         'planck_int_209_array')
+planck_int_205_array = _planck_int_array(2, 1, 1.8785904766714333082,
+                                         'planck_int_205_array')
+
+# Without numba, the scalar kernels are wrapped by np.vectorize (a Python
+# loop), so the array kernels are used instead.
 _planck_int_tol_map = [
-    [1.4970167008036724492e-02, planck_int_205],
-    [1.5564096579167360457e-03, planck_int_209],
-    [3.7610575515626060127e-04, planck_int_213],
-    [1.3579560624114267097e-04, planck_int_217],
-    [6.2367008414830821880e-05, planck_int_221],
-    [4.6393333440372567663e-06, planck_int_321],
-    [5.4123517973399470964e-07, planck_int_421],
-    [8.6098034553907039518e-08, planck_int_521],
-    [1.7204616971946109889e-08, planck_int_621],
+    [1.4970167008036724492e-02, planck_int_205, planck_int_205_array],
+    [1.5564096579167360457e-03, planck_int_209, planck_int_209_array],
+    [3.7610575515626060127e-04, planck_int_213, planck_int_213_array],
+    [1.3579560624114267097e-04, planck_int_217, planck_int_217_array],
+    [6.2367008414830821880e-05, planck_int_221, planck_int_221_array],
+    [4.6393333440372567663e-06, planck_int_321, planck_int_321_array],
+    [5.4123517973399470964e-07, planck_int_421, planck_int_421_array],
+    [8.6098034553907039518e-08, planck_int_521, planck_int_521_array],
+    [1.7204616971946109889e-08, planck_int_621, planck_int_621_array],
 ]
-_planck_int = planck_int_213
+_planck_int_use_array = njit is None
+_planck_int = planck_int_213_array if _planck_int_use_array \
+              else planck_int_213
 
 
+def _planck_int_kernel(tol):
+    """Return the lowest order `planck_int` kernel with an error below
+    `tol`, or the most accurate one (and False) if none is accurate enough.
+    """
+    for t, fs, fa in _planck_int_tol_map:
+        f = fa if _planck_int_use_array else fs
+        if tol >= t:
+            return f, True
+    return f, False
+
 def planck_int_set_tolerance(tol, verbose=False):
     """Set the orders used in `planck_int` by tolerance
 
+    This changes `planck_int` for the whole process. Use a
+    class`PlanckIntegrator to get a given tolerance locally.
+
     Parameters
     ----------
     tol : float
@@ -309,15 +456,14 @@ def planck_int_set_tolerance(tol, verbose=False):
         if verbose:
             print('`tol` is negative, `planck_int` not changed')
         return
-    for t, f in _planck_int_tol_map:
-        if tol >= t:
-            if verbose:
-                print('`planck_int` set to `{0}`'.format(f.__name__))
-            _planck_int = f
-            return
+    f, found = _planck_int_kernel(tol)
     if verbose:
-        print('`tol` smaller than {0} is not available, '.format(t)
-              + '`planck_int` set to `{0}`'.format(f.__name__))
+        if found:
+            print('`planck_int` set to `{0}`'.format(f.__name__))
+        else:
+            print('`tol` smaller than {0} is not available, '.format(
+                      _planck_int_tol_map[-1][0])
+                  + '`planck_int` set to `{0}`'.format(f.__name__))
     _planck_int = f
 
 def planck_int(x):
@@ -325,7 +471,8 @@ def planck_int(x):
        `$\int_{0}^{x}\frac{x^{\prime3}}{\exp(x^{\prime})-1}dx^{\prime}$`
        using `m`-th order expansion as `exp(-x)->0` at large `x` and `n`-th
        order expansion as `x->0` for small `x`. The ordres can be set by
-       `planck_int_set_tolerance`.
+       `planck_int_set_tolerance`. Without numba, the `planck_int_*_array`
+       NumPy kernels are used.
 
     Parameters
     ----------
@@ -339,34 +486,362 @@ def planck_int(x):
     """
     return _planck_int(x)
 
-def randomize_ionmix(filename, outfilename):
+class PlanckIntegrator(object):
+    """Planck integral with its own tolerance
+
+    Unlike `planck_int_set_tolerance`, which changes `planck_int` for the
+    whole process, every integrator keeps the kernel chosen for its
+    tolerance. Integrators are never modified after creation, so that they
+    can be shared between threads.
+
+    Parameters
+    ----------
+    tol : float, optional
+        tolerance (maximum allowed absolute error), by default the one of
+        `planck_int_213`
+
+    Examples
+    --------
+    >>> pi = PlanckIntegrator(tol=1e-7)
+    >>> pi(np.array([0.1, 1., 10.]))
+    >>> table = pi.tabulate(eos_dict['groups'])
+    >>> dp = table(eos_dict['temp'])  # shape (ntemp, ngroups)
+    """
+    def __init__(self, tol=3.7610575515626060127e-04):
+        if tol <= 0:
+            raise ValueError('`tol` must be positive')
+        self.kernel, found = _planck_int_kernel(tol)
+        self.tol = tol if found else _planck_int_tol_map[-1][0]
+
+    def __call__(self, x):
+        """Planck integral from 0 to `x`"""
+        return self.kernel(x)
+
+    def group_integrals(self, groups, temp):
+        """Planck integrals of the groups at the temperatures `temp`
+
+        The kernel is evaluated once on the ng+1 group boundaries.
+
+        Parameters
+        ----------
+        groups : numpy.ndarray
+            group boundaries (eV), shape (ng+1,)
+        temp : float or numpy.ndarray
+            temperatures (eV)
+
+        Returns
+        -------
+        numpy.ndarray
+            array of shape temp.shape + (ng,)
+        """
+        t = np.asarray(temp, dtype=float)[..., np.newaxis]
+        return np.diff(self.kernel(np.asarray(groups, dtype=float)/t),
+                       axis=-1)
+
+    def tabulate(self, groups, tol=None):
+        """Precompute the group integrals for a fixed group structure
+
+        Parameters
+        ----------
+        groups : numpy.ndarray
+            group boundaries (eV), shape (ng+1,)
+        tol : float, optional
+            maximum absolute error of the table, by default the tolerance
+            of the integrator
+
+        Returns
+        -------
+        PlanckGroupTable
+        """
+        return PlanckGroupTable(groups, self.tol if tol is None else tol)
+
+class PlanckGroupTable(object):
+    """Planck integrals of a fixed group structure, from a precomputed table
+
+    The group integrals are tabulated against ln(T) with cubic Hermite
+    interpolation (using the analytic derivatives), so that a lookup only
+    needs ln(T), the index of the table row, and a cubic in that row for
+    all groups at once. The table is refined until the error, measured
+    against direct evaluation at the middle and quarter points of every
+    cell (the Hermite error being largest at the middle of the cells) with
+    a 10% margin and the rounding error of the lookup, is below `tol`. The
+    error actually reached is `max_error` (absolute error on the group
+    integrals). Temperatures outside of the table are computed directly to
+    machine precision. Tables are read-only and can be shared between
+    threads.
+
+    Parameters
+    ----------
+    groups : numpy.ndarray
+        group boundaries (eV), shape (ng+1,)
+    tol : float, optional
+        maximum absolute error, by default 1e-10. It cannot be below the
+        rounding error of the lookup, about 32 ulp of the largest group
+        integral.
+    trange : tuple, optional
+        range of temperatures (eV) of the table, by default the range where
+        E/T is between 1e-3 and 50 for some group boundary
+    max_cells : int, optional
+        maximum number of cells of the table, by default 2**16
+
+    Raises
+    ------
+    ValueError
+        if `tol` is below the rounding error, or cannot be reached with
+        `max_cells` cells
+    """
+    def __init__(self, groups, tol=1e-10, trange=None, max_cells=2**16):
+        if tol <= 0:
+            raise ValueError('`tol` must be positive')
+        self.groups = np.array(groups, dtype=float)
+        self.groups.setflags(write=False)
+        if trange is None:
+            pos = self.groups[self.groups > 0]
+            trange = (pos[0]/50.0, pos[-1]/1e-3)
+        self.trange = (float(trange[0]), float(trange[1]))
+        lt0, lt1 = math.log(self.trange[0]), math.log(self.trange[1])
+
+        n = 64
+        rounding = None
+        while True:
+            lt = np.linspace(lt0, lt1, n+1)
+            f, df = self._exact(np.exp(lt))
+            if rounding is None:
+                # Rounding error of the table values and of the cubic.
+                rounding = 32*np.finfo(float).eps*np.abs(f).max()
+                if tol <= rounding:
+                    raise ValueError('`tol` = {0:.3g} is below the rounding '
+                                     'error of the table, {1:.3g}'.format(
+                                         tol, rounding))
+            h = (lt1 - lt0)/n
+            err = self._cell_error(lt, f, df, 0.5) + rounding
+            if err <= tol:
+                # The quarter points are only checked on the final table.
+                err = max(err, self._cell_error(lt, f, df, 0.25) + rounding,
+                          self._cell_error(lt, f, df, 0.75) + rounding)
+                if err <= tol:
+                    break
+            if 2*n > max_cells:
+                raise ValueError('`tol` = {0:.3g} cannot be reached with '
+                                 '{1} cells (error {2:.3g}), use a larger '
+                                 '`tol`, a smaller `trange` or more '
+                                 '`max_cells`'.format(tol, n, err))
+            n *= 2
+
+        # Cubic coefficients of each cell, in the position t in [0, 1].
+        d0, d1 = h*df[:-1], h*df[1:]
+        self._coefs = np.stack([f[:-1], d0,
+                                3*(f[1:] - f[:-1]) - 2*d0 - d1,
+                                2*(f[:-1] - f[1:]) + d0 + d1], axis=1)
+        self._coefs.setflags(write=False)
+        self._lt0 = lt0
+        self._h = h
+        self.max_error = err
+
+    def _cell_error(self, lt, f, df, t):
+        # Error of the Hermite cubic at the position t of the cells, with
+        # a 10% margin.
+        h = lt[1] - lt[0]
+        fi = ((1 + 2*t)*(1 - t)**2*f[:-1] + t**2*(3 - 2*t)*f[1:]
+              + h*t*(1 - t)*((1 - t)*df[:-1] - t*df[1:]))
+        return 1.1*np.abs(fi - self._exact(np.exp(lt[:-1] + t*h))[0]).max()
+
+    def _exact(self, temp):
+        # Group integrals and their derivatives with respect to ln(T).
+        x = self.groups/np.asarray(temp, dtype=float)[..., np.newaxis]
+        with np.errstate(over='ignore', invalid='ignore'):
+            dx = np.where(x > 0, -x**4/np.expm1(x), 0.0)
+        return (np.diff(_planck_int_m(x, 3), axis=-1),
+                np.diff(np.nan_to_num(dx), axis=-1))
+
+    def __call__(self, temp):
+        """Planck integrals of the groups, shape temp.shape + (ng,)"""
+        temp = np.asarray(temp, dtype=float)
+        s = (np.log(temp) - self._lt0)/self._h
+        ncell = len(self._coefs)
+        inside = (s >= 0) & (s <= ncell)
+        i = np.where(inside, s, 0).astype(int)
+        np.clip(i, 0, ncell - 1, out=i)
+        t = (np.where(inside, s, 0) - i)[..., np.newaxis]
+        c = self._coefs[i]
+        res = c[..., 0, :] + t*(c[..., 1, :] + t*(c[..., 2, :]
+                                                   + t*c[..., 3, :]))
+        if not np.all(inside):
+            res[~inside] = self._exact(temp[~inside])[0]
+        return res
+
+def _random_state(seed):
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    return np.random.RandomState(seed)
+
+def randomize_ionmix(filename, outfilename, seed=None):
     """Randomizes the data from an existing ionmix file and rewrites it
     to the outfile.
 
+    Every number of the tables and grids is replaced by a random 6 digit
+    mantissa and exponent (keeping its sign), the header and the layout
+    of the file being kept, so that the structure of a table can be shared
+    without its data.
+
     Parameters
     ----------
     filename : str
         Name of file to randomize.
     outfilename : str
         Name of output file.
+    seed : int or numpy.random.RandomState
+        Seed of the random numbers, for reproducible outputs.
     """
-    basepttn = "\d{6}"
-    exppttn = "E[+-]\d{2}"
-    rand_base = lambda mobj: "{0:06}".format(random.randint(0, 999999))
-    rand_exp = lambda mobj: "E{0:+03}".format(random.randint(-99, 99))
+    from .opg_ionmix import _ionmix_format_array
 
     with open(filename) as f:
-        lines = f.readlines()
-
-    newlines = []
-    for line in lines:
-        newline = re.sub(basepttn, rand_base, line)
-        newline = re.sub(exppttn, rand_exp, newline)
-        newlines.append(newline)
+        header = [f.readline() for i in range(3)]
+        body = f.read()
+
+    # The body is made of 12 character fields (numbers, and the number of
+    # groups), with newlines.
+    chars = np.frombuffer(body.encode('ascii'), dtype=np.uint8).copy()
+    mask = (chars != ord('\n')) & (chars != ord('\r'))
+    if mask.sum() % 12:
+        raise ValueError('{0} is not a fixed width IONMIX '
+                         'file!'.format(filename))
+    fields = chars[mask].reshape(-1, 12)
+    isval = (fields[:, 1] == ord('.')) & (fields[:, 8] == ord('E'))
+    nval = isval.sum()
+
+    rng = _random_state(seed)
+    sign = np.where(fields[isval, 0] == ord('-'), -1.0, 1.0)
+    mant = rng.randint(100000, 1000000, nval)
+    # 0.xxxxxxE+yy exponents, staying away from the limits after rounding.
+    expo = rng.randint(-97, 99, nval)
+    fields[isval] = _ionmix_format_array(sign*mant*10.0**(expo - 6),
+                                         'random')
+    chars[mask] = fields.ravel()
 
     with open(outfilename, 'w') as f:
-        f.write("".join(newlines))
+        f.write("".join(header))
+        f.write(chars.tobytes().decode('ascii'))
+
+def _synthetic_grid(ndens, ntemp, ngroups):
+    dens = np.logspace(-4, 2, ndens)
+    temp = np.logspace(-1, 4, ntemp)
+    groups = np.logspace(-1, 5, ngroups + 1) if ngroups else None
+    return dens, temp, groups
+
+def _synthetic_opacity(dens, temp, groups, g, kind, rng):
+    # Kramers-like power law with some noise, decreasing with the photon
+    # energy.
+    eg = np.sqrt(groups[g]*groups[g+1])
+    opac = (1e4*dens[:, None]*temp[None, :]**-1.5
+            /(1.0 + (eg/temp[None, :])**3))
+    opac *= np.exp(0.01*rng.standard_normal(opac.shape))
+    if kind == 'opr_mg':
+        opac *= 0.5
+    return opac
+
+def synthetic_eos_dict(ndens, ntemp, ngroups=0, seed=None, Znum=13,
+                       Abar=26.9815386):
+    """
+    Synthetic common EoS dictionary of arbitrary size.
+
+    The tables are smooth and positive (ideal gas EoS, a simple ionization
+    model and power law opacities with 1% noise), which makes them
+    suitable to test and benchmark the readers, writers and interpolators.
+
+    Parameters
+    ----------
+    ndens : int
+        Number of densities (logarithmic from 1e-4 to 1e2 g/cc).
+    ntemp : int
+        Number of temperatures (logarithmic from 0.1 eV to 10 keV).
+    ngroups : int
+        Number of opacity groups (logarithmic from 0.1 eV to 100 keV).
+    seed : int or numpy.random.RandomState
+        Seed of the noise on the opacities.
+    Znum : int
+        Atomic number.
+    Abar : float
+        Mean atomic mass.
+
+    Returns
+    -------
+    dict
+        Common EoS dictionary (cgs units, temperatures in eV).
+
+    Examples
+    --------
+    ::
 
+       >>> eos_dict = opp.utils.synthetic_eos_dict(200, 150, 100, seed=0)
+       >>> opp.OpgHdf5.from_eos_dict(eos_dict).write2file('synthetic.h5')
+
+    See Also
+    --------
+    synthetic_ionmix
+    """
+    rng = _random_state(seed)
+    dens, temp, groups = _synthetic_grid(ndens, ntemp, ngroups)
+    idens = dens*opacplot2.NA/Abar
+    D, T = np.meshgrid(dens, temp, indexing='ij')
+    zbar = Znum*(1.0 - np.exp(-T/(5.0*Znum)*(1.0 + D)**-0.1)) + 1e-2
+    pion = (idens[:, None]*opacplot2.KB)*T
+    pele = zbar*pion
+    eos_dict = {'dens': dens, 'temp': temp, 'idens': idens,
+                'Znum': np.array([Znum]), 'Xnum': np.array([1.0]),
+                'Anum': np.array([Abar]), 'Abar': Abar, 'Zmax': Znum,
+                'BulkMod': 1.0, 'ElemNum': 1,
+                'Zf_DT': zbar, 'Pi_DT': pion, 'Pec_DT': pele,
+                'Ui_DT': 1.5*pion/D, 'Uec_DT': 1.5*pele/D}
+    if ngroups:
+        eos_dict['groups'] = groups
+        for kind in ['opp_mg', 'opr_mg', 'emp_mg']:
+            eos_dict[kind] = np.dstack([
+                _synthetic_opacity(dens, temp, groups, g, kind, rng)
+                for g in range(ngroups)])
+    return eos_dict
+
+def synthetic_ionmix(outfilename, ndens, ntemp, ngroups=0, seed=None,
+                     Znum=13, Abar=26.9815386):
+    """
+    Writes a synthetic IONMIX file of arbitrary size.
+
+    The tables are generated as in :func:`synthetic_eos_dict`, the
+    opacities being generated and written one group at a time, so that
+    large files can be created with little memory.
+
+    Parameters
+    ----------
+    outfilename : str
+        Name of output file.
+    ndens, ntemp, ngroups : int
+        Size of the tables.
+    seed : int or numpy.random.RandomState
+        Seed of the noise on the opacities.
+    Znum : int
+        Atomic number.
+    Abar : float
+        Mean atomic mass.
+    """
+    from .opg_ionmix import IonmixWriter
+
+    rng = _random_state(seed)
+    eos_dict = synthetic_eos_dict(ndens, ntemp, 0, rng, Znum, Abar)
+    dens, temp, groups = _synthetic_grid(ndens, ntemp, ngroups)
+    with IonmixWriter(outfilename, [Znum], [1.0], eos_dict['idens'], temp,
+                      ngroups=ngroups, opac_bounds=groups) as imx:
+        for name, key in [('zbar', 'Zf_DT'), ('pion', 'Pi_DT'),
+                          ('pele', 'Pec_DT'), ('eion', 'Ui_DT'),
+                          ('eele', 'Uec_DT')]:
+            imx.write(name, eos_dict[key])
+        for name, kind in [('rosseland', 'opr_mg'),
+                           ('planck_absorb', 'opp_mg'),
+                           ('planck_emiss', 'emp_mg')]:
+            for g in range(ngroups):
+                imx.write(name, _synthetic_opacity(dens, temp, groups, g,
+                                                   kind, rng), group=g)
+
+@profiling.timed('interpDT')
 def interpDT(arr, dens, temps,
              bcdmin=BC_BOUND, bctmin=BC_BOUND,
              lookup=INTERP_FUNC):
@@ -394,6 +869,12 @@ def interpDT(arr, dens, temps,
         ``BC_EXTRAP_ZERO`` will insert zero points into the ``arr`` and either
         ``dens`` or ``temps`` for ``bcdmin``, ``bctmin`` respectively.
 
+    The interpolation is bilinear on the (dens, temps) grid, which may be
+    non-uniform, and points above the upper bounds are set to the upper
+    bounds. The derivatives are computed analytically in each grid cell.
+    The returned function accepts scalars or arrays of densities and
+    temperatures, which are broadcast against each other.
+
     Parameters
     ----------
     arr : numpy.ndarray
@@ -424,8 +905,17 @@ def interpDT(arr, dens, temps,
         0
         >>> print(f(123, 456)) # Density of 123 and temperature of 456.
         1234.5678 # Resulting ion pressure at this dens/temp.
+        >>> f(imx.dens, 456) # Array of values along an isotherm.
     """
 
+    if lookup not in [INTERP_FUNC, INTERP_DFDD, INTERP_DFDT]:
+        raise ValueError("lookup must be INTERP_FUNC, INTERP_DFDD, "
+                         "or INTERP_DFDT")
+
+    dens = np.asarray(dens, dtype=float)
+    temps = np.asarray(temps, dtype=float)
+    arr = np.asarray(arr, dtype=float)
+
     # Adjust for extrapolation to zero.
     if bcdmin == BC_EXTRAP_ZERO and dens[0] != 0:
         # Density arrays should be 1D.
@@ -437,70 +927,273 @@ def interpDT(arr, dens, temps,
         temps = np.insert(temps, 0, 0)
         arr = np.insert(arr, 0, 0, axis=1)
 
-    # "When on a regular grid with x.size = m and y.size = n,
-    # if z.ndim ==2, then z must have shape (n, m)."
-    # arr will have shape (dens.size, temps.size), so we must transpose it.
-    f = sp.interpolate.interp2d(dens, temps, arr.T, kind='linear')
-
-    if lookup == INTERP_FUNC:
-        def interp_func(func):
-            def wrapper(d, t):
-                # Deal with data being out of range.
-                # Adjust for lower bounds.
-                if d < dens[0]:
-                    d = dens[0]
-                if t < temps[0]:
-                    t = temps[0]
-                # Adjust for upper bounds.
-                if d > dens[-1]:
-                    d = dens[-1]
-                if t > temps[-1]:
-                    t = temps[-1]
-                return func(d,t)
-            return wrapper
-
-        # Return the wrapper of f that takes care of data being out of range.
-        return interp_func(f)
-
-    if lookup == INTERP_DFDD:
-        def df_dd(func):
-            # Input to df_dd(func) will be a (dens, temp) point.
-            def outter_wrap(dens, temp):
-                # Fix temp point but let dens point range.
-                def inner_wrap(x):
-                    return func(x, temp)
-
-                return sp.misc.derivative(
-                            inner_wrap,
-                            dens, # Evaluate derivative at dens point.
-                            dx=(dens*1e-12))
-
-            return outter_wrap
-
-        return df_dd(f)
-
-    if lookup == INTERP_DFDT:
-        def df_dt(func):
-            # Input to df_dt(func) will be a (dens, temp) point.
-            def outter_wrap(dens, temp):
-                # Fix temp point but let temps point range.
-                def inner_wrap(x):
-                    return func(dens, x)
-
-                return sp.misc.derivative(
-                            inner_wrap,
-                            temp, # Evaluate derivative at temp point.
-                            dx=(temp*1e-12))
-
-            return outter_wrap
-
-        return df_dt(f)
-
-    raise ValueError("lookup must be INTERP_FUNC, INTERP_DFDD, or INTERP_DFDT")
+    return _BilinearDT(arr, dens, temps, lookup)
+
+class _BilinearDT(object):
+    """
+    Bilinear interpolation on a rectilinear (dens, temp) grid.
+
+    The cell corners and the cell widths are precomputed, so that a lookup
+    is two ``searchsorted`` calls and a few array operations. The
+    derivatives are the analytic derivatives of the bilinear form in each
+    cell. Points on a grid node use the cell above it, except at the upper
+    bound. Points outside of the grid are moved to the closest bound, so
+    that the derivatives across the bound are zero there.
+    """
+    def __init__(self, arr, dens, temps, lookup=INTERP_FUNC):
+        if arr.shape != (len(dens), len(temps)):
+            raise ValueError("arr must have shape (dens.size, temps.size), "
+                             "got {0}".format(arr.shape))
+        if len(dens) < 2 or len(temps) < 2:
+            raise ValueError("At least two points are needed on each axis")
+        self.dens = dens
+        self.temps = temps
+        self.lookup = lookup
+        self.f00 = arr[:-1, :-1]
+        self.f10 = arr[1:, :-1]
+        self.f01 = arr[:-1, 1:]
+        self.f11 = arr[1:, 1:]
+        self.dd = np.diff(dens)
+        self.dt = np.diff(temps)
+        self._dens_list = dens.tolist()
+        self._temps_list = temps.tolist()
+
+    @staticmethod
+    def _locate(axis, x):
+        # Cell index and clipped position of x along axis.
+        xc = np.clip(x, axis[0], axis[-1])
+        idx = np.searchsorted(axis, xc, side='right') - 1
+        idx = np.clip(idx, 0, len(axis) - 2)
+        return idx, xc
+
+    def _scalar(self, d, t):
+        # Same as __call__ for a single point, without array overheads.
+        dens, temps = self._dens_list, self._temps_list
+        dc = min(max(d, dens[0]), dens[-1])
+        tc = min(max(t, temps[0]), temps[-1])
+        i = min(bisect.bisect_right(dens, dc) - 1, len(dens) - 2)
+        j = min(bisect.bisect_right(temps, tc) - 1, len(temps) - 2)
+        dd = dens[i+1] - dens[i]
+        dt = temps[j+1] - temps[j]
+        u = (dc - dens[i])/dd
+        v = (tc - temps[j])/dt
+        f00 = float(self.f00[i, j])
+        f10 = float(self.f10[i, j])
+        f01 = float(self.f01[i, j])
+        f11 = float(self.f11[i, j])
+        if self.lookup == INTERP_FUNC:
+            return (f00*(1 - u) + f10*u)*(1 - v) + (f01*(1 - u) + f11*u)*v
+        elif self.lookup == INTERP_DFDD:
+            if dc != d:
+                return 0.0
+            return ((f10 - f00)*(1 - v) + (f11 - f01)*v)/dd
+        else:
+            if tc != t:
+                return 0.0
+            return ((f01 - f00)*(1 - u) + (f11 - f10)*u)/dt
+
+    def __call__(self, d, t):
+        if np.isscalar(d) and np.isscalar(t):
+            return self._scalar(float(d), float(t))
+        d, t = np.broadcast_arrays(np.asarray(d, dtype=float),
+                                   np.asarray(t, dtype=float))
+        i, dc = self._locate(self.dens, d)
+        j, tc = self._locate(self.temps, t)
+        u = (dc - self.dens[i])/self.dd[i]
+        v = (tc - self.temps[j])/self.dt[j]
+        f00 = self.f00[i, j]
+        f10 = self.f10[i, j]
+        f01 = self.f01[i, j]
+        f11 = self.f11[i, j]
+
+        if self.lookup == INTERP_FUNC:
+            res = (f00*(1 - u) + f10*u)*(1 - v) + (f01*(1 - u) + f11*u)*v
+        elif self.lookup == INTERP_DFDD:
+            res = ((f10 - f00)*(1 - v) + (f11 - f01)*v)/self.dd[i]
+            res = np.where(dc == d, res, 0.0)
+        else:
+            res = ((f01 - f00)*(1 - u) + (f11 - f10)*u)/self.dt[j]
+            res = np.where(tc == t, res, 0.0)
+
+        if res.ndim == 0:
+            return float(res)
+        return res
+
+_EXTRAP_MODES = {'nearest': 0, 'linear': 1, 'clamp': 2}
+
+def _locate_cells(axis, x, mode):
+    # Cell index and normalized position in the cell of x along axis.
+    idx = np.clip(np.searchsorted(axis, x, side='right') - 1,
+                  0, len(axis) - 2)
+    t = (x - axis[idx])/(axis[idx+1] - axis[idx])
+    if mode == 0:
+        t = np.clip(t, 0.0, 1.0)
+    return idx, t
+
+def _bilinear_numpy(ax, ay, data, xs, ys, mode):
+    i, u = _locate_cells(ax, xs, mode)
+    j, v = _locate_cells(ay, ys, mode)
+    f00 = data[i, j]
+    f10 = data[i+1, j]
+    f01 = data[i, j+1]
+    f11 = data[i+1, j+1]
+    if data.ndim > 2:
+        u = u.reshape(u.shape + (1,)*(data.ndim - 2))
+        v = v.reshape(v.shape + (1,)*(data.ndim - 2))
+    res = (f00*(1 - u) + f10*u)*(1 - v) + (f01*(1 - u) + f11*u)*v
+    if mode == 2:
+        res = np.clip(res,
+                      np.minimum(np.minimum(f00, f10), np.minimum(f01, f11)),
+                      np.maximum(np.maximum(f00, f10), np.maximum(f01, f11)))
+    return res
+
+def _bilinear_loop(ax, ay, data, xs, ys, mode, out):
+    # Same as _bilinear_numpy, point by point, for numba. data has shape
+    # (nx, ny, nk) and out (npts, nk).
+    nx = ax.shape[0]
+    ny = ay.shape[0]
+    for p in range(xs.shape[0]):
+        i = min(max(np.searchsorted(ax, xs[p], 'right') - 1, 0), nx - 2)
+        j = min(max(np.searchsorted(ay, ys[p], 'right') - 1, 0), ny - 2)
+        u = (xs[p] - ax[i])/(ax[i+1] - ax[i])
+        v = (ys[p] - ay[j])/(ay[j+1] - ay[j])
+        if mode == 0:
+            u = min(max(u, 0.0), 1.0)
+            v = min(max(v, 0.0), 1.0)
+        for k in range(data.shape[2]):
+            f00 = data[i, j, k]
+            f10 = data[i+1, j, k]
+            f01 = data[i, j+1, k]
+            f11 = data[i+1, j+1, k]
+            r = (f00*(1 - u) + f10*u)*(1 - v) + (f01*(1 - u) + f11*u)*v
+            if mode == 2:
+                r = min(max(r, min(min(f00, f10), min(f01, f11))),
+                        max(max(f00, f10), max(f01, f11)))
+            out[p, k] = r
+
+if njit is not None:
+    _bilinear_loop = njit(nogil=True)(_bilinear_loop)
+
+class RectGridInterp(object):
+    """
+    Bilinear interpolation on a rectilinear grid, for tables indexed by
+    (x, y) such as the (dens, temp) tables of an EoS/opacity dictionary.
+
+    The axes may be nonuniform. With ``logx``/``logy``, the interpolation
+    is linear in the logarithm of that axis. The same grid object can
+    interpolate any number of tables defined on it, and the tables are
+    never copied: trailing dimensions (e.g. groups) are interpolated at
+    once. If numba is available, a compiled kernel is used (the same
+    fallback as ``vectorize``), otherwise the interpolation is vectorized
+    with NumPy.
+
+    Parameters
+    ----------
+    x : numpy.ndarray
+        Sorted first axis, shape (nx,).
+    y : numpy.ndarray
+        Sorted second axis, shape (ny,).
+    logx : bool
+        Interpolate linearly in log10(x).
+    logy : bool
+        Interpolate linearly in log10(y).
+    extrap : str
+        Treatment of points outside of the grid:
+
+            ``"nearest"`` uses the value at the closest point of the grid
+            (default).
+
+            ``"linear"`` extrapolates linearly from the boundary cells.
+
+            ``"clamp"`` extrapolates linearly, but the result is limited to
+            the range of values of the boundary cell.
+    engine : str or None
+        ``"numba"``, ``"numpy"``, or None to choose ``"numba"`` if it is
+        available.
+
+    Examples
+    --------
+    >>> grid = RectGridInterp(eos_dict['dens'], eos_dict['temp'],
+    ...                       logx=True, logy=True)
+    >>> pele = grid(eos_dict['Pec_DT'], 1e-2, [10., 100.])
+    >>> opr = grid(eos_dict['opr_mg'], 1e-2, [10., 100.]) # (2, ngroups)
+    """
+    def __init__(self, x, y, logx=False, logy=False, extrap='nearest',
+                 engine=None):
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        if x.ndim != 1 or y.ndim != 1 or len(x) < 2 or len(y) < 2:
+            raise ValueError('Grid axes must be 1D with at least two points')
+        if np.any(np.diff(x) <= 0) or np.any(np.diff(y) <= 0):
+            raise ValueError('Grid axes must be strictly increasing')
+        if (logx and x[0] <= 0) or (logy and y[0] <= 0):
+            raise ValueError('Log axes must be positive')
+        if extrap not in _EXTRAP_MODES:
+            raise ValueError('extrap must be one of '
+                             '{0}'.format(sorted(_EXTRAP_MODES)))
+        if engine is None:
+            engine = 'numpy' if njit is None else 'numba'
+        if engine not in ['numpy', 'numba']:
+            raise ValueError('engine must be "numpy" or "numba"')
+        if engine == 'numba' and njit is None:
+            raise ImportError('numba is not available')
+
+        self.x = x
+        self.y = y
+        self.logx = logx
+        self.logy = logy
+        self.extrap = extrap
+        self.engine = engine
+        self._mode = _EXTRAP_MODES[extrap]
+        self._ax = np.log10(x) if logx else x
+        self._ay = np.log10(y) if logy else y
+
+    @property
+    def shape(self):
+        return (len(self.x), len(self.y))
+
+    def __call__(self, data, x, y):
+        """
+        Interpolate ``data`` at the points (x, y).
+
+        Parameters
+        ----------
+        data : numpy.ndarray
+            Table of shape (nx, ny) or (nx, ny, ...).
+        x, y : float or numpy.ndarray
+            Coordinates of the points, broadcast against each other.
+
+        Returns
+        -------
+        numpy.ndarray
+            Interpolated values, of shape ``broadcast(x, y).shape +
+            data.shape[2:]``.
+        """
+        data = np.asarray(data)
+        if data.shape[:2] != self.shape:
+            raise ValueError('Table of shape {0} does not match the grid '
+                             '{1}'.format(data.shape, self.shape))
+        xs, ys = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                     np.asarray(y, dtype=float))
+        pshape = xs.shape
+        xs = np.log10(xs) if self.logx else xs
+        ys = np.log10(ys) if self.logy else ys
+
+        if self.engine == 'numpy':
+            return _bilinear_numpy(self._ax, self._ay, data, xs, ys,
+                                   self._mode)
+
+        tail = data.shape[2:]
+        data3 = data.reshape(self.shape + (-1,))
+        out = np.empty((xs.size, data3.shape[2]))
+        _bilinear_loop(self._ax, self._ay, data3.astype(float, copy=False),
+                       np.ravel(xs), np.ravel(ys), self._mode, out)
+        return out.reshape(pshape + tail)
 
 class fastInterpDT():
     def __init__(self, eosopac, input=None, x='dens', y='temp', g='groups',
-                 **kwargs):
+                 logx=False, logy=False, extrap='nearest', engine=None,
+                 planck_tol=None, **kwargs):
         """
         Fast interpolation for values in EoS/Opacity table
 
@@ -522,17 +1215,23 @@ class fastInterpDT():
             y variable for interpolation, by default 'temp'
         g : str, optional
             groups variable for interpolation, by default 'groups'
+        logx, logy : bool, optional
+            interpolate linearly in log10 of `x`/`y`, by default False
+        extrap : str, optional
+            extrapolation outside of the table, "nearest", "linear" or
+            "clamp" (see class`RectGridInterp), by default "nearest"
+        engine : str or None, optional
+            "numba" or "numpy", by default numba if it is available
+        planck_tol : float or None, optional
+            if set, the emission rates use a class`PlanckGroupTable of the
+            groups with this tolerance instead of `planck_int`, by default
+            None
         **kwargs: passed to class`opacplot2.OpacIonmix or `toEosDict`
 
         """
         self.x = x
         self.y = y
         self.g = g
-        from interpolation.splines import UCGrid, eval_linear
-        from interpolation.splines import extrap_options as xto
-        self.eval_linear = eval_linear
-        self.xto = xto
-
         if isinstance(eosopac, str):
             ext_dict = {'.cn4':'ionmix',
                         '.prp':'propaceos',
@@ -571,10 +1270,12 @@ class fastInterpDT():
             else:
                 raise ValueError('Unsupported input format')
 
-        elif isinstance(eosopac, (opacplot2.OpacIonmix,
-                                  opacplot2.OpgPropaceosAscii,
-                                  opacplot2.OpgSesame,
-                                  opacplot2.OpgTOPS)):
+        elif isinstance(eosopac, tuple(
+                getattr(opacplot2, cls) for cls in ['OpacIonmix',
+                                                    'OpgPropaceosAscii',
+                                                    'OpgSesame',
+                                                    'OpgTOPS']
+                if hasattr(opacplot2, cls))):
             op = eosopac
 
         elif isinstance(eosopac, dict):
@@ -614,9 +1315,14 @@ class fastInterpDT():
         else:
             raise ValueError('Unsupported input format')
 
-        self.ucgrid = UCGrid(eos_dict[x], eos_dict[y])
+        self.grid = RectGridInterp(eos_dict[x], eos_dict[y],
+                                   logx=logx, logy=logy, extrap=extrap,
+                                   engine=engine)
         self.eos_dict = eos_dict
         self._funcs = {}
+        self.planck_table = None
+        if planck_tol is not None:
+            self.planck_table = PlanckGroupTable(eos_dict[g], planck_tol)
 
     def __getitem__(self, key):
         """
@@ -642,10 +1348,7 @@ class fastInterpDT():
 
         if key in self.eos_dict.keys():
             def func(x, y):
-                dats = self.eval_linear(self.ucgrid, self.eos_dict[key],
-                                        np.array([x, y]).T.copy(),
-                                        self.xto.NEAREST)
-                return dats
+                return self.grid(self.eos_dict[key], x, y)
             self._funcs[key] = func
             return self._funcs[key]
 
@@ -662,10 +1365,7 @@ class fastInterpDT():
 
         if mainkey == 'alphaa':
             def func(x, y):
-                opac = self.eval_linear(self.ucgrid,
-                                        self.eos_dict['opr_mg'][:,:,ig-1],
-                                        np.array([x, y]).T.copy(),
-                                        self.xto.NEAREST)
+                opac = self.grid(self.eos_dict['opr_mg'][:,:,ig-1], x, y)
                 alphaa = opac * np.array(x)
                 return alphaa
             self._funcs[key] = func
@@ -674,13 +1374,13 @@ class fastInterpDT():
         if mainkey == 'emr':
             def func(x, y):
                 t = np.array(y)
-                xgl = self.eos_dict[self.g][ig-1] / t
-                xgr = self.eos_dict[self.g][ig]   / t
-                dp = planck_int(xgr) - planck_int(xgl)
-                opac = self.eval_linear(self.ucgrid,
-                                        self.eos_dict['emp_mg'][:,:,ig-1],
-                                        np.array([x, y]).T.copy(),
-                                        self.xto.NEAREST)
+                if self.planck_table is not None:
+                    dp = self.planck_table(t)[..., ig-1]
+                else:
+                    xgl = self.eos_dict[self.g][ig-1] / t
+                    xgr = self.eos_dict[self.g][ig]   / t
+                    dp = planck_int(xgr) - planck_int(xgl)
+                opac = self.grid(self.eos_dict['emp_mg'][:,:,ig-1], x, y)
                 emr = emis_const * opac * t**4 * dp
                 return emr
             self._funcs[key] = func
@@ -688,6 +1388,55 @@ class fastInterpDT():
 
         raise KeyError
 
+    def alphaa_all(self, x, y):
+        """
+        Absorption coefficients (unit:1/cm) of all groups
+
+        The cell is located once per point and the whole spectrum is
+        interpolated at once, which is much faster than calling every
+        "alphaa_{ig}" function.
+
+        Parameters
+        ----------
+        x, y : float or numpy.ndarray
+            Interpolation points, broadcast against each other
+
+        Returns
+        -------
+        alphaa : numpy.ndarray
+            Array of shape (npts, ng), or (ng,) for a single point
+        """
+        opac = self.grid(self.eos_dict['opr_mg'], x, y)
+        return opac * np.asarray(x, dtype=float)[..., np.newaxis]
+
+    def emr_all(self, x, y):
+        """
+        Emission rates (unit:erg/g/s) of all groups
+
+        The Planck integrals are computed once for the ng+1 group
+        boundaries of each point.
+
+        Parameters
+        ----------
+        x, y : float or numpy.ndarray
+            Interpolation points, broadcast against each other
+
+        Returns
+        -------
+        emr : numpy.ndarray
+            Array of shape (npts, ng), or (ng,) for a single point
+        """
+        t = np.broadcast_arrays(np.asarray(x, dtype=float),
+                                np.asarray(y, dtype=float))[1]
+        if self.planck_table is not None:
+            dp = self.planck_table(t)
+        else:
+            dp = np.diff(planck_int(np.asarray(self.eos_dict[self.g])
+                                    / t[..., np.newaxis]), axis=-1)
+        t = t[..., np.newaxis]
+        opac = self.grid(self.eos_dict['emp_mg'], x, y)
+        return emis_const * opac * t**4 * dp
+
 class EosMergeGrids(dict):
     """This class provides filtering capabilities for the EoS temperature and
     density grids.
@@ -722,6 +1471,14 @@ class EosMergeGrids(dict):
         A dictionary with the same keys as eos_data. The species specified by
         ``intersect`` will have equal temperature and density grids.
 
+    Notes
+    -----
+    The merged grids and tables are computed at their first access and
+    cached. They are read-only arrays (views of ``eos_data`` when the
+    points kept are contiguous), the same array being returned by each
+    access: copy them before modifying them in place, e.g.
+    ``np.log10(eos['ele_pres'])`` rather than ``np.log10(..., out=...)``.
+
     Examples
     --------
     >>> eos_sesame = opp.OpgSesame("../sesame/xsesame_ascii",
@@ -731,6 +1488,7 @@ class EosMergeGrids(dict):
             intersect=['ele', 'ioncc'],   # Merge ele and ioncc grids
             filter_temps=lamda x: x>1.) # Remove temperatures below 1eV
     """
+    @profiling.timed('EosMergeGrids')
     def __init__(self, eos_data, filter_dens=lambda x: x>=0.,
                  filter_temps=lambda x: x>=0., intersect=['ele', 'ioncc'],
                  thresh=[], qeos=False):
@@ -749,6 +1507,7 @@ class EosMergeGrids(dict):
 
         # Defining indexes we want to keep.
         mask = {}
+        index = {}
         if qeos:
             species_list = ['ele', 'ion', 'total']
         else:
@@ -757,46 +1516,66 @@ class EosMergeGrids(dict):
             for var in ['dens', 'temps']:
                key = species + '_' + var
                # mask based on the intersection of 'ele' and 'ion' grids
-               mask[key] = np.in1d(eos_data[key],
+               mask[key] = np.isin(eos_data[key],
                                    i_grids[var],
                                    assume_unique=True)
                # mask from user provided parameters
                mask[key] = mask[key]*user_filter[var](eos_data[key])
+               index[key] = self._mask_to_index(mask[key])
         self.mask = mask
+        self.index = index
         # Initalising dictionary.
         for key in eos_data:
             self[key] = None # The actual values returned by __getitem__().
         return
 
-    def _get_mask(self, key):
+    @staticmethod
+    def _mask_to_index(mask):
+        # A slice if the points to keep are contiguous, so that the merged
+        # tables are views, otherwise the index vector.
+        idx = np.flatnonzero(mask)
+        if len(idx) == 0:
+            return slice(0, 0)
+        if idx[-1] - idx[0] + 1 == len(idx):
+            return slice(idx[0], idx[-1] + 1)
+        return idx
+
+    def _merge(self, key):
         if '_dens' in key or '_temps' in key:
-            return self.mask[key]
-        elif any([key.endswith(prefix) for prefix in ['pres', 'eint', 'free']]):
+            data = self.origin[key][self.index[key]]
+        elif '_ndens' in key:
+            return len(self[key.replace('_n', '_')])
+        elif '_ntemp' in key:
+            # there is an incoherence between '_dens' -> '_ndens'
+            # and '_temps' -> '_ntemps' that should really be fixed
+            return len(self[key.replace('_n', '_')+'s'])
+        elif any([key.endswith(word) for word in ['pres', 'eint', 'free']]):
             species = key.split('_')[0]
-            indexes = np.meshgrid(
-                        np.nonzero(self.mask[species+'_dens'])[0],\
-                        np.nonzero(self.mask[species + '_temps'])[0])
-            return indexes[0].T, indexes[1].T
+            rows = self.index[species + '_dens']
+            cols = self.index[species + '_temps']
+            if isinstance(rows, slice) or isinstance(cols, slice):
+                data = self.origin[key][rows][:, cols]
+            else:
+                data = self.origin[key][np.ix_(rows, cols)]
+            if key in self.threshold:
+                data = np.fmax(data, 0)
+        else:
+            return self.origin[key]
+        # The merged grids and tables are read-only, so that changing them
+        # can neither change the original data (of which they may be
+        # views) nor the cached tables returned by the next accesses.
+        data = data.view()
+        data.setflags(write=False)
+        return data
 
     def __getitem__(self, key):
         if key in self.origin:
-            if '_dens' in key or '_temps' in key:
-                mask = self.mask[key]
-                return self.origin[key][mask]
-            elif '_ndens' in key:
-                return len(self[key.replace('_n', '_')])
-            elif '_ntemp' in key:
-                # there is an incoherence between '_dens' -> '_ndens'
-                # and '_temps' -> '_ntemps' that should really be fixed
-                return len(self[key.replace('_n', '_')+'s'])
-            elif any([key.endswith(word) for word in ['pres', 'eint', 'free']]):
-                data =  self.origin[key][self._get_mask(key)]
-                if key in self.threshold:
-                    return np.fmax(data, 0)
-                else:
-                    return data
-            else:
-                return self.origin[key]
+            # The merged tables are computed once, at the first access.
+            data = dict.__getitem__(self, key)
+            if data is None:
+                data = self._merge(key)
+                dict.__setitem__(self, key, data)
+            return data
         else:
             # Now just in case we have added some extra keys in there,
             # reproduce a normal dict's behaviour
@@ -831,204 +1610,558 @@ def intersect_1D_sorted_arr(arr_1, arr_2):
     >>> c = opp.utils.intersect_1D_sorted_arr(a,b)
     >>> print(c)
     [3.5 4 4.5 5]
-    """
-    # Check for some overlap.
-    if (arr_1[-1] < arr_2[0]) or (arr_2[-1] < arr_1[0]):
-        return None
-
-    # Use interpolation to account for mismatched grid sizes.
-    # We will also work with the intersection of the dens/temp grids.
-    arr_min = max(arr_1[0], arr_2[0])
-    arr_max = min(arr_1[-1], arr_2[-1])
-
-    max_idx_1 = np.argmin(arr_1 <= arr_max)
-    # If arr_max is bigger than arr_1[-1] max_idx_1 = 0, so we fix that here.
-    if max_idx_1 == 0:
-        max_idx_1 = len(arr_1)
-    min_idx_1 = np.argmax(arr_1 >= arr_min)
-
-    max_idx_2 = np.argmin(arr_2 <= arr_max)
-    if max_idx_2 == 0:
-        max_idx_2 = len(arr_2)-1
-    min_idx_2 = np.argmax(arr_2 >= arr_min)
-
-    sliced_arr_1 = arr_1[min_idx_1:max_idx_1]
-    sliced_arr_2 = arr_2[min_idx_2:max_idx_2]
 
-    merged_arr = np.concatenate((sliced_arr_1, sliced_arr_2))
-
-    return np.unique(merged_arr)
+    See Also
+    --------
+    opacplot2.regrid.overlap_axis
+    """
+    return overlap_axis(arr_1, arr_2)
 
 ################################################################################
 # Functions and classes below this have not been adequately tested nor         #
 # documented.                                                                  #
 ################################################################################
 
-def avgopac(energies_in, opacs_in, trad, ebnds,
-            weight="constant", bound="error"):
+def _interp_spectrum(energies, opacs, en):
+    # Piecewise linear evaluation of opacs (..., nen) at the sorted points
+    # en, with constant extension outside of energies.
+    idx = np.searchsorted(energies, en, side='right') - 1
+    idx = np.clip(idx, 0, len(energies)-2)
+    de = energies[idx+1] - energies[idx]
+    t = np.clip((en - energies[idx])/de, 0.0, 1.0)
+    return opacs[..., idx]*(1.0 - t) + opacs[..., idx+1]*t
+
+def _group_subintervals(energies, ebnds):
+    # Merge the spectrum nodes into the group boundaries, so that the
+    # spectrum is linear on every sub-interval. Also returns the index of
+    # the first sub-interval of each group (for np.add.reduceat).
+    inner = energies[(energies > ebnds[0]) & (energies < ebnds[-1])]
+    edges = np.union1d(inner, ebnds)
+    starts = np.searchsorted(edges, ebnds[:-1])
+    return edges, starts
+
+def _weight_planck(en, trad, x0=0.0):
+    # Planck weight, scaled by exp(x0) to avoid underflows at large E/T.
+    x = en/trad
+    return en**3*np.exp(x0 - x)/(-np.expm1(-x))
+
+def _weight_rosseland(en, trad, x0=0.0):
+    x = en/trad
+    return en**4*np.exp(x0 - x)/np.expm1(-x)**2
+
+# Gauss-Legendre nodes of the Rosseland integrals on each sub-interval.
+_ROSSELAND_NODES = 16
+
+# Bose integrals int_0^x t^m/(exp(t)-1) dt at x=inf: pi^4/15 and 24*zeta(5).
+_PLANCK_INF = {3: 6.4939394022668291491, 4: 24.886266123440878231}
+# Below this value of x, the Bose integrals are computed from their series.
+_PLANCK_SERIES_X = 2.5
+_planck_series_coefs = {}
+
+def _bernoulli(n):
+    # Bernoulli numbers B_0 ... B_n, with B_1 = -1/2 (Akiyama-Tanigawa).
+    from fractions import Fraction
+    a = [Fraction(0)]*(n+1)
+    B = []
+    for m in range(n+1):
+        a[m] = Fraction(1, m+1)
+        for j in range(m, 0, -1):
+            a[j-1] = j*(a[j-1] - a[j])
+        B.append(a[0])
+    B[1] = -B[1]
+    return B
+
+def _planck_int_series(x, m, nterms=40):
+    # int_0^x t^m/(exp(t)-1) dt = sum_k B_k x^(k+m)/(k!(k+m)), for x < 2pi.
+    if m not in _planck_series_coefs:
+        B = _bernoulli(nterms)
+        _planck_series_coefs[m] = [float(B[k])/(math.factorial(k)*(k+m))
+                                   for k in range(nterms+1)]
+    p = 0.0
+    for c in reversed(_planck_series_coefs[m]):
+        p = c + x*p
+    return p*x**m
+
+def _planck_int_tail(x, x0, m, nterms=16):
+    # exp(x0)*int_x^inf t^m/(exp(t)-1) dt, for x >= x0, from the exp(-nx)
+    # expansion. The scaling avoids underflows in the Wien tail.
+    q = 0.0
+    for n in range(1, nterms+1):
+        p = 1.0/n
+        for j in range(m-1, -1, -1):
+            p = p*x + math.factorial(m)/math.factorial(j)/float(n)**(m-j+1)
+        q = q + np.exp(x0 - n*x)*p
+    return q
+
+def _planck_int_m(x, m):
+    # int_0^x t^m/(exp(t)-1) dt, to machine precision. The m=3 case is
+    # planck_int, but the differences between close group boundaries need
+    # more accuracy than the planck_int kernels provide.
+    small = x < _PLANCK_SERIES_X
+    return np.where(small,
+                    _planck_int_series(np.where(small, x, 0.0), m),
+                    _PLANCK_INF[m] - _planck_int_tail(
+                        np.where(small, _PLANCK_SERIES_X, x), 0.0, m))
+
+def _weight_int(x, x0, m, weight, tail):
+    # Integral of x^(m-3) times the weight, in the variable x=E/T:
+    #   planck:    int_0^x t^m/(exp(t)-1) dt
+    #   rosseland: int_0^x t^(m+1)exp(t)/(exp(t)-1)^2 dt
+    #            = (m+1)*planck_int_m(x) - x^(m+1)/(exp(x)-1)
+    # Where tail is True, -exp(x0)*int_x^inf is returned instead, which
+    # only differs by a constant (times exp(x0)).
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        xt = np.where(tail, x, np.inf)
+        xp = np.where(tail, 0.0, x)
+        wt = _planck_int_tail(xt, x0, m)
+        wp = _planck_int_m(xp, m)
+        if weight == "rosseland":
+            wt = (m+1)*wt + xt**(m+1)*np.exp(x0 - xt)/(-np.expm1(-xt))
+            wp = (m+1)*wp - np.where(xp > 0, xp**(m+1)/np.expm1(xp), 0.0)
+    return np.where(tail, -wt, wp)
+
+def group_average(energies, opacs, ebnds, trad=None,
+                  weight="constant", bound="error"):
     """
+    Average piecewise linear opacity spectra over energy groups.
+
+    All groups (and all spectra or temperatures, if ``opacs`` is 2D or
+    ``trad`` is an array) are integrated at once. The group boundaries and
+    the spectrum nodes are merged, so that the opacity is linear on every
+    sub-interval. Constant weights are then integrated exactly. For the
+    Planck weight, the integrals are analytic and only use the
+    ``planck_int`` kernels and a companion kernel for the next moment. For
+    the Rosseland weight, the integral of the weight is analytic and the
+    integral of the weight over the (linear) opacity is computed with
+    16-point Gauss-Legendre quadrature in the logarithm of the opacity on
+    every sub-interval, which removes its pole. The Rosseland mean of a
+    group where the opacity is zero (or negative) somewhere is zero.
+    :func:`group_average_quad` gives the error against adaptive
+    quadrature, typically below 1e-8.
 
     Parameters
     ----------
-    energies_in :
-
-    opacs_in :
+    energies : numpy.ndarray
+        Sorted photon energies of the spectra, shape (nen,).
+    opacs : numpy.ndarray
+        Opacities at ``energies``, shape (nen,) or (npts, nen).
+    ebnds : numpy.ndarray
+        Group boundaries, shape (ngroups+1,).
+    trad : float or numpy.ndarray
+        Radiation temperature, scalar or shape (npts,), broadcast against
+        the spectra. Required for the ``"planck"`` and ``"rosseland"``
+        weights.
+    weight : str
+        ``"constant"``, ``"planck"`` or ``"rosseland"``.
+    bound : str
+        ``"error"`` raises if a group boundary is outside of ``energies``,
+        ``"continue"`` extends the spectra with constant values.
 
-    trad :
+    Returns
+    -------
+    numpy.ndarray
+        Group averaged opacities, shape (ngroups,) or (npts, ngroups).
+    """
+    energies = np.asarray(energies, dtype=float)
+    opacs = np.asarray(opacs, dtype=float)
+    ebnds = np.asarray(ebnds, dtype=float)
 
-    ebnds :
+    if bound == "error":
+        bad = (ebnds < energies[0]) | (ebnds > energies[-1])
+        if np.any(bad):
+            raise ValueError('Energy outside'
+                             'of range {0} {1}'.format(ebnds[bad][0],
+                                                       energies[0]))
+    elif bound != "continue":
+        raise ValueError("Illegal boundary treatment")
 
-    weight='constant' :
+    edges, starts = _group_subintervals(energies, ebnds)
+    widths = np.diff(edges)
 
-    bound='error' :
+    if weight == "constant":
+        # The trapezoidal rule is exact for a linear integrand.
+        vals = _interp_spectrum(energies, opacs, edges)
+        sub = 0.5*widths*(vals[..., 1:] + vals[..., :-1])
+        return np.add.reduceat(sub, starts, axis=-1)/np.diff(ebnds)
+
+    if weight not in ["planck", "rosseland"]:
+        raise ValueError("Illegal weight {0}".format(weight))
+    if trad is None:
+        raise ValueError("trad is required for the {0} weight".format(weight))
+    trad = np.asarray(trad, dtype=float)[..., np.newaxis]
+
+    # Groups in the Wien tail use the upper tail integrals, scaled by the
+    # lower group boundary x0, so that the weights neither cancel out nor
+    # underflow.
+    nsub = len(widths)
+    sub_group = np.repeat(np.arange(len(starts)),
+                          np.diff(np.append(starts, nsub)))
+    x0 = ebnds[sub_group]/trad
+    tail = x0 > _PLANCK_SERIES_X
+    xa = edges[:-1]/trad
+    xb = edges[1:]/trad
+    dw3 = _weight_int(xb, x0, 3, weight, tail) \
+          - _weight_int(xa, x0, 3, weight, tail)
+    k_edges = _interp_spectrum(energies, opacs, edges)
+
+    if weight == "planck":
+        # On each sub-interval [a, b], the opacity is linear,
+        # k = k(a) + s(E-a), so that with x = E/T
+        #   int_a^b k w dE ~ k(a) (W3(xb)-W3(xa)) + s T (W4(xb)-W4(xa)
+        #                                                - xa (W3(xb)-W3(xa)))
+        # where W3 and W4 are the integrals of the weight and of x times
+        # the weight, which come from the planck_int kernels.
+        dw4 = _weight_int(xb, x0, 4, weight, tail) \
+              - _weight_int(xa, x0, 4, weight, tail)
+        slope = np.diff(k_edges, axis=-1)/widths
+        num = k_edges[..., :-1]*dw3 + slope*trad*(dw4 - xa*dw3)
+        return np.add.reduceat(num, starts, axis=-1) \
+               / np.add.reduceat(dw3, starts, axis=-1)
+
+    # With k(x) = ka (kb/ka)^t, i.e. x(t) = xa + (xb-xa) phi(t) where
+    # phi(t) = expm1(q t)/expm1(q) and q = ln(kb/ka),
+    #   int_xa^xb w(x)/k(x) dx = (xb-xa)/ka q/expm1(q) int_0^1 w(x(t)) dt
+    # whose integrand is as smooth as the weight. The integral diverges
+    # where the opacity reaches zero, and these groups are set to zero.
+    ka = k_edges[..., :-1]
+    kb = k_edges[..., 1:]
+    nonpos = (ka <= 0) | (kb <= 0)
+    ka = np.where(nonpos, 1.0, ka)
+    q = np.log(np.where(nonpos, 1.0, kb)/ka)
+    flat = np.abs(q) < 1e-8
+    q = np.where(flat, 1.0, q)
+    em1 = np.expm1(q)
+    scale = np.where(tail, x0, 0.0)
+    nodes, weights = np.polynomial.legendre.leggauss(_ROSSELAND_NODES)
+    num = 0.0
+    for t, wt in zip(0.5*(nodes + 1), 0.5*weights):
+        phi = np.where(flat, t, np.expm1(q*t)/em1)
+        num = num + wt*_weight_rosseland(xa + (xb - xa)*phi, 1.0, scale)
+    num *= (xb - xa)/ka*np.where(flat, 1.0, q/em1)
+    zero = np.add.reduceat(nonpos, starts, axis=-1) > 0
+    num = np.add.reduceat(num, starts, axis=-1)
+    return np.where(zero, 0.0, np.add.reduceat(dw3, starts, axis=-1)
+                    / np.where(zero, 1.0, num))
+
+def group_average_quad(energies, opacs, ebnds, trad=None,
+                       weight="constant", epsrel=1e-10):
+    """
+    Reference implementation of :func:`group_average` for a single
+    spectrum, with adaptive quadrature (``scipy.integrate.quad``) on every
+    group. The opacity is interpolated linearly between the nodes of the
+    spectrum for all the weights, the Planck and Rosseland weights being
+    the Planck function and its temperature derivative. Slow, only meant
+    to check the accuracy of ``group_average``.
 
+    Returns
+    -------
+    opavg : numpy.ndarray
+        Group averaged opacities.
+    relerr : numpy.ndarray
+        Relative difference of ``group_average`` to ``opavg``.
     """
-    try:
-        from scipy.integrate import quad
-    except ImportError:
-        print('Error: Scipy not installed, cannot caclulate opacity integrals!')
-        raise
-    except:
-        raise
-    # Check for errors:
+    from scipy.integrate import quad
 
-    # Make sure that none of the energy group boundaries is outside of
-    # the energy range for this opacity:
-    energies = energies_in.copy()
-    opacs = opacs_in.copy()
+    energies = np.asarray(energies, dtype=float)
+    opacs = np.asarray(opacs, dtype=float)
+    op = lambda en: _interp_spectrum(energies, opacs, en)
 
-    if bound == "error":
-        for en in ebnds:
-            if en < energies[0] or en > energies[-1]:
-                raise ValueError('Energy outside'
-                                 'of range {0} {1}'.format(en, energies[0]))
-    elif bound == "continue":
-        emin = np.min(ebnds)
-        emax = np.max(ebnds)
-
-        energies = np.empty(len(energies)+2)
-        energies[0] = emin
-        energies[1:-1] = energies_in[:]
-        energies[-1] = emax
-
-        opacs = np.empty(len(opacs)+2)
-        opacs[0] = opacs_in[0]
-        opacs[1:-1] = opacs_in[:]
-        opacs[-1] = opacs_in[-1]
+    opavg = np.empty(len(ebnds)-1)
+    for i in range(len(opavg)):
+        a, b = ebnds[i], ebnds[i+1]
+        if weight == "constant":
+            wfunc = lambda en: 1.0
+        elif weight == "planck":
+            wfunc = lambda en: _weight_planck(en, trad, a/trad)
+        elif weight == "rosseland":
+            wfunc = lambda en: _weight_rosseland(en, trad, a/trad)
+        else:
+            raise ValueError("Illegal weight {0}".format(weight))
+        points = energies[(energies > a) & (energies < b)]
+        limit = max(50, 4*len(points))
+        den = quad(wfunc, a, b, epsrel=epsrel, limit=limit)[0]
+        if weight == "rosseland" and np.any(
+                op(np.concatenate([[a], points, [b]])) <= 0):
+            # The integral of 1/k diverges.
+            opavg[i] = 0.0
+        elif weight == "rosseland":
+            num = quad(lambda en: wfunc(en)/op(en), a, b, points=points,
+                       epsrel=epsrel, limit=limit)[0]
+            opavg[i] = den/num
+        else:
+            num = quad(lambda en: wfunc(en)*op(en), a, b, points=points,
+                       epsrel=epsrel, limit=limit)[0]
+            opavg[i] = num/den
 
-    else:
-        raise ValueError("Illegal boundary treatment")
+    avg = group_average(energies, opacs, ebnds, trad=trad, weight=weight,
+                        bound="continue")
+    relerr = np.where(opavg == 0, avg, avg/np.where(opavg == 0, 1.0, opavg)
+                      - 1.0)
+    return opavg, relerr
+
+def avgopac(energies_in, opacs_in, trad, ebnds,
+            weight="constant", bound="error"):
+    """
+    Average an opacity spectrum over energy groups.
+
+    This is the single spectrum version of :func:`group_average`.
+
+    Parameters
+    ----------
+    energies_in : numpy.ndarray
+        Photon energies of the spectrum.
+    opacs_in : numpy.ndarray
+        Opacities at ``energies_in``.
+    trad : float
+        Radiation temperature.
+    ebnds : numpy.ndarray
+        Group boundaries.
+    weight : str
+        ``"constant"``, ``"planck"`` or ``"rosseland"``.
+    bound : str
+        ``"error"`` or ``"continue"``.
+    """
+    return group_average(energies_in, opacs_in, ebnds, trad=trad,
+                         weight=weight, bound=bound)
 
-    def op(en):
+def ensure_monotonicity(dens, temp, table_in, axis='dens', report=False):
+    """
+    Make a table increasing along the density or temperature axis.
 
-        idx = energies.searchsorted(en)
-        # The energy is between index idx and idx-1
+    Every value lower than the previous one along ``axis`` is replaced by
+    the previous (repaired) value plus 1e-9. The first line along the other
+    axis is left unchanged.
 
-        de = energies[idx] - energies[idx-1]
-        do = opacs[idx] - opacs[idx-1]
+    The lines that need a repair are found at once with a cumulative
+    maximum (``np.fmax.accumulate``), and the repair is then swept along
+    ``axis`` for all of them together, so that the result is the same as
+    repairing one cell after the other.
 
-        ans = (en-energies[idx-1]) * do/de + opacs[idx-1]
-        return ans
+    Parameters
+    ----------
+    dens : numpy.ndarray
+        Density array.
+    temp : numpy.ndarray
+        Temperature array.
+    table_in : numpy.ndarray
+        Table of shape (dens.size, temp.size). It is not modified.
+    axis : str
+        ``'dens'`` or ``'temp'``.
+    report : bool
+        Also return a report of the repaired cells.
 
-    def weight_constant(en):
-        return 1.0
+    Returns
+    -------
+    table : numpy.ndarray
+        Monotonic table.
+    report : dict
+        Only if ``report`` is True. ``'count'`` is the number of repaired
+        cells, ``'index'`` their (dens, temp) indexes, and ``'dens'``,
+        ``'temp'``, ``'old'`` and ``'new'`` their coordinates and values.
+    """
+    if axis not in ['dens', 'temp']:
+        raise ValueError("axis must be 'dens' or 'temp'")
+    table = np.array(table_in, dtype=float)
+    # Work with the repaired axis first.
+    tab = table if axis == 'dens' else table.T
+    # The first line is not repaired.
+    tab = tab[:, 1:]
+
+    eps = 1e-9
+    with np.errstate(invalid='ignore'):
+        lines = np.nonzero(np.any(
+            tab[1:] < np.fmax.accumulate(tab, axis=0)[:-1], axis=0))[0]
+    modified = np.zeros(tab.shape, dtype=bool)
+    if len(lines):
+        sub = tab[:, lines]
+        first = np.argmax(sub[1:] < np.fmax.accumulate(sub, axis=0)[:-1],
+                          axis=0).min() + 1
+        for x_idx in range(first, len(sub)):
+            bad = sub[x_idx] < sub[x_idx-1]
+            sub[x_idx, bad] = sub[x_idx-1, bad] + eps
+            modified[x_idx, lines[bad]] = True
+        tab[:, lines] = sub
+
+    if not report:
+        return table
+    idx = np.nonzero(modified)
+    idx = (idx[0], idx[1] + 1)
+    if axis == 'temp':
+        idx = idx[::-1]
+    order = np.lexsort(idx[::-1])
+    idx = (idx[0][order], idx[1][order])
+    return table, {'count': len(idx[0]),
+                   'index': idx,
+                   'dens': np.asarray(dens)[idx[0]],
+                   'temp': np.asarray(temp)[idx[1]],
+                   'old': np.asarray(table_in)[idx],
+                   'new': table[idx]}
+
+_EOS_DICT_KINDS = {'P': 'pres', 'U': 'eint', 'F': 'free'}
+
+def _eos_check_tables(eos, species=None, log=None):
+    # Find the EoS tables, as {species: (dens, temp, {kind: table})}, in
+    # either the SESAME layout (ele_dens, ele_temps, ele_pres, ...) or the
+    # EoS dictionary layout (dens, temp, Pec_DT, Uec_DT, ...).
+    log = [] if log is None else log
+    def get(key):
+        return 10**np.asarray(eos[key]) if key in log else eos[key]
+
+    found = {}
+    for key in eos.keys():
+        key = str(key)
+        if key.endswith('_dens') and key[:-5] + '_temps' in eos:
+            spec = key[:-5]
+            tabs = dict((kind, get(spec + '_' + kind))
+                        for kind in ['pres', 'eint', 'free']
+                        if spec + '_' + kind in eos)
+            if tabs:
+                found[spec] = (get(key), get(spec + '_temps'), tabs)
+        m = re.match(r'^([PUF])(\w+)_DT$', key)
+        if m and 'dens' in eos and 'temp' in eos:
+            spec = m.group(2)
+            if spec not in found:
+                found[spec] = (get('dens'), get('temp'), {})
+            found[spec][2][_EOS_DICT_KINDS[m.group(1)]] = get(key)
+    if species is not None:
+        missing = [spec for spec in species if spec not in found]
+        if missing:
+            raise KeyError('No EoS tables for species {0}'.format(missing))
+        found = dict((spec, found[spec]) for spec in species)
+    return found
+
+@profiling.timed('check_eos_consistency')
+def check_eos_consistency(eos, species=None, atol=0.0, rtol=0.0,
+                          thermo_rtol=0.05, log=None):
+    """
+    Check the consistency of the EoS tables.
 
-    def weight_planck(en):
-        x = en/trad
-        if x > 700.0: return 1.0
-        return en**3/(1-exp(-x)) * exp(-x)
+    The following checks are done for every species:
 
-    # def weight_rosseland(en):
+        ``positive``: pressure and internal energy are positive.
 
+        ``dP/drho``: pressure increases with density.
 
+        ``dE/dT``: internal energy increases with temperature.
 
-    # Choose the weight function:
-    f = lambda en: weight(en)*op(en)
-    if weight == "constant":
-        weight = weight_constant
-    elif weight == "planck":
-        weight = weight_planck
-    elif weight == "rosseland":
-        weight = weight_rossland
-        f = lambda en: weight(en)/op(en)
+        ``P(F)`` and ``E(F)``: when the Helmholtz free energy F is present,
+        the pressure and internal energy agree with
+        P = rho^2 dF/drho and E = F - T dF/dT, with derivatives from
+        finite differences.
 
-    opavg = np.empty(len(ebnds)-1)
+    All the checks are array operations on whole tables, and nothing is
+    printed, so that the check can run on every conversion.
 
-    for i in range(len(opavg)):
-        numerator = quad(f, ebnds[i], ebnds[i+1], limit=500, epsrel=0.001)
-        denominator = quad(weight, ebnds[i],
-                           ebnds[i+1], limit=500,
-                           epsrel=1.0e-06)
-        opavg[i] = numerator[0]/denominator[0]
-
-    return opavg
-
-def ensure_monotonicity(dens, temp, table_in, axis='dens'):
-    table = copy.deepcopy(table_in)
-    if axis == "dens":
-        X = dens
-        Y = temp
-    elif axis== "temp":
-        X = temp
-        Y = dens
-        table = table.T
-    print("Assuring monotonicity", end='')
-    for y_idx in range(1,len(Y)):
-
-        for x_idx in range(1,len(X)):
-            df = table[x_idx, y_idx] - table[x_idx-1, y_idx]
-            if df<0.0:
-                print('.', end='')
-                table[x_idx, y_idx] = table[x_idx-1, y_idx] + 1e-9
-    print('')
-    if axis == "temp":
-        table = table.T
+    Parameters
+    ----------
+    eos : dict
+        EoS data, either in the SESAME layout (e.g. ``ele_dens``,
+        ``ele_temps``, ``ele_pres``, ``ele_eint``, ``ele_free``), as in
+        ``OpgSesame.data``, or as a common EoS dictionary (``dens``,
+        ``temp``, ``Pec_DT``, ``Ui_DT``, ... with ``F*_DT`` for the free
+        energy).
+    species : list
+        Species to check (e.g. ``['ele', 'ioncc']`` or ``['ec', 'i']``).
+        Default: all the species found.
+    atol : float
+        Absolute tolerance, as a fraction of the largest magnitude in each
+        table.
+    rtol : float
+        Relative tolerance of the positivity and derivative checks.
+    thermo_rtol : float
+        Relative tolerance of the free energy checks, which include the
+        finite difference errors.
+    log : list
+        Keys holding log10 of the data.
 
-    return table
+    Returns
+    -------
+    dict
+        ``'checks'``, a list with, for each check, a dict with the
+        ``'species'``, ``'check'`` and ``'key'`` names, the violation
+        ``'mask'`` (on the cells for ``positive``, ``P(F)`` and ``E(F)``,
+        and on the intervals between cells for derivatives), the
+        ``'count'`` and ``'size'`` of violations and points, and
+        ``'passed'``. ``'num_tests'`` and ``'fail'`` count the checks and
+        the failed ones.
+    """
+    checks = []
+    def add(spec, check, key, mask):
+        count = int(np.count_nonzero(mask))
+        checks.append({'species': spec, 'check': check, 'key': key,
+                       'mask': mask, 'count': count, 'size': mask.size,
+                       'passed': count == 0})
+
+    def thresh(tab, ref):
+        return rtol*np.abs(ref) + atol*np.nanmax(np.abs(tab))
+
+    tables = _eos_check_tables(eos, species=species, log=log)
+    for spec in sorted(tables):
+        dens, temp, tabs = tables[spec]
+        dens = np.asarray(dens, dtype=float)
+        temp = np.asarray(temp, dtype=float)
+        for kind in ['pres', 'eint']:
+            if kind in tabs:
+                tab = np.asarray(tabs[kind], dtype=float)
+                add(spec, 'positive', kind, tab < -thresh(tab, tab))
+        if 'pres' in tabs:
+            tab = np.asarray(tabs['pres'], dtype=float)
+            add(spec, 'dP/drho', 'pres',
+                np.diff(tab, axis=0) < -thresh(tab, tab[:-1]))
+        if 'eint' in tabs:
+            tab = np.asarray(tabs['eint'], dtype=float)
+            add(spec, 'dE/dT', 'eint',
+                np.diff(tab, axis=1) < -thresh(tab, tab[:, :-1]))
+        if 'free' in tabs and len(dens) > 1 and len(temp) > 1:
+            free = np.asarray(tabs['free'], dtype=float)
+            if 'pres' in tabs:
+                pres = np.asarray(tabs['pres'], dtype=float)
+                p_f = dens[:, np.newaxis]**2*np.gradient(free, dens, axis=0)
+                add(spec, 'P(F)', 'pres',
+                    np.abs(pres - p_f) > thermo_rtol*np.abs(pres)
+                                         + atol*np.nanmax(np.abs(pres)))
+            if 'eint' in tabs:
+                eint = np.asarray(tabs['eint'], dtype=float)
+                e_f = free - temp*np.gradient(free, temp, axis=1)
+                add(spec, 'E(F)', 'eint',
+                    np.abs(eint - e_f) > thermo_rtol*np.abs(eint)
+                                         + atol*np.nanmax(np.abs(eint)))
+
+    return {'checks': checks,
+            'num_tests': len(checks),
+            'fail': sum(not c['passed'] for c in checks)}
+
+def format_eos_report(report, verbose=False):
+    """
+    Summary of a report of `check_eos_consistency`, one line per failed
+    check (or per check, if ``verbose``).
+    """
+    lines = []
+    for c in report['checks']:
+        if verbose or not c['passed']:
+            lines.append('{0} {1}_{2} {3}: {4}/{5} violations'.format(
+                'PASS' if c['passed'] else 'FAIL', c['species'], c['key'],
+                c['check'], c['count'], c['size']))
+    if not report['fail']:
+        lines.append('Sucess: passed {0}/{0} tests !'.format(
+            report['num_tests']))
+    else:
+        lines.append('Failure: {0}/{1} tests failed!'.format(
+            report['fail'], report['num_tests']))
+    return '\n'.join(lines)
 
 class CheckEosConsistency:
-    def __init__(self, eos):
-        self.fail = 0
-        self.num_tests = 0
+    """
+    Check the ``ele`` and ``ioncc`` tables of SESAME data and print the
+    results. See `check_eos_consistency` for the checks and the keyword
+    arguments; the report is available as ``report``.
+    """
+    def __init__(self, eos, species=['ele', 'ioncc'], **kwargs):
         self.eos = eos
-        self.check_pos()
-        self.check_sound_speed()
-        self.check_heat_capacity()
-        if not self.fail:
-            print('Sucess: passed {0}/{0} tests !'.format(self.num_tests))
-        else:
-            print('Failure: {0}/{1} tests failed!'.format(self.fail, self.num_tests))
-
-    def check_pos(self):
-        res = True
-        for spec in ['ele', 'ioncc']:
-            for tab_name in ['pres', 'eint']:
-                tab = self.eos['_'.join([spec, tab_name])]
-                self.num_tests += 1
-                if np.any(tab < 0):
-                    print("{0}_{1} table has negative values".format(spec, tab_name))
-                    bad_idx = np.nonzero(tab<0)
-                    print('        dens             temp           {0}_{1}'.format(spec, tab_name))
-                    print(np.array([self.eos[spec+'_dens'][bad_idx[0]],
-                                   self.eos[spec+'_temps'][bad_idx[1]],
-                                   self.eos['_'.join([spec, tab_name])][bad_idx]]).T)
-                    self.fail +=1
-        return res
-
-    def check_sound_speed(self):
-        self._check_deriv('ioncc_pres', "dens")
-        self._check_deriv('ele_pres', "dens")
-    def check_heat_capacity(self):
-        self._check_deriv('ioncc_eint', "temp")
-        self._check_deriv('ele_eint', "temp")
-    def _check_deriv(self, tab_name, axis):
-        tab = self.eos[tab_name]
-        ax_idx = {'dens': 0, 'temp': 1}[axis]
-        diff = np.diff(tab, axis=ax_idx)
-        self.num_tests += 1
-        if np.any(diff<0):
-            print('d{{{0}}}/d{{{1}}} has negative values'.format(tab_name, axis))
-            self.fail +=1
+        self.report = check_eos_consistency(eos, species=species, **kwargs)
+        self.fail = self.report['fail']
+        self.num_tests = self.report['num_tests']
+        print(format_eos_report(self.report))
 
 def eint_offset(table):
     if np.any(table<0):
@@ -1036,26 +2169,304 @@ def eint_offset(table):
         table = table + np.abs(table.min()) + 1e-9
     return table
 
-def interp_isochores_1d(eos, table='ele', ref_grid='ioncc'):
-    #from scipy.interpolate import interp1d
-    eosi = copy.deepcopy(eos)
-    temp_mask = np.array([temp_el not in eos[table+'_temps']\
-                        for temp_el in eos[ref_grid+'_temps']], dtype='bool')
+def interp_isochores_1d(eos, table='ele', ref_grid='ioncc', log=False,
+                        keys=None):
+    """
+    Interpolate the tables of a species onto the temperature grid of
+    another species, along every isochore.
 
-    eos[table+'_temps'] = eos[ref_grid+'_temps']
-    eos[table+'_pres'] = np.zeros((len(eos[table+'_dens']), len(eos[table+'_temps'])))
+    The interpolation indexes and weights are computed once for the
+    reference temperatures and applied to all the density rows of all the
+    tables at once. Temperatures of the reference grid that are already in
+    the grid of ``table`` are copied exactly, and outside of that grid the
+    values at the bounds are used, as with ``np.interp``. ``eos`` is
+    updated in place, without copying the other tables.
 
-    eos[table+'_eint'] = np.zeros(eos[table+'_pres'].shape)
+    Parameters
+    ----------
+    eos : dict
+        EoS data in the SESAME layout (e.g. ``OpgSesame.data[matid]``).
+    table : str
+        Species to interpolate.
+    ref_grid : str
+        Species with the reference temperature grid.
+    log : bool
+        Interpolate log(value) against log(temperature). Cells with
+        non-positive values or temperatures are interpolated linearly.
+    keys : list
+        Tables to interpolate, by default those of ``pres``, ``eint`` and
+        ``free`` that are present.
 
-    for dens_idx  in range(len(eos[table+'_dens'])):
-        for par in ['pres', 'eint']:
-            # copy values that are on the same grid
-            eos[table+'_'+par][dens_idx, ~temp_mask] =  eosi[table+'_'+par][dens_idx, :]
+    Returns
+    -------
+    dict
+        ``eos``.
+    """
+    if keys is None:
+        keys = [k for k in ['pres', 'eint', 'free'] if table+'_'+k in eos]
+    temps = np.asarray(eos[table+'_temps'], dtype=float)
+    new_temps = np.asarray(eos[ref_grid+'_temps'], dtype=float)
+
+    idx = np.clip(np.searchsorted(temps, new_temps, side='right') - 1,
+                  0, len(temps) - 2)
+    t0, t1 = temps[idx], temps[idx+1]
+    w = np.clip((new_temps - t0)/(t1 - t0), 0.0, 1.0)
+    if log:
+        with np.errstate(divide='ignore', invalid='ignore'):
+            wlog = np.clip(np.log(new_temps/t0)/np.log(t1/t0), 0.0, 1.0)
+
+    for par in keys:
+        tab = np.asarray(eos[table+'_'+par], dtype=float)
+        v0, v1 = tab[:, idx], tab[:, idx+1]
+        res = v0 + w*(v1 - v0)
+        if log:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                res_log = v0*(v1/v0)**wlog
+            res = np.where((v0 > 0) & (v1 > 0) & np.isfinite(wlog),
+                           res_log, res)
+        # Exact copies where the temperatures match.
+        res = np.where(w == 0.0, v0, np.where(w == 1.0, v1, res))
+        eos[table+'_'+par] = res
 
-            # interpolate the couple of values that are not there
-            #itp = interp1d(eosi[table+'_temps'], eosi[table+'_'+par][dens_idx])
-            #eos[table+'_'+par][dens_idx, temp_mask] =  itp(eos[table+'_temps'][temp_mask])
-            eos[table+'_'+par][dens_idx, temp_mask] =  np.interp(eos[table+'_temps'][temp_mask],
-                                                        eosi[table+'_temps'],
-                                                        eosi[table+'_'+par][dens_idx])
+    eos[table+'_temps'] = eos[ref_grid+'_temps']
+    if table+'_ntemp' in eos:
+        eos[table+'_ntemp'] = len(new_temps)
     return eos
+
+def iter_eos_blocks(eos, keys=None):
+    """
+    Iterate over the tables of a common EoS dictionary one block at a time.
+
+    2D tables are yielded whole, 3D tables (e.g. multigroup opacities) one
+    (dens, temp) plane per group. Tables of an ``OpgHdf5`` file are read
+    from disk block by block, so that only a single group plane is in
+    memory at once.
+
+    Only HDF5 inputs are streamed from disk: the SESAME, QEOS, MULTI and
+    TOPS readers parse the whole file into memory (``toEosDict``) before
+    the first block is yielded, so that their peak memory grows with the
+    full tables. SESAME and QEOS tables have no groups, and TOPS files store
+    all the groups of a (dens, temp) point together, so that a group plane
+    cannot be read without parsing the whole file. Convert them to HDF5
+    once to stream them afterwards.
+
+    Parameters
+    ----------
+    eos : dict
+        Common EoS dictionary, or ``OpgHdf5``.
+    keys : list
+        Tables to iterate over, in that order. By default all the 2D and 3D
+        tables, sorted by name. Missing keys are skipped.
+
+    Yields
+    ------
+    tuple
+        ``(key, group, block)``, ``group`` being ``None`` for 2D tables.
+
+    Examples
+    --------
+    ::
+
+       >>> op = opp.OpgHdf5.open_file('He.h5')
+       >>> for key, group, block in iter_eos_blocks(op, ['Zf_DT', 'opp_mg']):
+       ...     print(key, group, block.shape)
+       Zf_DT None (100, 80)
+       opp_mg 0 (100, 80)
+       ...
+    """
+    if keys is None:
+        keys = sorted(key for key in eos
+                      if np.ndim(eos[key]) in [2, 3])
+    for key in keys:
+        if key not in eos or eos[key] is None:
+            continue
+        tab = eos[key]
+        ndim = np.ndim(tab)
+        if ndim == 2:
+            yield key, None, np.asarray(tab[:, :])
+        elif ndim == 3:
+            for g in range(tab.shape[2]):
+                yield key, g, np.asarray(tab[:, :, g])
+        else:
+            raise ValueError('Table {0} is not a 2D or 3D table!'.format(key))
+
+def treat_invalid_values(out, bad, values, label, invalid='fail', floor=0.0,
+                         nonpos=None, max_value=None, group=None, jd=None,
+                         fmt='IONMIX', hint=''):
+    """
+    Applies an invalid value policy to a block of a table, in place.
+
+    Parameters
+    ----------
+    out : numpy.ndarray
+        Block after its transformation (unit conversion, logarithm).
+    bad : numpy.ndarray
+        Mask of the invalid values of ``out``.
+    values : numpy.ndarray
+        Block before its transformation, for the error messages.
+    label : str
+        Name of the table, for the error messages.
+    invalid : str
+        ``'fail'`` raises a ``ValueError`` giving the group and grid
+        indexes of the first invalid value, ``'clip'`` clips them to
+        ``max_value`` in magnitude (NaN and the non-positive values
+        ``nonpos`` of logarithmic tables being set to ``floor``) and
+        ``'floor'`` sets them all to ``floor``.
+    floor : float
+        Replacement value.
+    nonpos : numpy.ndarray
+        Mask of the non-positive values of a logarithmic table.
+    max_value : float
+        Largest magnitude that can be written, by default the largest
+        float.
+    group : int
+        Group of the block.
+    jd : int
+        Density index of the first row of the block, None for a 1D grid.
+    fmt : str
+        Output format, for the error messages.
+    hint : str
+        Start of the advice of the error messages.
+
+    Returns
+    -------
+    numpy.ndarray
+        ``out``.
+    """
+    if not bad.any():
+        return out
+    if invalid == 'fail':
+        i = np.argmax(bad)
+        if jd is None:
+            where = 'index {0}'.format(i)
+        else:
+            row, col = np.unravel_index(i, np.shape(values))
+            where = 'density index {0}, temperature index {1}'.format(
+                        jd + row, col)
+        if group is not None:
+            where = 'group {0}, {1}'.format(group, where)
+        raise ValueError('Invalid value {0} in the {1} block to {2} ({3}). '
+                         '{4}another invalid value policy.'
+                         .format(np.asarray(values).flat[i], label, fmt,
+                                 where, hint or 'Use '))
+    elif invalid == 'clip':
+        if max_value is None:
+            max_value = np.finfo(out.dtype).max
+        np.clip(out, -max_value, max_value, out=out)
+        out[np.isnan(out)] = floor
+        if nonpos is not None:
+            out[nonpos] = floor
+    elif invalid == 'floor':
+        out[bad] = floor
+    else:
+        raise ValueError('invalid must be one of fail, clip, floor!')
+    return out
+
+# Coefficients of More's fit to the Thomas-Fermi ionization.
+# R. M. More, Adv. At. Mol. Phys. 21, 305 (1985), see also D. Salzmann,
+# Atomic Physics in Hot Plasmas, p. 273.
+_TF_ALPHA, _TF_BETA = 14.3139, 0.6624
+_TF_A = (0.003323, 0.9718, 9.26148e-5, 3.10165)
+_TF_B = (-1.7630, 1.43175, 0.31546)
+_TF_C = (-0.366667, 0.983333)
+
+def thomas_fermi_ionization(dens, temp, Znum, Abar):
+    """
+    Average ionization from More's fit to the Thomas-Fermi model.
+
+    The arguments are broadcast together, so that a grid can be computed
+    from 1D axes without building meshgrids, e.g. with
+    ``thomas_fermi_ionization(dens[:, None], temp[None, :], Z, A)``.
+
+    Parameters
+    ----------
+    dens : numpy.ndarray
+        Density (g/cm^3).
+    temp : numpy.ndarray
+        Temperature (eV).
+    Znum : float
+        Atomic number.
+    Abar : float
+        Atomic mass.
+
+    Returns
+    -------
+    numpy.ndarray
+        Average ionization, NaN where the density is null.
+    """
+    dens = np.asarray(dens, dtype=float)
+    temp = np.asarray(temp, dtype=float)
+    a1, a2, a3, a4 = _TF_A
+    b0, b1, b2 = _TF_B
+    c1, c2 = _TF_C
+
+    # Temperature dependent terms.
+    T0 = temp/Znum**(4./3)
+    Tf = T0/(1. + T0)
+    A = a1*T0**a2 + a3*T0**a4
+    B = -np.exp(b0 + b1*Tf + b2*Tf**7)
+    C = c1*Tf + c2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        R = dens/(Znum*Abar)
+        Q1 = A*R**B
+        Q = (R**C + Q1**C)**(1./C)
+        x = _TF_ALPHA*Q**_TF_BETA
+        zbar = Znum*x/(1. + x + np.sqrt(1. + 2.*x))
+        return np.where(dens > 0, zbar, np.nan)
+
+# Ionization grids computed by thomas_fermi_ionization_grid.
+_tf_cache = {}
+_tf_cache_keys = []
+_TF_CACHE_SIZE = 8
+
+@profiling.timed('thomas_fermi_ionization_grid')
+def thomas_fermi_ionization_grid(dens, temp, Znum, Abar, cache=True):
+    """
+    Thomas-Fermi average ionization on the grid of the 1D ``dens`` and
+    ``temp`` axes.
+
+    The grids are cached per ``(dens, temp, Znum, Abar)``, so that
+    converting a table several times only computes them once.
+
+    Parameters
+    ----------
+    dens : numpy.ndarray
+        1D density axis (g/cm^3).
+    temp : numpy.ndarray
+        1D temperature axis (eV).
+    Znum : float
+        Atomic number (average for mixtures).
+    Abar : float
+        Atomic mass.
+    cache : bool
+        Use the cache.
+
+    Returns
+    -------
+    numpy.ndarray
+        Average ionization of shape ``(len(dens), len(temp))``.
+
+    See Also
+    --------
+    thomas_fermi_ionization
+    """
+    dens = np.asarray(dens, dtype=float).ravel()
+    temp = np.asarray(temp, dtype=float).ravel()
+    if not cache:
+        return thomas_fermi_ionization(dens[:, None], temp[None, :],
+                                       Znum, Abar)
+
+    key = (dens.tobytes(), temp.tobytes(), float(Znum), float(Abar))
+    if key in _tf_cache:
+        # Most recently used last.
+        _tf_cache_keys.remove(key)
+        _tf_cache_keys.append(key)
+    else:
+        _tf_cache[key] = thomas_fermi_ionization(dens[:, None],
+                                                 temp[None, :], Znum, Abar)
+        _tf_cache_keys.append(key)
+        while len(_tf_cache_keys) > _TF_CACHE_SIZE:
+            del _tf_cache[_tf_cache_keys.pop(0)]
+    # The tables returned by toEosDict may be modified in place.
+    return _tf_cache[key].copy()
@@ -28,6 +28,7 @@ if __name__ == "__main__":
                                         'opac-error = opacplot2.scripts.opac_error:check_error',
                                         'sesame-extract = opacplot2.scripts.sesame_extract:extract_tables',
                                         'tops_html2txt = opacplot2.scripts.tops_html2txt:tops_html2txt',
+                                        'opac-bench = opacplot2.benchmarks.suite:main',
                                         ],
                         }
           )